@@ -8,6 +8,11 @@ The MaskedLocalObsWrapper adds a "look" action that temporarily unmasks
 a 4x-area (2x-linear) field of view for the next observation, at the
 cost of a configurable time penalty (the agent's next turn is delayed).
 
+Both wrappers follow the env's observation_mode: with 'types' they crop the
+type-index grid, and the masked wrapper marks masked cells with the sentinel
+type index num_types (one past the last real type), which one-hot encodes to
+the same layout as the float mask channel.
+
 Usage:
     env = LocalObsWrapper(env, window_size=11, player_type='player')
     env = MaskedLocalObsWrapper(env, window_size=11, look_penalty_dt=0.3)
@@ -17,6 +22,8 @@ import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 
+from sokoscript.env import _board_to_observation, _board_to_types, _type_obs_dtype
+
 
 class LocalObsWrapper(gym.ObservationWrapper):
     """Crop observation to a local window around the player.
@@ -38,21 +45,29 @@ class LocalObsWrapper(gym.ObservationWrapper):
         self.player_idx = next(i for i, n in enumerate(type_names) if n == player_type)
         self.num_types = len(type_names)
         self.board_size = env.board_size
+        self.observation_mode = getattr(env.unwrapped, 'observation_mode', 'onehot')
 
         # Override observation space
-        self.observation_space = spaces.Box(
-            low=0, high=1,
-            shape=(window_size, window_size, self.num_types),
-            dtype=np.float32,
-        )
+        if self.observation_mode == 'types':
+            self.observation_space = spaces.Box(
+                low=0, high=self.num_types - 1,
+                shape=(window_size, window_size),
+                dtype=_type_obs_dtype(self.num_types),
+            )
+        else:
+            self.observation_space = spaces.Box(
+                low=0, high=1,
+                shape=(window_size, window_size, self.num_types),
+                dtype=np.float32,
+            )
 
     def observation(self, obs):
         """Crop obs to window centered on player, with toroidal wrapping."""
         # Find player position
-        ys, xs = np.where(obs[:, :, self.player_idx] > 0.5)
+        ys, xs = np.where(_player_plane(obs, self.player_idx))
         if len(ys) == 0:
             # Player dead — return zeros
-            return np.zeros(self.observation_space.shape, dtype=np.float32)
+            return np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
 
         py, px = ys[0], xs[0]
 
@@ -64,9 +79,16 @@ class LocalObsWrapper(gym.ObservationWrapper):
         return obs[np.ix_(rows, cols)]
 
 
+def _player_plane(obs, player_idx):
+    """Boolean (H, W) mask of player cells in a one-hot or type-index observation."""
+    if obs.ndim == 2:
+        return obs == player_idx
+    return obs[:, :, player_idx] > 0.5
+
+
 def _find_player(obs, player_idx):
     """Find player (y, x) from full-board observation."""
-    ys, xs = np.where(obs[:, :, player_idx] > 0.5)
+    ys, xs = np.where(_player_plane(obs, player_idx))
     if len(ys) == 0:
         return None
     return ys[0], xs[0]
@@ -123,12 +145,21 @@ class MaskedLocalObsWrapper(gym.Wrapper):
         self.look_penalty_dt = look_penalty_dt
         self.look_penalty_ticks = int(look_penalty_dt * (1 << 32))
 
-        # Observation: big_window x big_window x (num_types + 1 mask channel)
-        self.observation_space = spaces.Box(
-            low=0, high=1,
-            shape=(self.big_window, self.big_window, self.num_types + 1),
-            dtype=np.float32,
-        )
+        # Observation: big_window x big_window x (num_types + 1 mask channel),
+        # or big_window x big_window type indices with num_types marking masked cells
+        self.observation_mode = getattr(env.unwrapped, 'observation_mode', 'onehot')
+        if self.observation_mode == 'types':
+            self.observation_space = spaces.Box(
+                low=0, high=self.num_types,
+                shape=(self.big_window, self.big_window),
+                dtype=_type_obs_dtype(self.num_types),
+            )
+        else:
+            self.observation_space = spaces.Box(
+                low=0, high=1,
+                shape=(self.big_window, self.big_window, self.num_types + 1),
+                dtype=np.float32,
+            )
 
         # Action: original actions + 1 look action (last index)
         self.orig_n_actions = env.action_space.n
@@ -140,6 +171,8 @@ class MaskedLocalObsWrapper(gym.Wrapper):
 
     def _make_obs(self, full_obs, unmasked=False):
         """Build the masked/unmasked observation from full board obs."""
+        if self.observation_mode == 'types':
+            return self._make_type_obs(full_obs, unmasked)
         pos = _find_player(full_obs, self.player_idx)
         bw = self.big_window
         out = np.zeros((bw, bw, self.num_types + 1), dtype=np.float32)
@@ -174,6 +207,23 @@ class MaskedLocalObsWrapper(gym.Wrapper):
 
         return out
 
+    def _make_type_obs(self, full_obs, unmasked):
+        """Type-index version of _make_obs: masked cells hold num_types."""
+        pos = _find_player(full_obs, self.player_idx)
+        bw = self.big_window
+        out = np.full((bw, bw), self.num_types, dtype=self.observation_space.dtype)
+        if pos is None:
+            return out
+        big_patch = _extract_window(full_obs, pos[0], pos[1], self.big_half,
+                                    self.board_size)
+        if unmasked:
+            out[:] = big_patch
+        else:
+            margin = self.big_half - self.half
+            inner = (slice(margin, margin + self.window_size),) * 2
+            out[inner] = big_patch[inner]
+        return out
+
     def reset(self, **kwargs):
         obs, info = self.env.reset(**kwargs)
         self._unmasked_next = False
@@ -200,8 +250,10 @@ class MaskedLocalObsWrapper(gym.Wrapper):
             # Check if player still exists
             terminated = self.env.board.by_id.get(self.env.player_id) is None
 
-            from sokoscript.env import _board_to_observation
-            full_obs = _board_to_observation(board, self.num_types)
+            if self.observation_mode == 'types':
+                full_obs = _board_to_types(board, self.num_types)
+            else:
+                full_obs = _board_to_observation(board, self.num_types)
             self._last_full_obs = full_obs
 
             info = {
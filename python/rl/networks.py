@@ -20,16 +20,33 @@ if HAS_TORCH:
         def forward(self, x):
             return nn.functional.pad(x, [self.padding] * 4, mode='circular')
 
+    def _input_channels(observation_space):
+        """Channel count for one-hot (H, W, C) or type-index (H, W) observation spaces."""
+        if len(observation_space.shape) == 2:
+            return int(observation_space.high.max()) + 1
+        return observation_space.shape[2]
+
+    def _to_channels_first(observations, n_input):
+        """(B, H, W, C) one-hot or (B, H, W) type indices -> (B, C, H, W) float."""
+        if observations.dim() == 3:
+            one_hot = nn.functional.one_hot(observations.long(), n_input)
+            return one_hot.permute(0, 3, 1, 2).float()
+        return observations.permute(0, 3, 1, 2)
+
     class ToroidalCNN(BaseFeaturesExtractor):
         """CNN feature extractor with circular padding for SokoScript boards.
 
         Architecture: 3 conv layers [32, 64, 64] with 3x3 kernels,
         circular padding, and ReLU activations.
+
+        Accepts one-hot (H, W, C) observations, or (H, W) type-index observations
+        (observation_mode='types'), which are one-hot encoded on-device.
         """
 
         def __init__(self, observation_space, features_dim=256):
             super().__init__(observation_space, features_dim)
-            n_input = observation_space.shape[2]  # num_types (channel-last obs -> channel-first)
+            n_input = _input_channels(observation_space)  # num_types (channel-last obs -> channel-first)
+            self._n_input = n_input
 
             self.cnn = nn.Sequential(
                 # Layer 1: 32 filters
@@ -58,8 +75,8 @@ if HAS_TORCH:
             )
 
         def forward(self, observations):
-            # observations: (batch, H, W, C) -> (batch, C, H, W)
-            x = observations.permute(0, 3, 1, 2)
+            # observations: (batch, H, W, C) or (batch, H, W) -> (batch, C, H, W)
+            x = _to_channels_first(observations, self._n_input)
             return self.linear(self.cnn(x))
 
     class ToroidalCNNWithTransitionHead(BaseFeaturesExtractor):
@@ -75,7 +92,8 @@ if HAS_TORCH:
 
         def __init__(self, observation_space, features_dim=256, n_types=None):
             super().__init__(observation_space, features_dim)
-            n_input = observation_space.shape[2]
+            n_input = _input_channels(observation_space)
+            self._n_input = n_input
             # Detect if last channel is mask (from MaskedLocalObsWrapper)
             # n_types is the number of actual cell types (excluding mask)
             self._n_types = n_types or n_input
@@ -111,7 +129,7 @@ if HAS_TORCH:
             self._transition_logits = None
 
         def forward(self, observations):
-            x = observations.permute(0, 3, 1, 2)  # (B, C, H, W)
+            x = _to_channels_first(observations, self._n_input)  # (B, C, H, W)
             conv_features = self.conv_layers(x)     # (B, 64, H, W)
 
             # Store transition prediction for auxiliary loss
@@ -183,18 +201,24 @@ if HAS_TORCH:
             extractor.forward(obs_t_flat)
             logits = extractor._transition_logits  # (N, K, H, W)
 
-            # Target: type indices from obs_tp1 (argmax of one-hot)
             n_types = extractor._n_types
-            target_onehot = obs_tp1_flat[:, :, :, :n_types]  # (N, H, W, K)
-            target = target_onehot.argmax(dim=-1)             # (N, H, W)
-
-            # Mask: ignore cells where obs_t is masked (if mask channel exists)
-            C = obs_t_flat.shape[-1]
-            if C > n_types:
-                mask_channel = obs_t_flat[:, :, :, -1]  # (N, H, W)
-                valid_cells = mask_channel < 0.5         # True where not masked
+            if obs_t_flat.dim() == 3:
+                # Type-index observations; masked cells hold n_types
+                target = obs_tp1_flat.long()                                       # (N, H, W)
+                valid_cells = (obs_t_flat.long() < n_types) & (target < n_types)
+                target = target.clamp(max=n_types - 1)
             else:
-                valid_cells = torch.ones_like(target, dtype=torch.bool)
+                # Target: type indices from obs_tp1 (argmax of one-hot)
+                target_onehot = obs_tp1_flat[:, :, :, :n_types]  # (N, H, W, K)
+                target = target_onehot.argmax(dim=-1)             # (N, H, W)
+
+                # Mask: ignore cells where obs_t is masked (if mask channel exists)
+                C = obs_t_flat.shape[-1]
+                if C > n_types:
+                    mask_channel = obs_t_flat[:, :, :, -1]  # (N, H, W)
+                    valid_cells = mask_channel < 0.5         # True where not masked
+                else:
+                    valid_cells = torch.ones_like(target, dtype=torch.bool)
 
             # Cross-entropy loss (only on valid cells)
             logits_flat = logits.permute(0, 2, 3, 1).reshape(-1, n_types)  # (N*H*W, K)
@@ -70,7 +70,7 @@ class BoardStatsAction(gym.Wrapper):
         board = self.env
         while hasattr(board, 'env'):
             board = board.env
-        counts = board.board.type_counts_including_unknowns()
+        counts = board.board.type_counts()
         total = sum(counts.values()) or 1
 
         # Build density channel: for each cell in obs, look up its type's frequency
@@ -498,11 +498,14 @@ def make_mycelium_env(board_size=16, seed=None):
 
 
 def train(game='forest_fire', timesteps=1_000_000, board_size=16,
-          n_envs=8, seed=42, log_dir='./logs', use_wandb=False):
-    """Train PPO agent on a SokoScript game."""
+          n_envs=8, seed=42, log_dir='./logs', use_wandb=False, n_workers=0):
+    """Train PPO agent on a SokoScript game.
+
+    With n_workers > 0 the training envs are stepped by that many worker processes
+    (SharedMemoryVecEnv); otherwise they all run in this process."""
     try:
         from stable_baselines3 import PPO
-        from stable_baselines3.common.vec_env import SubprocVecEnv, DummyVecEnv
+        from stable_baselines3.common.vec_env import DummyVecEnv
         from stable_baselines3.common.callbacks import EvalCallback
     except ImportError:
         print("stable-baselines3 not installed. Install with: pip install stable-baselines3")
@@ -524,10 +527,15 @@ def train(game='forest_fire', timesteps=1_000_000, board_size=16,
             return make_env(game, board_size, env_seed)
         return _init
 
-    if n_envs > 1:
-        env = DummyVecEnv([make_env_fn(seed + i) for i in range(n_envs)])
+    # Training envs step together through one SokoScriptVecEnv, or a pool of workers
+    from sokoscript.vec_env import SharedMemoryVecEnv, SokoScriptVecEnv
+    from rl.vec_env import SB3SokoScriptVecEnv
+    if n_workers > 0:
+        env = SB3SokoScriptVecEnv(SharedMemoryVecEnv(
+            [make_env_fn(seed + i) for i in range(max(n_envs, 1))], n_workers=n_workers))
     else:
-        env = DummyVecEnv([make_env_fn(seed)])
+        env = SB3SokoScriptVecEnv(SokoScriptVecEnv.from_envs(
+            [make_env(game, board_size, seed + i) for i in range(max(n_envs, 1))]))
 
     # Evaluation env
     eval_env = DummyVecEnv([make_env_fn(seed + 1000)])
@@ -597,6 +605,8 @@ def main():
     parser.add_argument('--timesteps', type=int, default=1_000_000, help='Total timesteps')
     parser.add_argument('--board-size', type=int, default=16, help='Board size')
     parser.add_argument('--n-envs', type=int, default=8, help='Number of parallel envs')
+    parser.add_argument('--n-workers', type=int, default=0,
+                        help='Worker processes stepping the training envs (0 = in-process)')
     parser.add_argument('--seed', type=int, default=42, help='Random seed')
     parser.add_argument('--log-dir', default='./logs', help='Log directory')
     parser.add_argument('--wandb', action='store_true', help='Enable wandb logging')
@@ -610,6 +620,7 @@ def main():
         seed=args.seed,
         log_dir=args.log_dir,
         use_wandb=args.wandb,
+        n_workers=args.n_workers,
     )
 
 
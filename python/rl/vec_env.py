@@ -0,0 +1,76 @@
+"""stable-baselines3 VecEnv adapter for sokoscript.vec_env.SokoScriptVecEnv and SharedMemoryVecEnv.
+
+Usage:
+    env = SB3SokoScriptVecEnv(SokoScriptVecEnv.from_envs([make_env(game, seed=s) for s in seeds]))
+    env = SB3SokoScriptVecEnv(SharedMemoryVecEnv([partial(make_env, game, seed=s) for s in seeds]))
+"""
+
+try:
+    from stable_baselines3.common import env_util
+    from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+    HAS_SB3 = True
+except ImportError:
+    HAS_SB3 = False
+
+if HAS_SB3:
+    class SB3SokoScriptVecEnv(VecEnv):
+        """Expose a SokoScriptVecEnv or SharedMemoryVecEnv through the SB3 VecEnv interface
+        (done = terminated or truncated, 'TimeLimit.truncated' in infos), in place of
+        DummyVecEnv or SubprocVecEnv.
+
+        The envs of a SharedMemoryVecEnv live in its workers: get_attr reads the parent's
+        template env, and set_attr / env_method are not supported."""
+
+        def __init__(self, vec_env):
+            self.vec_env = vec_env
+            self.envs = getattr(vec_env, 'envs', None)
+            self._actions = None
+            super().__init__(vec_env.num_envs, vec_env.observation_space, vec_env.action_space)
+
+        def reset(self):
+            seeds = getattr(self, '_seeds', None)
+            obs, infos = self.vec_env.reset(seed=list(seeds) if seeds else None)
+            self.reset_infos = infos
+            if hasattr(self, '_reset_seeds'):
+                self._reset_seeds()
+            # SB3 keeps the previous observation across step(), so never hand out the shared buffer
+            return obs.copy() if obs is self.vec_env._obs else obs
+
+        def step_async(self, actions):
+            self._actions = actions
+
+        def step_wait(self):
+            obs, rewards, terminated, truncated, infos = self.vec_env.step(self._actions)
+            for info, term, trunc in zip(infos, terminated, truncated):
+                info['TimeLimit.truncated'] = bool(trunc and not term)
+            dones = terminated | truncated
+            return obs.copy() if obs is self.vec_env._obs else obs, rewards, dones, infos
+
+        def close(self):
+            self.vec_env.close()
+
+        def _local_envs(self):
+            if self.envs is None:
+                raise NotImplementedError(f"{type(self.vec_env).__name__} envs live in worker processes")
+            return self.envs
+
+        def get_attr(self, attr_name, indices=None):
+            if self.envs is None:
+                return self.vec_env.get_attr(attr_name, list(self._get_indices(indices)))
+            return [getattr(self.envs[i], attr_name) for i in self._get_indices(indices)]
+
+        def set_attr(self, attr_name, value, indices=None):
+            self._local_envs()
+            for i in self._get_indices(indices):
+                setattr(self.envs[i], attr_name, value)
+
+        def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+            self._local_envs()
+            return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs)
+                    for i in self._get_indices(indices)]
+
+        def env_is_wrapped(self, wrapper_class, indices=None):
+            if self.envs is None:
+                # workers hold unwrapped SokoScriptEnvs
+                return [False for _ in self._get_indices(indices)]
+            return [env_util.is_wrapped(self.envs[i], wrapper_class) for i in self._get_indices(indices)]
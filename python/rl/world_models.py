@@ -336,6 +336,16 @@ class WorldModelTrainer:
                 done = terminated or truncated
         return np.mean(losses) if losses else 0.0
 
+    def train_from_dataset(self, reader):
+        """Train the world model on the transitions of a recorded trajectory dataset
+        (a sokoscript.trajectory.TrajectoryReader), instead of simulating new episodes."""
+        losses = []
+        for types, _, _, next_types in reader.transitions():
+            loss = self.model.update(types, next_types)
+            if loss:
+                losses.append(loss)
+        return np.mean(losses) if losses else 0.0
+
     def train_from_rollout_buffer(self, observations, episode_starts):
         """Train from SB3 rollout buffer data.
 
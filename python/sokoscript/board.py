@@ -5,16 +5,29 @@ Port of src/board.js: Board class, RangeCounter, evolution logic.
 
 import json
 import math
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+import numpy as np
 from . import lookups
+from .journal import BoardJournal
 from .engine import transform_rule_update
 from .rng import MersenneTwister, fast_ln_left_shift_26, fast_ln_left_shift_26_max
-from .parser import parse_or_undefined
-from .compiler import compile_types
+from .grammar_cache import get_compiled_grammar, grammar_hash
 from .serialize import serialize_rule_with_types
 
 DEFAULT_BOARD_SIZE = 64
 DEFAULT_RNG_SEED = 5489
 
+# Binary snapshots (Board.to_binary): a header, then 8-byte aligned sections.
+BINARY_MAGIC = b'SOKOBRD\0'
+BINARY_FORMAT_VERSION = 1
+# magic, version, size, time, lastEventTime, rng position, n_types, n_states,
+# grammar / extras / state-table byte lengths, sha256 of the grammar source
+_BINARY_HEADER = struct.Struct('<8sIIQQIIIIII32s')
+
 
 def xy2index(x, y, size):
     return (((y % size) + size) % size) * size + (((x % size) + size) % size)
@@ -22,17 +35,35 @@ def xy2index(x, y, size):
 
 class RangeCounter:
     """Time-efficient data structure for a set of ints in [0, n) where n is a power of 2.
-    O(1) total count, O(log n) add/remove/kth-element."""
+    O(1) total count, O(log n) add/remove/kth-element, O(n) bulk build and enumeration.
+
+    Level 0 is a bytearray membership mask with a zero-copy NumPy view (leaf_np),
+    so elements() and batched updates are vectorized; upper levels are lists of counts."""
 
     def __init__(self, n, full=False):
         self.n = n
         self.log2n = round(math.log2(n))
         if (1 << self.log2n) != n:
             raise ValueError(f"Length is not a power of 2: {n}")
-        self.level_count = [
-            [((1 << level) if full else 0) for _ in range(1 << (self.log2n - level))]
-            for level in range(self.log2n + 1)
+        self.level_count = [bytearray(b'\x01' * n if full else n)] + [
+            [(1 << level) if full else 0] * (1 << (self.log2n - level))
+            for level in range(1, self.log2n + 1)
         ]
+        self.leaf_np = np.frombuffer(self.level_count[0], dtype=np.uint8)
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Build the set {i : mask[i]} from a boolean array of length n, in O(n)."""
+        counter = cls(len(mask))
+        counter.leaf_np[:] = np.asarray(mask, dtype=bool)
+        counter._rebuild_upper_levels()
+        return counter
+
+    def _rebuild_upper_levels(self):
+        counts = self.leaf_np.astype(np.int32)
+        for level in range(1, self.log2n + 1):
+            counts = counts[0::2] + counts[1::2]
+            self.level_count[level] = counts.tolist()
 
     def add(self, val):
         for level in range(self.log2n, -1, -1):
@@ -42,6 +73,31 @@ class RangeCounter:
         for level in range(self.log2n, -1, -1):
             self.level_count[level][val >> level] -= 1
 
+    def add_many(self, vals):
+        """Add distinct values that are not already in the set."""
+        self._update_many(vals, self.add, 1)
+
+    def remove_many(self, vals):
+        """Remove distinct values that are all in the set."""
+        self._update_many(vals, self.remove, 0)
+
+    def _update_many(self, vals, update, leaf_value):
+        # Per-value updates cost O(k log n) in Python; a NumPy rebuild from the leaf mask
+        # costs O(n) but is cheaper once k log n passes about n / 4.
+        if len(vals) * self.log2n * 4 < self.n:
+            for val in (vals.tolist() if isinstance(vals, np.ndarray) else vals):
+                update(val)
+        else:
+            self.leaf_np[np.asarray(vals, dtype=np.int64)] = leaf_value
+            self._rebuild_upper_levels()
+
+    def copy(self):
+        other = RangeCounter.__new__(RangeCounter)
+        other.n, other.log2n = self.n, self.log2n
+        other.level_count = [level[:] for level in self.level_count]
+        other.leaf_np = np.frombuffer(other.level_count[0], dtype=np.uint8)
+        return other
+
     def total(self):
         return self.level_count[self.log2n][0]
 
@@ -55,7 +111,113 @@ class RangeCounter:
         return index
 
     def elements(self):
-        return [self.kth_element(k) for k in range(self.total())]
+        return np.flatnonzero(self.leaf_np).tolist()
+
+
+class RateTree:
+    """Fenwick tree of non-negative integer weights indexed by [0, n).
+    O(1) total, O(log n) update and weighted search."""
+
+    def __init__(self, n):
+        self.n = n
+        self.tree = [0] * (n + 1)
+        self.total = 0
+        self.top_bit = 1 << (n.bit_length() - 1) if n else 0
+
+    def add(self, i, delta):
+        self.total += delta
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, r):
+        """Return (i, r') where i is the first index whose cumulative weight exceeds r,
+        and r' is r minus the total weight of indices before i."""
+        pos = 0
+        step = self.top_bit
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= r:
+                pos = nxt
+                r -= self.tree[nxt]
+            step >>= 1
+        return pos, r
+
+    def copy(self):
+        other = RateTree.__new__(RateTree)
+        other.n, other.total, other.top_bit = self.n, self.total, self.top_bit
+        other.tree = self.tree[:]
+        return other
+
+
+class CellArray:
+    """Array-backed cell storage, used by Board when storage='array'.
+
+    Cell types live in a packed uint16 array, states are interned in a
+    string table (id 0 is the empty state) and metadata is kept in a sparse
+    dict keyed by cell index. Indexing returns a fresh {'type', 'state'[, 'meta']}
+    dict and assignment unpacks one, so the object can stand in for the list
+    of cell dicts. types_np and state_ids_np are zero-copy NumPy views.
+    """
+
+    def __init__(self, n):
+        self.types = array('H', bytes(2 * n))
+        self.state_ids = array('I', bytes(4 * n))
+        self.states = ['']
+        self.state_index = {'': 0}
+        self.meta = {}
+        self.types_np = np.frombuffer(self.types, dtype=np.uint16)
+        self.state_ids_np = np.frombuffer(self.state_ids, dtype=np.uint32)
+
+    def copy(self):
+        other = CellArray.__new__(CellArray)
+        other.types = self.types[:]
+        other.state_ids = self.state_ids[:]
+        other.states = self.states[:]
+        other.state_index = dict(self.state_index)
+        other.meta = dict(self.meta)
+        other.types_np = np.frombuffer(other.types, dtype=np.uint16)
+        other.state_ids_np = np.frombuffer(other.state_ids, dtype=np.uint32)
+        return other
+
+    def intern_state(self, state):
+        state_id = self.state_index.get(state)
+        if state_id is None:
+            state_id = len(self.states)
+            self.states.append(state)
+            self.state_index[state] = state_id
+        return state_id
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        cell = {'type': self.types[index], 'state': self.states[self.state_ids[index]]}
+        meta = self.meta.get(index)
+        if meta:
+            cell['meta'] = meta
+        return cell
+
+    def __setitem__(self, index, value):
+        self.types[index] = value['type']
+        state = value.get('state') or ''
+        self.state_ids[index] = self.state_index[state] if state in self.state_index else self.intern_state(state)
+        meta = value.get('meta')
+        if meta:
+            self.meta[index] = meta
+        else:
+            self.meta.pop(index, None)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    def special_indices(self):
+        """Indices of cells that have a non-empty state or metadata."""
+        indices = set(np.flatnonzero(self.state_ids_np).tolist())
+        indices.update(self.meta.keys())
+        return sorted(indices)
 
 
 def _random_int(rng, max_val):
@@ -84,25 +246,108 @@ def _knuth_shuffle(rng, lst):
 
 class Board:
     owner = None  # class-level owner for ownership checks
+    vectorized_sync = True  # use the NumPy sync engine when storage='array'
+    dirty = None  # set of changed cell indices, once track_dirty_cells() is called
+    journal = None  # BoardJournal of applied changes, once start_journal() is called
 
     def __init__(self, opts=None):
+        opts = opts or {}
         self.max_state_len = 64
-        self.init_from_json(opts or {})
+        self.storage = opts.get('storage', 'list')
+        if self.storage not in ('list', 'array'):
+            raise ValueError(f"Unknown cell storage: {self.storage}")
+        self.init_from_json(opts)
 
     def init_grammar(self, grammar):
         self.grammar_source = grammar
-        parsed = parse_or_undefined(grammar, error=False)
-        self.grammar = compile_types(parsed if parsed else [])
+        # Shared with every other Board built from the same source; do not mutate.
+        self.grammar = get_compiled_grammar(grammar)
         n_cells = self.size * self.size
-        self.cell = [{'type': 0, 'state': ''} for _ in range(n_cells)]
+        if self.storage == 'array':
+            self.cell = CellArray(n_cells)
+        else:
+            self.cell = [{'type': 0, 'state': ''} for _ in range(n_cells)]
         self.by_type = [
             RangeCounter(n_cells, full=(n == 0))
             for n in range(len(self.grammar['types']))
         ]
+        self.type_rates = RateTree(len(self.grammar['types']))
+        self.type_rates.add(0, n_cells * self.grammar['rateByType'][0])
         self.by_id = {}
+        self.unknown_counts = {}  # meta['type'] -> number of unknown-type cells with that name
+        if self.dirty is not None:
+            self.dirty.update(range(n_cells))
+
+    def track_dirty_cells(self):
+        """Start recording the indices of changed cells in self.dirty, a set that the
+        consumer clears after reading. Every cell starts out dirty."""
+        self.dirty = set(range(len(self.cell)))
+
+    def start_journal(self):
+        """Start recording every change to the board in self.journal, a BoardJournal that
+        can rebuild the board at any later time or rewind it with undo_to_time()."""
+        self.journal = BoardJournal(self)
+        return self.journal
+
+    def stop_journal(self):
+        self.journal = None
+
+    def undo_to_time(self, t):
+        """Rewind the board, including time and RNG, to time t using its journal."""
+        if self.journal is None:
+            raise ValueError("No journal to undo from; call start_journal() first")
+        self.journal.undo(self, t)
+
+    def clone(self):
+        """Independent copy of this board, made by bulk-copying its cells, indices and RNG.
+
+        Cell and metadata dicts are never mutated in place, so they are shared
+        rather than copied, as is the read-only compiled grammar."""
+        board = type(self).__new__(type(self))
+        board._copy_from(self)
+        return board
+
+    def restore(self, snapshot):
+        """Reset this board to the state of snapshot, a Board from clone().
+        The snapshot is left untouched and can be restored again."""
+        self._copy_from(snapshot)
+        if self.dirty is not None:
+            self.dirty.update(range(len(self.cell)))
+
+    def _copy_from(self, other):
+        self.max_state_len = other.max_state_len
+        self.storage = other.storage
+        self.owner_val = other.owner_val
+        self.size = other.size
+        self.time = other.time
+        self.last_event_time = other.last_event_time
+        self.rng = other.rng.copy()
+        self.grammar_source = other.grammar_source
+        self.grammar = other.grammar
+        self.cell = other.cell.copy()
+        self.by_type = [counter.copy() for counter in other.by_type]
+        self.type_rates = other.type_rates.copy()
+        self.by_id = dict(other.by_id)
+        self.unknown_counts = dict(other.unknown_counts)
 
     def update_grammar(self, grammar):
-        self.init_from_json({**self.to_json(), 'grammar': grammar})
+        """Switch the board to new grammar source, keeping its cells, time and RNG.
+
+        The new grammar is compiled reusing the rules it shares with the current one.
+        If its types are unchanged, cell storage and indices are kept and only the
+        per-type rates are rebuilt; otherwise the board is reloaded via to_json,
+        which maps cells to the new types by name."""
+        compiled = get_compiled_grammar(grammar, self.grammar)
+        if compiled['types'] != self.grammar['types']:
+            self.init_from_json({**self.to_json(), 'grammar': grammar})
+            return
+        self.grammar_source = grammar
+        self.grammar = compiled
+        self.type_rates = RateTree(len(compiled['types']))
+        for t, rate in enumerate(compiled['rateByType']):
+            count = self.by_type[t].total()
+            if rate and count:
+                self.type_rates.add(t, rate * count)
 
     def time_in_seconds(self):
         return self.time / (1 << 32)
@@ -116,6 +361,12 @@ class Board:
     def get_cell(self, x, y):
         return self.cell[self.xy2index(x, y)]
 
+    def get_cell_type(self, x, y):
+        index = self.xy2index(x, y)
+        if self.storage == 'array':
+            return self.cell.types[index]
+        return self.cell[index]['type']
+
     def set_cell(self, x, y, new_value):
         state = new_value.get('state', '')
         if len(state) > self.max_state_len:
@@ -124,13 +375,30 @@ class Board:
 
     def set_cell_by_index(self, index, new_value):
         old_value = self.cell[index]
-        if new_value['type'] != old_value['type']:
-            self.by_type[old_value['type']].remove(index)
-            self.by_type[new_value['type']].add(index)
+        old_type, new_type = old_value['type'], new_value['type']
+        if new_type != old_type:
+            self.by_type[old_type].remove(index)
+            self.by_type[new_type].add(index)
+            rate_by_type = self.grammar['rateByType']
+            if rate_by_type[old_type]:
+                self.type_rates.add(old_type, -rate_by_type[old_type])
+            if rate_by_type[new_type]:
+                self.type_rates.add(new_type, rate_by_type[new_type])
 
         old_meta = old_value.get('meta', {})
         new_meta = new_value.get('meta', {})
 
+        unknown_type = self.grammar['unknownType']
+        if old_type == unknown_type and old_meta.get('type'):
+            name = old_meta['type']
+            if self.unknown_counts[name] == 1:
+                del self.unknown_counts[name]
+            else:
+                self.unknown_counts[name] -= 1
+        if new_type == unknown_type and new_meta.get('type'):
+            name = new_meta['type']
+            self.unknown_counts[name] = self.unknown_counts.get(name, 0) + 1
+
         if (old_meta.get('id') and
                 self.by_id.get(old_meta['id']) == index and
                 new_meta.get('id') != old_meta.get('id')):
@@ -152,9 +420,26 @@ class Board:
                         cell_copy = dict(prev_cell)
                         cell_copy.pop('meta', None)
                         self.cell[prev_index] = cell_copy
+                    if self.journal is not None:
+                        self.journal.record(self, prev_index, prev_cell, self.cell[prev_index])
+                    if self.dirty is not None:
+                        self.dirty.add(prev_index)
             self.by_id[new_id] = index
 
         self.cell[index] = new_value
+        if self.dirty is not None:
+            self.dirty.add(index)
+        if self.journal is not None:
+            self.journal.record(self, index, old_value, new_value)
+
+    def type_array(self, indices=None):
+        """Cell type indices as a flat NumPy array in index order, or for the given indices.
+
+        With array storage and no indices this is a zero-copy view, so it must not be written to."""
+        if self.storage == 'array':
+            return self.cell.types_np if indices is None else self.cell.types_np[indices]
+        cells = self.cell if indices is None else [self.cell[i] for i in indices]
+        return np.fromiter((cell['type'] for cell in cells), dtype=np.uint16, count=len(cells))
 
     def set_cell_type_by_name(self, x, y, type_name, state='', meta=None):
         type_idx = self.grammar['typeIndex'].get(type_name)
@@ -190,8 +475,7 @@ class Board:
         return f'{prefix}{i}'
 
     def next_rule(self, max_wait):
-        type_rates = self.total_type_rates()
-        total_rate = sum(type_rates)
+        total_rate = self.type_rates.total
         if total_rate == 0:
             return None
 
@@ -201,28 +485,14 @@ class Board:
             return None
 
         r2 = _random_big_int(self.rng, total_rate)
-        r = r2
-        cell_type = 0
-        w = 0
-        while r >= 0:
-            w = type_rates[cell_type]
-            r -= w
-            cell_type += 1
-        cell_type -= 1
-        r += w
+        cell_type, r = self.type_rates.find(r2)
 
         t = self.grammar['rateByType'][cell_type]
         n = r // t  # integer division rounds down
         r = r - n * t
 
-        rules = self.grammar['transform'][cell_type]
-        rule_index = 0
-        rule = None
-        while r >= 0:
-            rule = rules[rule_index]
-            w = rule['rate_Hz']
-            r -= w
-            rule_index += 1
+        rule_index = bisect_right(self.grammar['cumulativeRuleRates'][cell_type], r)
+        rule = self.grammar['transform'][cell_type][rule_index]
 
         r3 = self.rng.int()
         if (r3 & 0x3FFFFFFF) > rule['acceptProb_leftShift30']:
@@ -253,23 +523,29 @@ class Board:
                     for rule in rules:
                         if self._apply_rule(x, y, direction, rule):
                             break
+                    if self.journal is not None:
+                        self.journal.end_event(self)
 
     def random_dir(self):
         return lookups.dirs[self.rng.int() % 4]
 
     def evolve_async_to_time(self, t, hard_stop=False):
         while self.time < t:
-            mt_state = self.rng.save_state()
+            self.rng.checkpoint()
             r = self.next_rule(t - self.last_event_time)
             if r is None:
                 self.time = t
                 if not hard_stop:
-                    self.rng.restore_state(mt_state)
+                    self.rng.rollback()
                 else:
                     self.last_event_time = t
+                    if self.journal is not None:
+                        self.journal.mark_stop(self)
                 break
             self._apply_rule(r['x'], r['y'], r['dir'], r['rule'])
             self.time = self.last_event_time = self.last_event_time + r['wait']
+            if self.journal is not None:
+                self.journal.end_event(self)
 
     def evolve_to_time(self, t, hard_stop=False):
         while self.time < t:
@@ -283,17 +559,159 @@ class Board:
             next_time_is_sync_event = len(next_sync_categories) > 0
             self.evolve_async_to_time(next_time, hard_stop or next_time_is_sync_event)
             if next_time_is_sync_event:
-                sync_items = []
-                for n_sync in next_sync_categories:
-                    for n_type in self.grammar['typesBySyncCategory'][n_sync]:
-                        rules = self.grammar['syncTransform'][n_sync][n_type]
-                        for index in self.by_type[n_type].elements():
-                            xy = self.index2xy(index)
-                            for rule in rules:
-                                sync_items.append((xy, rule))
-                _knuth_shuffle(self.rng, sync_items)
-                for xy, rule in sync_items:
-                    self._apply_rule(xy[0], xy[1], self.random_dir(), rule)
+                if self.journal is not None:
+                    self.journal.begin_sync_batch(self)
+                self._apply_sync_rules(next_sync_categories)
+                if self.journal is not None:
+                    self.journal.mark_stop(self)
+        if self.journal is not None:
+            self.journal.mark_stop(self)
+
+    def _apply_sync_rules(self, sync_categories):
+        """Apply one tick of sync rules: every (cell, rule) item of the given categories,
+        in Knuth-shuffled order, each with a random direction.
+
+        The shuffle and direction draws are taken from the RNG up front, in the same
+        order as shuffling the item list and then calling random_dir() per item."""
+        grammar = self.grammar
+        rules, subjects, rule_ids = [], [], []
+        for n_sync in sync_categories:
+            for n_type in grammar['typesBySyncCategory'][n_sync]:
+                type_rules = grammar['syncTransform'][n_sync][n_type]
+                elements = np.flatnonzero(self.by_type[n_type].leaf_np)
+                subjects.append(np.repeat(elements, len(type_rules)))
+                rule_ids.append(np.tile(np.arange(len(rules), len(rules) + len(type_rules)), len(elements)))
+                rules.extend(type_rules)
+        subjects = np.concatenate(subjects) if subjects else np.zeros(0, dtype=np.int64)
+        n = len(subjects)
+        if n == 0:
+            return
+        rule_ids = np.concatenate(rule_ids)
+
+        draws = self.rng.ints(2 * n - 1).astype(np.uint64)
+        k = np.arange(n - 1, dtype=np.uint64)
+        swaps = (k + (((n - k) * draws[:n - 1]) >> np.uint64(32))).tolist()
+        order = list(range(n))
+        for k, i in enumerate(swaps):
+            order[i], order[k] = order[k], order[i]
+        order = np.array(order, dtype=np.int64)
+        subjects, rule_ids = subjects[order], rule_ids[order]
+        dir_ids = (draws[n - 1:] % np.uint64(4)).astype(np.int64)
+
+        if (self.storage == 'array' and self.vectorized_sync and
+                all(rule.get('syncPlan') is not None for rule in rules)):
+            self._apply_sync_items_vectorized(rules, subjects, rule_ids, dir_ids)
+        else:
+            dirs = lookups.dirs
+            for index, rule_id, dir_id in zip(subjects.tolist(), rule_ids.tolist(), dir_ids.tolist()):
+                self._apply_rule(index % self.size, index // self.size, dirs[dir_id], rules[rule_id])
+
+    def _apply_sync_items_vectorized(self, rules, subjects, rule_ids, dir_ids):
+        """Apply shuffled sync items with exactly the result of applying them one by one.
+
+        Works in rounds. An item is resolved once it comes first, among unresolved
+        items, on every cell it reads; such items touch disjoint cells and see the
+        same cells they would see sequentially, so a round is matched and written
+        with array operations. Items that read a cell with metadata go through
+        _apply_rule, and only once every earlier item has been resolved."""
+        size = self.size
+        plans = [rule['syncPlan'] for rule in rules]
+        n_terms = max(plan['offsets'].shape[1] for plan in plans)
+        n_types = len(self.grammar['types'])
+        offsets = np.zeros((len(plans), 4, n_terms, 2), dtype=np.int64)
+        match_empty = np.ones((len(plans), n_terms, n_types), dtype=bool)
+        match_non_empty = np.ones((len(plans), n_terms, n_types), dtype=bool)
+        for r, plan in enumerate(plans):
+            n_lhs = plan['offsets'].shape[1]
+            offsets[r, :, :n_lhs] = plan['offsets']
+            match_empty[r, :n_lhs] = plan['matchEmpty']
+            match_non_empty[r, :n_lhs] = plan['matchNonEmpty']
+
+        off = offsets[rule_ids, dir_ids]
+        xs = (subjects % size)[:, None] + off[..., 0]
+        ys = (subjects // size)[:, None] + off[..., 1]
+        footprint = (ys % size) * size + (xs % size)
+        term_ids = np.arange(n_terms)
+
+        types, state_ids = self.cell.types_np, self.cell.state_ids_np
+        n_items = len(subjects)
+        owner = np.full(len(types), n_items, dtype=np.int64)
+        pending = np.arange(n_items)
+        while len(pending):
+            cells = footprint[pending]
+            # the earliest unresolved item reading each cell, by scatter-min
+            owner[cells] = n_items
+            np.minimum.at(owner, cells.ravel(), np.repeat(pending, n_terms))
+            is_ready = (owner[cells] == pending[:, None]).all(axis=1)
+            ready, cells = pending[is_ready], cells[is_ready]
+            pending = pending[~is_ready]
+
+            if self.cell.meta:
+                meta_indices = np.fromiter(self.cell.meta, dtype=np.int64, count=len(self.cell.meta))
+                has_meta = np.isin(cells, meta_indices).any(axis=1)
+                if has_meta.any():
+                    scalar = ready[has_meta]
+                    if len(pending):
+                        deferred = scalar[scalar > pending[0]]
+                        scalar = scalar[scalar < pending[0]]
+                        pending = np.sort(np.concatenate([pending, deferred]))
+                    dirs = lookups.dirs
+                    for item in scalar.tolist():
+                        index = int(subjects[item])
+                        self._apply_rule(index % size, index // size, dirs[dir_ids[item]], rules[rule_ids[item]])
+                    ready, cells = ready[~has_meta], cells[~has_meta]
+
+            item_rules = rule_ids[ready]
+            cell_types = types[cells]
+            matched = np.where(state_ids[cells] == 0,
+                               match_empty[item_rules[:, None], term_ids, cell_types],
+                               match_non_empty[item_rules[:, None], term_ids, cell_types]).all(axis=1)
+            cells, item_rules = cells[matched], item_rules[matched]
+            for r in np.unique(item_rules).tolist():
+                rule_cells = cells[item_rules == r]
+                if self.journal is not None:
+                    self.journal.record_sync_fires(self, rules[r], rule_cells[:, 0])
+                self._write_sync_plan(plans[r], rule_cells)
+
+    def _write_sync_plan(self, plan, cells):
+        """Write the RHS of a sync plan for matched items with disjoint footprints."""
+        types, state_ids = self.cell.types_np, self.cell.state_ids_np
+        old_types, old_state_ids = types[cells], state_ids[cells]
+        for pos, write in enumerate(plan['writes']):
+            if write[0] == 'group':
+                new_types, new_state_ids = old_types[:, write[1]], old_state_ids[:, write[1]]
+            else:
+                new_types = write[1] if write[0] == 'type' else old_types[:, write[1]]
+                new_state_ids = self.cell.intern_state(write[2][:self.max_state_len])
+            self._set_cells_bulk(cells[:, pos], new_types, new_state_ids)
+
+    def _set_cells_bulk(self, indices, new_types, new_state_ids):
+        """Array-storage equivalent of set_cell_by_index over distinct indices, for cells
+        that have no metadata before or after."""
+        types = self.cell.types_np
+        old_types = types[indices]
+        if self.journal is not None:
+            self.journal.record_bulk(self, indices, old_types, self.cell.state_ids_np[indices],
+                                     new_types, new_state_ids)
+        types[indices] = new_types
+        self.cell.state_ids_np[indices] = new_state_ids
+        if self.dirty is not None:
+            self.dirty.update(indices.tolist())
+        changed = old_types != types[indices]
+        if not changed.any():
+            return
+        indices, old_types, new_types = indices[changed], old_types[changed], types[indices[changed]]
+        rate_by_type = self.grammar['rateByType']
+        for t in np.unique(old_types).tolist():
+            removed = indices[old_types == t]
+            self.by_type[t].remove_many(removed)
+            if rate_by_type[t]:
+                self.type_rates.add(t, -rate_by_type[t] * len(removed))
+        for t in np.unique(new_types).tolist():
+            added = indices[new_types == t]
+            self.by_type[t].add_many(added)
+            if rate_by_type[t]:
+                self.type_rates.add(t, rate_by_type[t] * len(added))
 
     def evolve_and_process(self, t, moves, hard_stop=False):
         future = sorted(
@@ -309,23 +727,42 @@ class Board:
         updates = transform_rule_update(self, x, y, direction, rule)
         if not updates:
             return False
+        if self.journal is not None:
+            self.journal.begin_rule(self, x, y, direction, rule)
         for ux, uy, cell in updates:
             self.set_cell(ux, uy, cell)
         return True
 
     def types_including_unknowns(self):
-        unknown_types = set()
-        for index in self.by_type[self.grammar['unknownType']].elements():
-            meta = self.cell[index].get('meta', {})
-            if 'type' in meta:
-                unknown_types.add(meta['type'])
-        types = list(self.grammar['types']) + [t for t in unknown_types if t is not None]
+        types = list(self.grammar['types']) + list(self.unknown_counts)
         type2idx = {t: i for i, t in enumerate(types)}
         return types, type2idx
 
+    def type_counts(self):
+        """Number of cells of each type, including unknown types by name.
+
+        Same result as type_counts_including_unknowns(), read from the maintained
+        per-type totals in O(number of types) rather than by scanning the board."""
+        unknown = self.grammar['unknownType']
+        count = {t: self.by_type[n].total() if n != unknown else 0
+                 for n, t in enumerate(self.grammar['types'])}
+        count.update(self.unknown_counts)
+        return count
+
     def type_counts_including_unknowns(self):
         types, _ = self.types_including_unknowns()
         count = {t: 0 for t in types}
+        if self.storage == 'array':
+            unknown = self.grammar['unknownType']
+            by_type = np.bincount(self.cell.types_np, minlength=len(self.grammar['types']))
+            for n, t in enumerate(self.grammar['types']):
+                if n != unknown:
+                    count[t] = int(by_type[n])
+            for index in self.by_type[unknown].elements():
+                t = self.cell.meta.get(index, {}).get('type')
+                if t:
+                    count[t] += 1
+            return count
         for cell in self.cell:
             if cell['type'] == self.grammar['unknownType']:
                 t = cell.get('meta', {}).get('type')
@@ -350,6 +787,14 @@ class Board:
             return result
         return type_idx
 
+    def cells_to_json(self, type2idx):
+        if self.storage == 'array':
+            cells = self.cell.types_np.tolist()
+            for index in self.cell.special_indices():
+                cells[index] = self.cell_to_json(self.cell[index], type2idx)
+            return cells
+        return [self.cell_to_json(cell, type2idx) for cell in self.cell]
+
     def to_json(self):
         types, type2idx = self.types_including_unknowns()
         return {
@@ -360,7 +805,7 @@ class Board:
             'grammar': self.grammar_source,
             'types': types,
             'size': self.size,
-            'cell': [self.cell_to_json(cell, type2idx) for cell in self.cell],
+            'cell': self.cells_to_json(type2idx),
         }
 
     def to_string(self):
@@ -405,3 +850,141 @@ class Board:
                 if meta:
                     cell['meta'] = meta
                 self.set_cell_by_index(index, cell)
+
+    def to_binary(self):
+        """Serialize the board as a binary snapshot, for fast checkpointing (see init_from_binary).
+
+        Sections: the RNG state block, the grammar source, a JSON extras section (owner
+        and the sparse {cell index: meta} map), the packed uint16 cell types, uint32
+        state ids and the interned state table (uint32 end offsets and UTF-8 bytes).
+        Cell types are indices into the grammar's types; unknown-type cells keep
+        their name in meta['type'], as in memory. to_json stays the interchange format."""
+        n_cells = len(self.cell)
+        if self.storage == 'array':
+            # only the states in use, with the empty state kept at id 0
+            used = np.union1d([0], self.cell.state_ids_np)
+            states = [self.cell.states[i] for i in used.tolist()]
+            state_ids = np.searchsorted(used, self.cell.state_ids_np)
+            meta = self.cell.meta
+        else:
+            state_index = {'': 0}
+            state_ids = np.fromiter((state_index.setdefault(cell['state'], len(state_index)) for cell in self.cell),
+                                    dtype=np.uint32, count=n_cells)
+            states = list(state_index)
+            meta = {index: cell['meta'] for index, cell in enumerate(self.cell) if cell.get('meta')}
+        encoded = [state.encode('utf-8') for state in states]
+        grammar = self.grammar_source.encode('utf-8')
+        extras = json.dumps({'owner': self.owner_val, 'meta': {str(i): m for i, m in meta.items()}},
+                            separators=(',', ':')).encode('utf-8')
+        header = _BINARY_HEADER.pack(
+            BINARY_MAGIC, BINARY_FORMAT_VERSION, self.size, self.time, self.last_event_time, self.rng.mti,
+            len(self.grammar['types']), len(states), len(grammar), len(extras), sum(map(len, encoded)),
+            bytes.fromhex(grammar_hash(self.grammar_source)))
+        sections = [
+            header,
+            self.rng.mt.astype('<u4').tobytes(),
+            grammar,
+            extras,
+            self.type_array().astype('<u2').tobytes(),
+            np.asarray(state_ids, dtype='<u4').tobytes(),
+            np.cumsum([len(b) for b in encoded], dtype='<u4').tobytes(),
+            b''.join(encoded),
+        ]
+        return b''.join(section + bytes(-len(section) % 8) for section in sections)
+
+    def save_binary(self, file):
+        """Write to_binary() to a path or a writable binary file."""
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'wb') as f:
+                f.write(self.to_binary())
+        else:
+            file.write(self.to_binary())
+
+    @classmethod
+    def load_binary(cls, file, storage='array'):
+        """Load a board saved with save_binary from a path, which is memory-mapped, or a
+        readable binary file."""
+        board = cls({'size': 1, 'storage': storage})
+        if not isinstance(file, (str, os.PathLike)):
+            board.init_from_binary(file.read())
+            return board
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            board.init_from_binary(data)
+        return board
+
+    def init_from_binary(self, data):
+        """Counterpart of init_from_json for a to_binary() snapshot in any bytes-like object.
+
+        Cell arrays are read in place and copied into the board in bulk, and the
+        type indices are rebuilt from them rather than by replaying set_cell_by_index."""
+        view = memoryview(data)
+        try:
+            (magic, version, size, time, last_event_time, mti, n_types, n_states,
+             grammar_len, extras_len, states_len, digest) = _BINARY_HEADER.unpack_from(view)
+        except struct.error:
+            raise ValueError("Not a binary board snapshot") from None
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary board snapshot")
+        if version != BINARY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported binary board format version {version} (expected {BINARY_FORMAT_VERSION})")
+        n_cells = size * size
+        sections, pos = [], _BINARY_HEADER.size
+        for length in (4 * len(self.rng.mt), grammar_len, extras_len, 2 * n_cells, 4 * n_cells,
+                       4 * n_states, states_len):
+            if pos + length > len(view):
+                raise ValueError("Truncated binary board snapshot")
+            sections.append(view[pos:pos + length])
+            pos += length + (-length % 8)
+        mt, grammar, extras, types, state_ids, state_ends, state_bytes = sections
+        grammar = bytes(grammar).decode('utf-8')
+        if bytes.fromhex(grammar_hash(grammar)) != digest:
+            raise ValueError("Grammar hash mismatch in binary board snapshot")
+        extras = json.loads(bytes(extras))
+
+        self.owner_val = extras.get('owner')
+        self.size = size
+        self.time = time
+        self.last_event_time = last_event_time
+        self.rng = MersenneTwister.from_state(np.frombuffer(mt, dtype='<u4'), mti)
+        self.init_grammar(grammar)
+        if len(self.grammar['types']) != n_types:
+            raise ValueError(f"Snapshot has {n_types} types but its grammar has {len(self.grammar['types'])}")
+
+        state_bytes = bytes(state_bytes)
+        ends = np.frombuffer(state_ends, dtype='<u4').tolist()
+        states = [state_bytes[start:end].decode('utf-8') for start, end in zip([0] + ends, ends)]
+        meta = {int(index): m for index, m in extras.get('meta', {}).items()}
+        types = np.frombuffer(types, dtype='<u2')
+        state_ids = np.frombuffer(state_ids, dtype='<u4')
+        if self.storage == 'array':
+            self.cell.types_np[:] = types
+            self.cell.state_ids_np[:] = state_ids
+            self.cell.states = states
+            self.cell.state_index = {state: i for i, state in enumerate(states)}
+            self.cell.meta = meta
+        else:
+            self.cell = [{'type': t, 'state': states[i]} for t, i in zip(types.tolist(), state_ids.tolist())]
+            for index, m in meta.items():
+                self.cell[index]['meta'] = m
+        self._rebuild_indices(meta)
+
+    def _rebuild_indices(self, meta):
+        """Rebuild by_type, type_rates, by_id and unknown_counts from the cells in bulk,
+        given {index: meta} for every cell with metadata."""
+        types = self.type_array()
+        n_types = len(self.grammar['types'])
+        counts = np.bincount(types, minlength=n_types).tolist()
+        self.by_type = [RangeCounter.from_mask(types == t) if counts[t] else RangeCounter(len(types))
+                        for t in range(n_types)]
+        self.type_rates = RateTree(n_types)
+        for t, rate in enumerate(self.grammar['rateByType']):
+            if rate and counts[t]:
+                self.type_rates.add(t, rate * counts[t])
+        self.by_id = {}
+        self.unknown_counts = {}
+        unknown_type = self.grammar['unknownType']
+        for index, m in meta.items():
+            if m.get('id'):
+                self.by_id[m['id']] = index
+            if m.get('type') and types[index] == unknown_type:
+                self.unknown_counts[m['type']] = self.unknown_counts.get(m['type'], 0) + 1
@@ -3,6 +3,9 @@
 Port of src/gramutil.js: makeGrammarIndex, expandInherits, compileTypes.
 """
 
+from itertools import accumulate
+
+from .engine import compile_rule, neighbor_filter, sync_plan
 from .serialize import lhs_term
 
 EMPTY_TYPE = '_'
@@ -222,7 +225,39 @@ def _collect_commands_and_keys(command, key, transform, types):
                 key[type_idx].setdefault(rule['key'], []).append(rule)
 
 
-def compile_types(rules):
+def _rule_shape(rule):
+    """Key of everything compile_rule, neighbor_filter and sync_plan read from a rule."""
+    return repr((rule['lhs'], rule['rhs'], rule.get('score')))
+
+
+def _compiled_by_shape(grammar):
+    """{rule shape: compiled rule} for every async and sync rule of a compiled grammar."""
+    compiled = {}
+    for rules in [*grammar['transform'], *(rules for trans in grammar['syncTransform'] for rules in trans)]:
+        for rule in rules:
+            compiled.setdefault(_rule_shape(rule), rule)
+    return compiled
+
+
+def _compile_rule_parts(rule, n_types, reusable, sync):
+    old = reusable.get(_rule_shape(rule)) if reusable else None
+    if old is None:
+        rule['compiledUpdate'] = compile_rule(rule)
+        rule['neighborFilter'] = neighbor_filter(rule, n_types)
+    else:
+        rule['compiledUpdate'] = old['compiledUpdate']
+        rule['neighborFilter'] = old['neighborFilter']
+    if sync:
+        rule['syncPlan'] = old['syncPlan'] if old is not None and 'syncPlan' in old else sync_plan(rule, n_types)
+
+
+def compile_types(rules, previous=None):
+    """Compile parsed rules into the grammar dict used by Board.
+
+    previous is an earlier compiled grammar, e.g. the same grammar before an edit.
+    If it has the same types, rules whose terms are unchanged reuse its compiled
+    update, neighbor filter and sync plan, so changing rates or adding and removing
+    a few rules only compiles the rules that are new. previous is not modified."""
     index = expand_inherits(make_grammar_index(rules))
     types = index['types']
     type_index = index['typeIndex']
@@ -253,6 +288,16 @@ def compile_types(rules):
                 else:
                     rule['acceptProb_leftShift30'] = 0
 
+    # unchanged rules of the previous grammar share their compiled parts, given the same type indices
+    reusable = _compiled_by_shape(previous) if previous and previous['types'] == types else {}
+    for rules in transform:
+        for rule in rules:
+            _compile_rule_parts(rule, len(types), reusable, sync=False)
+    for trans in sync_transform:
+        for rules in trans:
+            for rule in rules:
+                _compile_rule_parts(rule, len(types), reusable, sync=True)
+
     command = [{} for _ in types]
     key = [{} for _ in types]
     _collect_commands_and_keys(command, key, transform, types)
@@ -264,6 +309,11 @@ def compile_types(rules):
         for rules in transform
     ]
 
+    cumulative_rule_rates = [
+        list(accumulate(rule['rate_Hz'] for rule in rules))
+        for rules in transform
+    ]
+
     sync_categories_by_type = [
         [m for m, _r in enumerate(sync_rates) if sync_transform[m][n]]
         for n, _t in enumerate(types)
@@ -290,6 +340,7 @@ def compile_types(rules):
         'syncPeriods': sync_periods,
         'syncCategories': sync_categories,
         'rateByType': rate_by_type,
+        'cumulativeRuleRates': cumulative_rule_rates,
         'syncCategoriesByType': sync_categories_by_type,
         'typesBySyncCategory': types_by_sync_category,
         'command': command,
@@ -1,8 +1,14 @@
 """Pattern matching engine and rule application.
 
 Port of src/engine.js: Matcher class, applyTransformRule, transformRuleUpdate.
+
+compile_rule turns a compiled-grammar rule into a closure that does the same
+work as Matcher + transform_rule_update, with addresses, char classes and
+constant state expressions worked out ahead of time.
 """
 
+import numpy as np
+
 from . import lookups
 
 
@@ -146,11 +152,7 @@ class Matcher:
         return self
 
     def get_lhs_pos_for_rhs_term(self, t):
-        if 'id' in t:
-            return t['id']
-        if t.get('op') in ('group', 'prefix'):
-            return t.get('group')
-        return None
+        return _lhs_pos_for_rhs_term(t)
 
     def get_meta_for_rhs_term(self, t, score):
         g = self.get_lhs_pos_for_rhs_term(t)
@@ -190,6 +192,14 @@ class Matcher:
         return (a[0] + self.x, a[1] + self.y, self.new_cell(term, score))
 
 
+def _lhs_pos_for_rhs_term(t):
+    if 'id' in t:
+        return t['id']
+    if t.get('op') in ('group', 'prefix'):
+        return t.get('group')
+    return None
+
+
 def _strip_duplicate_metadata(matcher, dom_cell, sub_cell, dom_term, sub_term):
     if matcher.get_lhs_pos_for_rhs_term(dom_term) == matcher.get_lhs_pos_for_rhs_term(sub_term):
         sub_cell.pop('meta', None)
@@ -208,6 +218,14 @@ def match_lhs(board, x, y, direction, rule):
 
 
 def transform_rule_update(board, x, y, direction, rule):
+    neighbor_filter = rule.get('neighborFilter')
+    if neighbor_filter is not None:
+        dx, dy = neighbor_filter[0][direction]
+        if board.get_cell_type(x + dx, y + dy) not in neighbor_filter[1]:
+            return None
+    compiled = rule.get('compiledUpdate')
+    if compiled is not None:
+        return compiled(board, x, y, direction)
     matcher = match_lhs(board, x, y, direction, rule)
     if matcher.failed:
         return None
@@ -226,3 +244,469 @@ def apply_transform_rule(board, x, y, direction, rule):
             board.set_cell(ux, uy, cell)
         return True
     return False
+
+
+# --- Rule compilation ---
+
+_DEFAULT_ADDR = {'op': 'reldir', 'dir': 'F'}
+_NOT_CONST = object()
+
+
+class _Unsupported(Exception):
+    """A rule uses something the rule compiler does not handle; the interpreter is used instead."""
+
+
+class _Context:
+    """Per-attempt match state: the slimmed-down equivalent of a Matcher."""
+    __slots__ = ('dir', 'addr', 'cell', 'tail')
+
+    def __init__(self, dir_char):
+        self.dir = dir_char
+        self.addr = []
+        self.cell = []
+        self.tail = []
+
+
+def _const(value):
+    return (lambda ctx: value), value
+
+
+def _compile_state_expr(t):
+    """Compile a state-char expression to (fn(ctx) -> char, constant value or _NOT_CONST)."""
+    if isinstance(t, str):
+        return _const(t)
+    op = t.get('op')
+    if op == 'char':
+        return _const(t['char'])
+    if op == 'absdir':
+        return _const(lookups.char_lookup['absDir'][t['dir']])
+    if op == 'integer':
+        return _const(lookups.int2char(t['n']))
+    if op == 'vector':
+        return _const(lookups.vec2char((t['x'], t['y'])))
+    if op in ('clock', 'anti'):
+        table = lookups.char_perm_lookup['rotate'][op]
+        arg, arg_const = _compile_state_expr(t['arg'])
+        if arg_const is not _NOT_CONST and arg_const in table:
+            return _const(table[arg_const])
+        return (lambda ctx: table[arg(ctx)]), _NOT_CONST
+    if op in ('add', 'sub', '+', '-'):
+        table = lookups.char_perm_lookup[{'add': 'intAdd', 'sub': 'intSub', '+': 'vecAdd', '-': 'vecSub'}[op]]
+        left, left_const = _compile_state_expr(t['left'])
+        right, right_const = _compile_state_expr(t['right'])
+        if right_const is not _NOT_CONST and right_const in table:
+            row = table[right_const]
+            if left_const is not _NOT_CONST and left_const in row:
+                return _const(row[left_const])
+            return (lambda ctx: row[left(ctx)]), _NOT_CONST
+        return (lambda ctx: table[right(ctx)][left(ctx)]), _NOT_CONST
+    if op == '*':
+        table = lookups.char_perm_lookup['matMul'][t['left']['matrix']]
+        right, right_const = _compile_state_expr(t['right'])
+        if right_const is not _NOT_CONST and right_const in table:
+            return _const(table[right_const])
+        return (lambda ctx: table[right(ctx)]), _NOT_CONST
+    if op == 'location':
+        g = t['group'] - 1
+        vec_char, vec2char = lookups.vec_char_lookup, lookups.vec2char
+
+        def location(ctx):
+            vec = ctx.addr[g]
+            return vec_char.get(vec) or vec2char(vec)
+        return location, _NOT_CONST
+    if op == 'reldir':
+        table = lookups.char_perm_lookup['matMul'][t['dir']]
+        return (lambda ctx: table[ctx.dir]), _NOT_CONST
+    if op == 'state':
+        g, idx = t['group'] - 1, t['char'] - 1
+
+        def state_char(ctx):
+            state = ctx.cell[g]['state']
+            return state[idx] if idx < len(state) else None
+        return state_char, _NOT_CONST
+    if op == 'tail':
+        g = t['group'] - 1
+        return (lambda ctx: ctx.cell[g]['state'][ctx.tail[g]:]), _NOT_CONST
+
+    raise _Unsupported(t)
+
+
+def _char_class_set(chars):
+    return frozenset(ch['char'] if isinstance(ch, dict) and ch.get('op') == 'char' else ch
+                     for ch in chars if isinstance(ch, str) or ch.get('op') == 'char')
+
+
+def _compile_state_char_test(s):
+    """Compile an LHS state char to fn(c, ctx) -> 1 (match), 0 (fail) or -1 (match rest)."""
+    if isinstance(s, str):
+        return lambda c, ctx: 1 if s == c else 0
+    op = s.get('op')
+    if op == 'char':
+        ch = s['char']
+        return lambda c, ctx: 1 if ch == c else 0
+    if op == 'wild':
+        return lambda c, ctx: 1 if c is not None else 0
+    if op == 'any':
+        return lambda c, ctx: -1
+    if op == 'class':
+        chars = _char_class_set(s['chars'])
+        return lambda c, ctx: 1 if c in chars else 0
+    if op == 'negated':
+        chars = _char_class_set(s['chars'])
+        return lambda c, ctx: 1 if c is not None and c not in chars else 0
+    expr, value = _compile_state_expr(s)
+    if value is not _NOT_CONST:
+        return lambda c, ctx: 1 if value == c else 0
+    return lambda c, ctx: 1 if expr(ctx) == c else 0
+
+
+def _is_literal_char(s):
+    return isinstance(s, str) or s.get('op') == 'char'
+
+
+def _compile_state_test(state_list):
+    """Compile an LHS term's state list to fn(state, ctx) -> bool."""
+    if state_list and isinstance(state_list[0], dict) and state_list[0].get('op') == 'any':
+        return lambda state, ctx: True
+    if all(_is_literal_char(s) for s in state_list):
+        literal = ''.join(s if isinstance(s, str) else s['char'] for s in state_list)
+        return lambda state, ctx: state == literal
+    tests = [_compile_state_char_test(s) for s in state_list]
+    n_chars = len(state_list)
+
+    def state_test(state, ctx):
+        n_state = len(state)
+        for n, test in enumerate(tests):
+            match_status = test(state[n] if n < n_state else None, ctx)
+            if not match_status:
+                return False
+            if match_status < 0:
+                return True
+        return n_chars == n_state
+    return state_test
+
+
+def _compile_lhs_term(t):
+    """Compile an LHS term to fn(cell_type, state, ctx) -> bool."""
+    op = t.get('op')
+    if op == 'any':
+        return lambda cell_type, state, ctx: True
+    if op == 'negterm':
+        inner = _compile_lhs_term(t['term'])
+        return lambda cell_type, state, ctx: not inner(cell_type, state, ctx)
+    if op == 'alt':
+        if all(a.get('op') is None and 'state' not in a for a in t['alt']):
+            types = frozenset(a.get('type') for a in t['alt'])
+            return lambda cell_type, state, ctx: cell_type in types and not state
+        alts = [_compile_lhs_term(a) for a in t['alt']]
+        return lambda cell_type, state, ctx: any(a(cell_type, state, ctx) for a in alts)
+    term_type = t.get('type')
+    if 'state' not in t:
+        return lambda cell_type, state, ctx: cell_type == term_type and not state
+    state_test = _compile_state_test(t['state'])
+    return lambda cell_type, state, ctx: cell_type == term_type and state_test(state, ctx)
+
+
+def _static_addr(addr, base_vec, dir_char):
+    """Evaluate a fixed (absdir/reldir) address exactly as Matcher.compute_addr does."""
+    base_char = lookups.vec2char(base_vec)
+    if addr['op'] == 'absdir':
+        offset_char = lookups.char_lookup['absDir'][addr['dir']]
+    else:
+        offset_char = lookups.char_perm_lookup['matMul'][addr['dir']][dir_char]
+    return lookups.char_vec_lookup[lookups.char_perm_lookup['vecAdd'][offset_char][base_char]]
+
+
+def _offset_vec(offset_char, base):
+    """Matcher.compute_addr's char_vec_lookup[vecAdd[offset_char][vec2char(base)]], by one
+    table lookup while base is in the vector-char range."""
+    vec = lookups.vec_add_lookup[offset_char].get(base)
+    if vec is None:
+        vec = lookups.char_vec_lookup[lookups.char_perm_lookup['vecAdd'][offset_char][lookups.vec2char(base)]]
+    return vec
+
+
+def _compile_dynamic_addr(addr):
+    """Compile a state-dependent address to fn(ctx, base_vec) -> vec."""
+    op = addr['op']
+    if op == 'absdir':
+        offset_char = lookups.char_lookup['absDir'][addr['dir']]
+        return lambda ctx, base: _offset_vec(offset_char, base)
+    if op == 'reldir':
+        table = lookups.char_perm_lookup['matMul'][addr['dir']]
+        return lambda ctx, base: _offset_vec(table[ctx.dir], base)
+    if op == 'neighbor':
+        arg, _ = _compile_state_expr(addr['arg'])
+        return lambda ctx, base: _offset_vec(arg(ctx), base)
+    if op == 'cell':
+        arg, _ = _compile_state_expr(addr['arg'])
+        char_vec = lookups.char_vec_lookup
+        return lambda ctx, base: char_vec[arg(ctx)]
+    raise _Unsupported(addr)
+
+
+def _static_offsets(lhs):
+    """Per-direction offsets of the leading run of fixed-address LHS terms.
+
+    Returns (offsets_by_dir, n_static). Falls back to fewer static terms if an
+    offset would leave the vector-char range (the runtime path then behaves
+    exactly like Matcher, including its failure mode)."""
+    n_static = 1
+    while n_static < len(lhs) and lhs[n_static].get('addr', _DEFAULT_ADDR)['op'] in ('absdir', 'reldir'):
+        n_static += 1
+    offsets = {}
+    for d in lookups.dirs:
+        dir_char = lookups.char_lookup['absDir'][d]
+        chain = [(0, 0)]
+        for term in lhs[1:n_static]:
+            xy = _static_addr(term.get('addr', _DEFAULT_ADDR), chain[-1], dir_char)
+            if xy[0] != xy[0]:  # NaN: outside the vector-char range
+                break
+            chain.append(xy)
+        offsets[d] = chain
+    n_static = min(len(chain) for chain in offsets.values())
+    return {d: chain[:n_static] for d, chain in offsets.items()}, n_static
+
+
+def _compile_rhs_term(t, score):
+    """Compile an RHS term to fn(ctx) -> new cell dict (Matcher.new_cell)."""
+    op = t.get('op')
+    if op not in (None, 'group', 'prefix'):
+        raise _Unsupported(t)
+    g = _lhs_pos_for_rhs_term(t)
+    state_fns = [_compile_state_expr(s) for s in t.get('state', [])]
+    if all(value is not _NOT_CONST for _, value in state_fns):
+        literal = ''.join(value for _, value in state_fns)
+        state_fns = None
+
+    def make_state(ctx):
+        if state_fns is None:
+            return literal
+        return ''.join([fn(ctx) for fn, _ in state_fns])
+
+    if op in ('group', 'prefix'):
+        src = t['group'] - 1
+        if op == 'group':
+            def base_cell(ctx):
+                cell = ctx.cell[src]
+                return {'type': cell['type'], 'state': cell['state']}
+        else:
+            def base_cell(ctx):
+                return {'type': ctx.cell[src]['type'], 'state': make_state(ctx)}
+    else:
+        term_type = t['type']
+
+        def base_cell(ctx):
+            return {'type': term_type, 'state': make_state(ctx)}
+
+    if not g:
+        return base_cell
+
+    def new_cell(ctx):
+        result = base_cell(ctx)
+        meta = ctx.cell[g - 1].get('meta')
+        if meta or score:
+            new_meta = dict(meta) if meta else {}
+            if g == 1 and score:
+                new_meta['score'] = new_meta.get('score', 0) + score
+            if new_meta:
+                result['meta'] = new_meta
+        return result
+    return new_cell
+
+
+def _compile_rule(rule):
+    lhs, rhs = rule['lhs'], rule['rhs']
+    score = rule.get('score')
+    offsets, n_static = _static_offsets(lhs)
+    n_lhs = len(lhs)
+    term_tests = [_compile_lhs_term(term) for term in lhs]
+    dynamic_addrs = [None] * n_static + [_compile_dynamic_addr(term.get('addr', _DEFAULT_ADDR))
+                                         for term in lhs[n_static:]]
+    tail_starts = []
+    for term in lhs:
+        state_list = term.get('state', [])
+        if state_list and isinstance(state_list[-1], dict) and state_list[-1].get('op') == 'any':
+            tail_starts.append(len(state_list) - 1)
+        else:
+            tail_starts.append(None)
+    rhs_makers = [_compile_rhs_term(term, score) for term in rhs]
+    rhs_groups = [_lhs_pos_for_rhs_term(term) for term in rhs]
+    same_group = [[rhs_groups[i] == rhs_groups[j] for j in range(len(rhs))] for i in range(len(rhs))]
+    n_rhs = len(rhs)
+    abs_dir = lookups.char_lookup['absDir']
+
+    def update(board, x, y, direction):
+        ctx = _Context(abs_dir[direction])
+        addrs, cells, tails = ctx.addr, ctx.cell, ctx.tail
+        static = offsets[direction]
+        get_cell = board.get_cell
+        for pos in range(n_lhs):
+            xy = static[pos] if pos < n_static else dynamic_addrs[pos](ctx, addrs[pos - 1])
+            addrs.append(xy)
+            cell = get_cell(xy[0] + x, xy[1] + y)
+            state = cell['state']
+            if not term_tests[pos](cell['type'], state, ctx):
+                return None
+            cells.append(cell)
+            tail = tail_starts[pos]
+            tails.append(len(state) if tail is None else tail)
+        updates = []
+        has_meta = False
+        for pos in range(n_rhs):
+            a = addrs[pos]
+            cell = rhs_makers[pos](ctx)
+            if 'meta' in cell:
+                has_meta = True
+            updates.append((a[0] + x, a[1] + y, cell))
+        if has_meta:
+            for i in range(n_rhs - 1):
+                dom_cell = updates[i][2]
+                for j in range(i + 1, n_rhs):
+                    sub_cell = updates[j][2]
+                    if same_group[i][j]:
+                        sub_cell.pop('meta', None)
+                    sub_meta = sub_cell.get('meta')
+                    if (sub_meta and sub_meta.get('id') and
+                            dom_cell.get('meta', {}).get('id') == sub_meta['id']):
+                        del sub_meta['id']
+                    if 'meta' in sub_cell and not sub_cell['meta']:
+                        del sub_cell['meta']
+        return updates
+
+    return update
+
+
+def _possible_types(term, all_types):
+    """Types for which an LHS term can match some state."""
+    op = term.get('op')
+    if op == 'any':
+        return all_types
+    if op == 'negterm':
+        return all_types - _certain_types(term['term'], all_types)
+    if op == 'alt':
+        return frozenset().union(*(_possible_types(t, all_types) for t in term['alt']))
+    return frozenset([term.get('type')]) & all_types
+
+
+def _certain_types(term, all_types):
+    """Types for which an LHS term matches every state."""
+    op = term.get('op')
+    if op == 'any':
+        return all_types
+    if op == 'negterm':
+        return all_types - _possible_types(term['term'], all_types)
+    if op == 'alt':
+        return frozenset().union(*(_certain_types(t, all_types) for t in term['alt']))
+    # A term without a state list only matches the empty state
+    state = term.get('state')
+    if state and isinstance(state[0], dict) and state[0].get('op') == 'any':
+        return frozenset([term.get('type')]) & all_types
+    return frozenset()
+
+
+def neighbor_filter(rule, n_types):
+    """Precomputed rejection test for a rule's first neighbor term.
+
+    Returns ({dir: (dx, dy)}, frozenset of acceptable neighbor type indices), or
+    None if lhs[1] is missing, has a state-dependent address, or accepts every type."""
+    lhs = rule['lhs']
+    if len(lhs) < 2:
+        return None
+    addr = lhs[1].get('addr', _DEFAULT_ADDR)
+    if addr['op'] not in ('absdir', 'reldir'):
+        return None
+    all_types = frozenset(range(n_types))
+    types = _possible_types(lhs[1], all_types)
+    if types == all_types:
+        return None
+    offsets = {d: _static_addr(addr, (0, 0), lookups.char_lookup['absDir'][d]) for d in lookups.dirs}
+    return offsets, types
+
+
+def _term_match_tables(term, n_types):
+    """(matches if state is empty, matches if state is non-empty) as boolean arrays over
+    type indices, or None if the term looks at more of the state than whether it is empty."""
+    op = term.get('op')
+    if op == 'any':
+        return np.ones(n_types, dtype=bool), np.ones(n_types, dtype=bool)
+    if op == 'negterm':
+        inner = _term_match_tables(term['term'], n_types)
+        return None if inner is None else (~inner[0], ~inner[1])
+    if op == 'alt':
+        tables = [_term_match_tables(t, n_types) for t in term['alt']]
+        if any(table is None for table in tables):
+            return None
+        return (np.logical_or.reduce([table[0] for table in tables]),
+                np.logical_or.reduce([table[1] for table in tables]))
+    if op is not None:
+        return None
+    empty, non_empty = np.zeros(n_types, dtype=bool), np.zeros(n_types, dtype=bool)
+    state = term.get('state', [])
+    if state and isinstance(state[0], dict) and state[0].get('op') == 'any':
+        empty[term['type']] = non_empty[term['type']] = True
+    elif not state:
+        empty[term['type']] = True
+    else:
+        return None
+    return empty, non_empty
+
+
+def _rhs_write(t):
+    """('type', type, state) | ('group', src) | ('prefix', src, state), or None if the
+    new cell's state depends on the match."""
+    op = t.get('op')
+    if op == 'group':
+        return 'group', t['group'] - 1
+    consts = [_compile_state_expr(s)[1] for s in t.get('state', [])]
+    if any(c is _NOT_CONST for c in consts):
+        return None
+    if op == 'prefix':
+        return 'prefix', t['group'] - 1, ''.join(consts)
+    if op is None:
+        return 'type', t['type'], ''.join(consts)
+    return None
+
+
+def _sync_plan(rule, n_types):
+    lhs, rhs = rule['lhs'], rule['rhs']
+    offsets, n_static = _static_offsets(lhs)
+    if n_static < len(lhs) or len(rhs) > len(lhs):
+        return None
+    tables = [_term_match_tables(term, n_types) for term in lhs]
+    writes = [_rhs_write(term) for term in rhs]
+    if None in tables or None in writes:
+        return None
+    if rule.get('score') and any(_lhs_pos_for_rhs_term(term) == 1 for term in rhs):
+        return None  # scoring adds metadata to the subject cell
+    return {
+        'offsets': np.array([offsets[d] for d in lookups.dirs], dtype=np.int64),
+        'matchEmpty': np.array([table[0] for table in tables]),
+        'matchNonEmpty': np.array([table[1] for table in tables]),
+        'writes': writes,
+    }
+
+
+def sync_plan(rule, n_types):
+    """Describe a sync rule as data for Board's vectorized sync engine, or return None.
+
+    Rules qualify when every LHS address is fixed, every LHS term depends only on
+    the cell type and on whether the state is empty, and every RHS cell is a type
+    with a constant state or a copy of an LHS cell. The plan holds per-direction
+    offsets ('offsets', shape (4, n_lhs, 2)), per-term match tables over types
+    ('matchEmpty', 'matchNonEmpty'), and the RHS 'writes'. Metadata is left to the
+    scalar path."""
+    try:
+        return _sync_plan(rule, n_types)
+    except _Unsupported:
+        return None
+
+
+def compile_rule(rule):
+    """Compile a rule from compile_types into fn(board, x, y, direction) -> updates or None,
+    equivalent to the interpreted transform_rule_update. Returns None if the rule
+    cannot be compiled, in which case the interpreter is used."""
+    try:
+        return _compile_rule(rule)
+    except _Unsupported:
+        return None
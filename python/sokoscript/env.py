@@ -12,17 +12,25 @@ except ImportError:
 
 import numpy as np
 from .board import Board
+from .rng import MersenneTwister
 from . import lookups
 
 
 def _board_to_observation(board, num_types):
     """Convert board cell types to one-hot observation array."""
     size = board.size
-    obs = np.zeros((size, size, num_types), dtype=np.float32)
-    for idx, cell in enumerate(board.cell):
-        y, x = divmod(idx, size)
-        obs[y, x, cell['type']] = 1.0
-    return obs
+    types = board.type_array().reshape(size, size)
+    return np.eye(num_types, dtype=np.float32)[types]
+
+
+def _type_obs_dtype(num_types):
+    """Smallest dtype for type-index observations, leaving room for one sentinel value."""
+    return np.uint8 if num_types < 256 else np.int16
+
+
+def _board_to_types(board, num_types):
+    """Board cell types as a (size, size) type-index observation."""
+    return board.type_array().reshape(board.size, board.size).astype(_type_obs_dtype(num_types))
 
 
 class SokoScriptEnv(gym.Env if HAS_GYM else object):
@@ -38,6 +46,14 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
         score_reward_scale: Multiplier for score-based reward.
         time_penalty: Penalty per time step.
         custom_reward_fn: Optional callable(old_board_json, new_board_json, action) -> float.
+        observation_mode: 'onehot' for (size, size, num_types) float32 one-hot observations,
+            or 'types' for a (size, size) grid of type indices (uint8, or int16 for
+            grammars with 256 or more types).
+        copy_obs: If False, step() and reset() return the env's persistent observation
+            buffer itself, which is updated in place on the next step or reset.
+        cache_initial_board: If True, build the initial board (running board_init_fn) once,
+            and reset by restoring a copy of it and reseeding its RNG. Only valid when
+            board_init_fn is deterministic and does not draw from the board RNG.
     """
 
     metadata = {'render_modes': ['ansi']}
@@ -45,7 +61,8 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
     def __init__(self, grammar, board_size=16, player_id='p1',
                  dt=0.1, max_steps=1000, board_init_fn=None,
                  score_reward_scale=1.0, time_penalty=0.0,
-                 custom_reward_fn=None, render_mode=None, seed=None):
+                 custom_reward_fn=None, render_mode=None, seed=None,
+                 observation_mode='onehot', copy_obs=True, cache_initial_board=False):
         if not HAS_GYM:
             raise ImportError("gymnasium not installed. Install with: pip install gymnasium")
 
@@ -62,6 +79,12 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
         self.custom_reward_fn = custom_reward_fn
         self.render_mode = render_mode
         self._seed = seed
+        if observation_mode not in ('onehot', 'types'):
+            raise ValueError(f"Unknown observation_mode: {observation_mode}")
+        self.observation_mode = observation_mode
+        self.copy_obs = copy_obs
+        self.cache_initial_board = cache_initial_board
+        self._initial_board = None
 
         # Create a temporary board to discover types and key bindings
         self._setup_board = Board({'size': board_size, 'grammar': grammar})
@@ -74,15 +97,29 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
             self.keys = ['w', 'a', 's', 'd']
 
         # Spaces
-        self.observation_space = spaces.Box(
-            low=0, high=1,
-            shape=(board_size, board_size, self.num_types),
-            dtype=np.float32
-        )
+        if observation_mode == 'types':
+            self.observation_space = spaces.Box(
+                low=0, high=self.num_types - 1,
+                shape=(board_size, board_size),
+                dtype=_type_obs_dtype(self.num_types)
+            )
+        else:
+            self.observation_space = spaces.Box(
+                low=0, high=1,
+                shape=(board_size, board_size, self.num_types),
+                dtype=np.float32
+            )
         self.action_space = spaces.Discrete(len(self.keys))
 
         self.board = None
         self.step_count = 0
+        # Observation buffers, updated only at cells the board reports as dirty.
+        # _obs_types holds the type index of every cell; in 'types' mode _obs is a view of it.
+        self._obs_types = np.zeros(board_size * board_size, dtype=_type_obs_dtype(self.num_types))
+        if observation_mode == 'types':
+            self._obs = self._obs_types.reshape(board_size, board_size)
+        else:
+            self._obs = np.zeros((board_size, board_size, self.num_types), dtype=np.float32)
 
     def _discover_keys(self):
         """Scan compiled grammar for key bindings."""
@@ -101,18 +138,61 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
         rng_seed = seed if seed is not None else self._seed
-        self.board = Board({
+        if self.cache_initial_board:
+            if self._initial_board is None:
+                self._initial_board = self._new_board(42)
+            if self.board is None:
+                self.board = self._initial_board.clone()
+            else:
+                self.board.restore(self._initial_board)
+            self.board.rng = MersenneTwister(rng_seed or 42)
+        else:
+            self.board = self._new_board(rng_seed or 42)
+        self.board.track_dirty_cells()
+        self.step_count = 0
+        self._last_score = self._get_score()
+        obs = self._observation()
+        info = {'type_counts': self.board.type_counts()}
+        return obs, info
+
+    def _use_obs_buffer(self, obs):
+        """Maintain observations in obs, e.g. one row of a batch buffer, instead of a private
+        buffer. obs must be C-contiguous with the observation space's shape and dtype."""
+        if obs.shape != self.observation_space.shape or obs.dtype != self.observation_space.dtype:
+            raise ValueError(f"Observation buffer must be {self.observation_space}, got {obs.shape} {obs.dtype}")
+        if not obs.flags.c_contiguous:
+            raise ValueError("Observation buffer must be C-contiguous")
+        obs[...] = 0
+        if self.observation_mode == 'types':
+            self._obs_types = obs.reshape(-1)
+        else:
+            self._obs_types = np.zeros_like(self._obs_types)
+        self._obs = obs
+        if self.board is not None:
+            self.board.track_dirty_cells()
+
+    def _observation(self):
+        dirty = self.board.dirty
+        if dirty:
+            indices = np.fromiter(dirty, dtype=np.intp, count=len(dirty))
+            dirty.clear()
+            types = self.board.type_array(indices)
+            if self.observation_mode == 'onehot':
+                flat = self._obs.reshape(-1, self.num_types)
+                flat[indices, self._obs_types[indices]] = 0
+                flat[indices, types] = 1
+            self._obs_types[indices] = types
+        return self._obs.copy() if self.copy_obs else self._obs
+
+    def _new_board(self, rng_seed):
+        board = Board({
             'size': self.board_size,
             'grammar': self.grammar,
-            'seed': rng_seed or 42,
+            'seed': rng_seed,
         })
         if self.board_init_fn:
-            self.board_init_fn(self.board)
-        self.step_count = 0
-        self._last_score = self._get_score()
-        obs = _board_to_observation(self.board, self.num_types)
-        info = {'type_counts': self.board.type_counts_including_unknowns()}
-        return obs, info
+            self.board_init_fn(board)
+        return board
 
     def step(self, action):
         assert self.board is not None, "Must call reset() before step()"
@@ -156,10 +236,10 @@ class SokoScriptEnv(gym.Env if HAS_GYM else object):
         if self.board.by_id.get(self.player_id) is None:
             terminated = True
 
-        obs = _board_to_observation(self.board, self.num_types)
+        obs = self._observation()
         info = {
             'score': new_score,
-            'type_counts': self.board.type_counts_including_unknowns(),
+            'type_counts': self.board.type_counts(),
             'step': self.step_count,
         }
 
@@ -0,0 +1,119 @@
+"""Process-wide cache of compiled grammars, keyed by a hash of the grammar source.
+
+Compiled grammars are shared between Boards and must be treated as read-only.
+An optional on-disk cache (a directory of pickles, set via set_cache_dir or the
+SOKOSCRIPT_GRAMMAR_CACHE_DIR environment variable) lets fresh worker processes
+skip parsing and compilation. Compiled rule closures cannot be pickled, so they
+are dropped on save and rebuilt with compile_rule on load.
+"""
+
+import hashlib
+import os
+import pickle
+import types
+from collections import OrderedDict
+
+from .compiler import compile_types
+from .engine import compile_rule
+from .parser import parse_or_undefined
+
+MAX_ENTRIES = 64
+# Bump when the compiled grammar layout changes, to invalidate on-disk entries.
+# 2: sync rules carry a syncPlan
+# 3: v2 pickles dropped the NumPy reconstructors of syncPlan arrays
+FORMAT_VERSION = 3
+
+_cache = OrderedDict()
+_cache_dir = os.environ.get('SOKOSCRIPT_GRAMMAR_CACHE_DIR') or None
+
+
+def grammar_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def set_cache_dir(path):
+    """Enable the on-disk cache in the given directory, or disable it with None."""
+    global _cache_dir
+    _cache_dir = path
+
+
+def clear():
+    _cache.clear()
+
+
+def compile_grammar(source, previous=None):
+    """Parse and compile grammar source, without caching. Invalid source gives an empty grammar.
+    previous is passed on to compile_types, to reuse the compiled rules of an earlier version."""
+    parsed = parse_or_undefined(source, error=False)
+    return compile_types(parsed if parsed else [], previous)
+
+
+def get_compiled_grammar(source, previous=None):
+    key = grammar_hash(source)
+    grammar = _cache.get(key)
+    if grammar is not None:
+        _cache.move_to_end(key)
+        return grammar
+    grammar = _load(key) if _cache_dir else None
+    if grammar is None:
+        grammar = compile_grammar(source, previous)
+        if _cache_dir:
+            _save(key, grammar)
+    _cache[key] = grammar
+    if len(_cache) > MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return grammar
+
+
+def _path(key):
+    return os.path.join(_cache_dir, f'{key}.v{FORMAT_VERSION}.pickle')
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler that writes the grammar's compiled rule closures as placeholders."""
+
+    def __init__(self, file, grammar, **kwargs):
+        super().__init__(file, **kwargs)
+        self._closures = {id(rule['compiledUpdate']) for rule in _all_rules(grammar)
+                          if rule.get('compiledUpdate') is not None}
+
+    def persistent_id(self, obj):
+        return 'compiledUpdate' if isinstance(obj, types.FunctionType) and id(obj) in self._closures else None
+
+
+class _Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return None
+
+
+def _all_rules(grammar):
+    for rules in grammar['transform']:
+        yield from rules
+    for transform in grammar['syncTransform']:
+        for rules in transform:
+            yield from rules
+
+
+def _save(key, grammar):
+    # Write to a temporary file and rename, so concurrent workers never see a partial pickle.
+    try:
+        os.makedirs(_cache_dir, exist_ok=True)
+        path = _path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            _Pickler(f, grammar, protocol=pickle.HIGHEST_PROTOCOL).dump(grammar)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _load(key):
+    try:
+        with open(_path(key), 'rb') as f:
+            grammar = _Unpickler(f).load()
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError, ValueError):
+        return None  # missing, partial, or written by incompatible code: recompile
+    for rule in _all_rules(grammar):
+        if 'compiledUpdate' in rule:
+            rule['compiledUpdate'] = compile_rule(rule)
+    return grammar
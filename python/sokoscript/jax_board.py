@@ -3,6 +3,8 @@
 Stores cell types and states as JAX arrays. Toroidal access via modular arithmetic.
 """
 
+import copy
+
 try:
     import jax
     import jax.numpy as jnp
@@ -14,11 +16,37 @@ import numpy as np
 from .board import Board, RangeCounter, _random_int, _random_big_int, _knuth_shuffle
 from .rng import MersenneTwister, fast_ln_left_shift_26, fast_ln_left_shift_26_max
 from .engine import transform_rule_update
+from .jax_engine import compile_state_sync_step, compile_sync_run, compile_sync_step
 from . import lookups
 
 MAX_STATE_LEN = 64
 
 
+def _encode_states(states):
+    """Encode state strings as (uint8[n, MAX_STATE_LEN] char codes, uint8[n] lengths),
+    truncating to MAX_STATE_LEN."""
+    chars = np.array(states, dtype=f'U{MAX_STATE_LEN}').reshape(-1)
+    codes = chars.view(np.uint32).reshape(len(chars), MAX_STATE_LEN).astype(np.uint8)
+    return codes, np.char.str_len(chars).astype(np.uint8)
+
+
+def _decode_states(codes):
+    """Inverse of _encode_states for NUL-padded uint8[n, MAX_STATE_LEN] codes; decodes
+    each distinct state once."""
+    padded = np.ascontiguousarray(codes, dtype=np.uint8).view(f'S{MAX_STATE_LEN}').reshape(-1)
+    unique, inverse = np.unique(padded, return_inverse=True)
+    decoded = [b.decode('latin-1') for b in unique.tolist()]
+    return [decoded[i] for i in inverse.reshape(-1).tolist()]
+
+
+if HAS_JAX:
+    @jax.jit
+    def _scatter_cells(cell_types, cell_states, cell_state_lens, rows, cols, types, states, lens):
+        return (cell_types.at[rows, cols].set(types),
+                cell_states.at[rows, cols].set(states),
+                cell_state_lens.at[rows, cols].set(lens))
+
+
 class JAXBoardState:
     """JAX array representation of board state.
 
@@ -45,13 +73,26 @@ class JAXBoardState:
         return ''.join(chr(int(c)) for c in codes)
 
     def set_cell(self, x, y, type_idx, state=''):
-        row, col = y % self.size, x % self.size
-        self.cell_types = self.cell_types.at[row, col].set(type_idx)
-        state_codes = np.zeros(MAX_STATE_LEN, dtype=np.uint8)
-        for i, c in enumerate(state[:MAX_STATE_LEN]):
-            state_codes[i] = ord(c)
-        self.cell_states = self.cell_states.at[row, col].set(jnp.array(state_codes))
-        self.cell_state_lens = self.cell_state_lens.at[row, col].set(min(len(state), MAX_STATE_LEN))
+        self.set_cells([(y % self.size) * self.size + x % self.size], [type_idx], [state])
+
+    def set_cells(self, indices, types, states):
+        """Write cells at distinct flat indices (y * size + x) in one jitted scatter.
+
+        The batch is padded to a power of two by repeating its last cell, so the
+        scatter is compiled for O(log(size^2)) distinct batch sizes."""
+        indices = np.asarray(indices, dtype=np.int32)
+        n = len(indices)
+        if n == 0:
+            return
+        codes, lens = _encode_states(states)
+        types = np.asarray(types, dtype=np.uint8)
+        pad = (1 << (n - 1).bit_length()) - n
+        if pad:
+            indices, types, codes, lens = (np.concatenate([a, np.repeat(a[-1:], pad, axis=0)])
+                                           for a in (indices, types, codes, lens))
+        rows, cols = np.divmod(indices, self.size)
+        self.cell_types, self.cell_states, self.cell_state_lens = _scatter_cells(
+            self.cell_types, self.cell_states, self.cell_state_lens, rows, cols, types, codes, lens)
 
     def type_counts(self, num_types):
         """Count cells of each type using jnp.bincount."""
@@ -66,82 +107,216 @@ class JAXBoardState:
     def from_board(cls, board):
         """Create JAXBoardState from a pure-Python Board."""
         state = cls(board.size)
-        types = np.zeros((board.size, board.size), dtype=np.uint8)
-        states = np.zeros((board.size, board.size, MAX_STATE_LEN), dtype=np.uint8)
-        lens = np.zeros((board.size, board.size), dtype=np.uint8)
-
-        for idx, cell in enumerate(board.cell):
-            y, x = divmod(idx, board.size)
-            x, y = idx % board.size, idx // board.size
-            types[y, x] = cell['type']
-            s = cell['state']
-            lens[y, x] = len(s)
-            for i, c in enumerate(s[:MAX_STATE_LEN]):
-                states[y, x, i] = ord(c)
-
-        state.cell_types = jnp.array(types)
-        state.cell_states = jnp.array(states)
-        state.cell_state_lens = jnp.array(lens)
+        shape = (board.size, board.size)
+        if board.storage == 'array':
+            # encode each interned state once, then gather by state id
+            table_codes, table_lens = _encode_states(board.cell.states)
+            codes, lens = table_codes[board.cell.state_ids_np], table_lens[board.cell.state_ids_np]
+        else:
+            codes, lens = _encode_states([cell['state'] for cell in board.cell])
+        state.cell_types = jnp.asarray(board.type_array().astype(np.uint8).reshape(shape))
+        state.cell_states = jnp.asarray(codes.reshape(*shape, MAX_STATE_LEN))
+        state.cell_state_lens = jnp.asarray(lens.reshape(shape))
         return state
 
     def to_board_cells(self, grammar_types):
         """Convert back to list of cell dicts for a pure-Python Board."""
-        size = self.size
-        types_np = np.array(self.cell_types)
-        states_np = np.array(self.cell_states)
-        lens_np = np.array(self.cell_state_lens)
-        cells = []
-        for y in range(size):
-            for x in range(size):
-                t = int(types_np[y, x])
-                slen = int(lens_np[y, x])
-                s = ''.join(chr(int(states_np[y, x, i])) for i in range(slen))
-                cells.append({'type': t, 'state': s})
-        return cells
+        types = np.asarray(self.cell_types).reshape(-1).tolist()
+        states = _decode_states(np.asarray(self.cell_states).reshape(-1, MAX_STATE_LEN))
+        return [{'type': t, 'state': s} for t, s in zip(types, states)]
 
 
 class JAXBoard(Board):
     """Board that maintains a parallel JAX array representation.
 
-    Sync rules use JAX for parallel execution. Async rules use the
-    pure-Python path but update the JAX state.
+    Async rules use the pure-Python path. Changed cells are buffered and
+    written to the JAX state in one scatter at the end of each
+    evolve_to_time call, or when the JAX state is next read.
+
+    With jax_sync set, sync ticks run as one jitted jax_engine step whenever
+    all their rules can, storage is 'array' and no cell has metadata: on
+    cell types alone (see compile_sync_step) while every state is empty,
+    and otherwise on states of up to the next power of two above the
+    longest ASCII state (see compile_state_sync_step). Other ticks, and
+    ticks the state step flags as failed, fall back to the Board path. Each
+    jitted tick draws its PRNG key from the board's RNG, so runs are
+    reproducible, but they differ draw for draw from a plain Board.
     """
 
+    jax_sync = False
+
     def __init__(self, opts=None):
         self._jax_state = None
+        self._jax_pending = set()
+        self._jax_sync_steps = {}
         super().__init__(opts)
 
     def init_grammar(self, grammar):
         super().init_grammar(grammar)
+        self._jax_sync_steps = {}
         if HAS_JAX:
             self._jax_state = JAXBoardState(self.size)
             self._sync_jax_from_python()
 
-    def set_cell(self, x, y, new_value):
-        super().set_cell(x, y, new_value)
-        if self._jax_state is not None:
-            state = new_value.get('state', '')
-            if len(state) > self.max_state_len:
-                state = state[:self.max_state_len]
-            self._jax_state.set_cell(x, y, new_value['type'], state)
+    def init_from_binary(self, data):
+        super().init_from_binary(data)
+        self._sync_jax_from_python()
+
+    def update_grammar(self, grammar):
+        super().update_grammar(grammar)
+        self._jax_sync_steps = {}  # compiled for the old grammar's rules
+
+    def _copy_from(self, other):
+        super()._copy_from(other)
+        # JAX arrays are immutable and JAXBoardState rebinds them on update,
+        # so a shallow copy is independent.
+        self._jax_state = copy.copy(other._jax_state)
+        self._jax_pending = set(other._jax_pending)
+        self._jax_sync_steps = other._jax_sync_steps  # compiled steps are pure, so share them
 
     def set_cell_by_index(self, index, new_value):
         super().set_cell_by_index(index, new_value)
         if self._jax_state is not None:
-            x, y = self.index2xy(index)
-            state = new_value.get('state', '')
-            self._jax_state.set_cell(x, y, new_value['type'], state)
+            self._jax_pending.add(index)
+
+    def _set_cells_bulk(self, indices, new_types, new_state_ids):
+        super()._set_cells_bulk(indices, new_types, new_state_ids)
+        if self._jax_state is not None:
+            self._jax_pending.update(indices.tolist())
+
+    def _apply_sync_rules(self, sync_categories):
+        step = self._jax_sync_step(sync_categories) if self._jax_sync_ready() else None
+        if step is not None:
+            self._flush_jax()
+            self._set_types_from_jax(step(self._jax_state.cell_types, jax.random.PRNGKey(np.uint32(self.rng.int()))))
+        elif not self._apply_jax_state_sync(sync_categories):
+            super()._apply_sync_rules(sync_categories)
+
+    def _jax_sync_ready(self, states=False):
+        """Whether a sync tick can run in JAX: on cell types alone, or with states set,
+        on cell types and states."""
+        return (self.jax_sync and self.storage == 'array' and self._jax_state is not None and
+                not self.cell.meta and (states or not self.cell.state_ids_np.any()))
+
+    def _apply_jax_state_sync(self, sync_categories):
+        """Run a sync tick with the state-aware JAX step. Returns False, leaving the
+        board untouched, if the tick has to run on the Board path instead."""
+        if not self._jax_sync_ready(states=True) or self.max_state_len > MAX_STATE_LEN:
+            return False
+        in_use = [self.cell.states[i] for i in np.unique(self.cell.state_ids_np).tolist()]
+        if not ''.join(in_use).isascii():
+            return False
+        width = min(max(8, 1 << max(map(len, in_use)).bit_length()), MAX_STATE_LEN)
+        key = ('state', tuple(sync_categories), width)
+        if key not in self._jax_sync_steps:
+            self._jax_sync_steps[key] = compile_state_sync_step(
+                self.grammar, sync_categories, self.size, width, self.max_state_len)
+        step = self._jax_sync_steps[key]
+        if step is None:
+            return False
+        self._flush_jax()
+        state = self._jax_state
+        new_types, new_codes, new_lens, failed = step(
+            state.cell_types, state.cell_states[..., :width], state.cell_state_lens,
+            jax.random.PRNGKey(np.uint32(self.rng.int())))
+        if failed:
+            return False
+        old_types = np.asarray(state.cell_types).reshape(-1)
+        old_codes = np.asarray(state.cell_states[..., :width]).reshape(-1, width)
+        old_lens = np.asarray(state.cell_state_lens).reshape(-1)
+        types = np.asarray(new_types).reshape(-1)
+        codes, lens = np.asarray(new_codes).reshape(-1, width), np.asarray(new_lens).reshape(-1)
+        changed = np.flatnonzero((old_types != types) | (old_lens != lens) | (old_codes != codes).any(axis=1))
+        state.cell_types = new_types
+        state.cell_states = state.cell_states.at[..., :width].set(new_codes)
+        state.cell_state_lens = new_lens
+        if len(changed):
+            padded = np.zeros((len(changed), MAX_STATE_LEN), dtype=np.uint8)
+            padded[:, :width] = codes[changed]
+            intern = self.cell.intern_state
+            state_ids = np.array([intern(s) for s in _decode_states(padded)], dtype=np.uint32)
+            # the JAX state is already up to date, so bypass _jax_pending
+            Board._set_cells_bulk(self, changed, types[changed], state_ids)
+        return True
+
+    def _jax_sync_step(self, sync_categories):
+        key = tuple(sync_categories)
+        if key not in self._jax_sync_steps:
+            self._jax_sync_steps[key] = compile_sync_step(self.grammar, sync_categories, self.size)
+        return self._jax_sync_steps[key]
+
+    def _set_types_from_jax(self, new_types):
+        """Adopt new JAX cell types, updating the Board's cells and indices to match."""
+        old_types = np.asarray(self._jax_state.cell_types).reshape(-1)
+        self._jax_state.cell_types = new_types
+        new_types = np.asarray(new_types).reshape(-1)
+        changed = np.flatnonzero(old_types != new_types)
+        if len(changed):
+            # the JAX state is already up to date, so bypass _jax_pending
+            Board._set_cells_bulk(self, changed, new_types[changed], 0)
+
+    def _evolve_sync_ticks(self, t):
+        """For grammars without async rules, run every sync tick up to time t in one jitted
+        call, drawing the same seeds as ticking one at a time through _apply_sync_rules.
+        Skipped while a journal is recording, which needs each tick as its own event."""
+        grammar = self.grammar
+        if (any(grammar['rateByType']) or not grammar['syncPeriods'] or self.journal is not None
+                or not self._jax_sync_ready()):
+            return
+        ticks, tick_time = [], self.time
+        while True:
+            next_sync_times = [p + tick_time - (tick_time % p) for p in grammar['syncPeriods']]
+            if min(next_sync_times) > t:
+                break
+            tick_time = min(next_sync_times)
+            ticks.append(tuple(n for n in grammar['syncCategories'] if next_sync_times[n] == tick_time))
+        if not ticks:
+            return
+        category_sets = tuple(sorted(set(ticks)))
+        key = ('run', category_sets)
+        if key not in self._jax_sync_steps:
+            self._jax_sync_steps[key] = compile_sync_run(grammar, category_sets, self.size)
+        run = self._jax_sync_steps[key]
+        if run is None:
+            return
+        n = len(ticks)
+        padded = 1 << (n - 1).bit_length()
+        seeds = np.zeros(padded, dtype=np.uint32)
+        seeds[:n] = self.rng.ints(n)
+        branch_ids = np.zeros(padded, dtype=np.int32)
+        branch_ids[:n] = [category_sets.index(cats) for cats in ticks]
+        self._flush_jax()
+        self._set_types_from_jax(run(self._jax_state.cell_types, seeds, branch_ids, n))
+        self.time = self.last_event_time = tick_time
+
+    def evolve_to_time(self, t, hard_stop=False):
+        self._evolve_sync_ticks(t)
+        super().evolve_to_time(t, hard_stop)
+        self._flush_jax()
+
+    def _flush_jax(self):
+        """Write buffered cell changes to the JAX state."""
+        if not self._jax_pending:
+            return
+        indices = np.fromiter(self._jax_pending, dtype=np.intp, count=len(self._jax_pending))
+        self._jax_pending.clear()
+        cells = [self.cell[i] for i in indices.tolist()]
+        self._jax_state.set_cells(indices, self.type_array(indices), [cell['state'] for cell in cells])
 
     def _sync_jax_from_python(self):
         """Rebuild JAX state from Python cells."""
         if self._jax_state is not None:
             self._jax_state = JAXBoardState.from_board(self)
+            self._jax_pending.clear()
 
     def get_jax_state(self):
+        if self._jax_state is not None:
+            self._flush_jax()
         return self._jax_state
 
     def get_observation(self):
         """Get one-hot observation suitable for RL: (size, size, num_types) float32."""
         if self._jax_state is not None:
+            self._flush_jax()
             return self._jax_state.to_one_hot(len(self.grammar['types']))
         return None
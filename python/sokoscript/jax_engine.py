@@ -3,16 +3,36 @@
 For sync rules with fixed addresses (the common case), we can vectorize
 the pattern matching and rule application across all cells simultaneously
 using jnp.roll for neighbor access.
+
+compile_sync_step turns every sync rule of a set of sync categories into one
+jitted step(cell_types, key) -> cell_types that runs a whole sync tick.
+compile_state_sync_step does the same for rules that read and write cell
+states, evaluating state-char expressions over the whole board with the
+dense lookups.char_perm_array tables.
+BatchSimulator advances a batch of boards in lockstep with jax.vmap, with an
+opt-in, non-exact tau-leaping approximation for async rules.
 """
 
+import math
+
+import numpy as np
+
+from . import lookups
+from .engine import (_NOT_CONST, _char_class_set, _compile_state_expr, _lhs_pos_for_rhs_term,
+                     _static_offsets, sync_plan)
+
 try:
     import jax
     import jax.numpy as jnp
+    from jax import lax
     from functools import partial
     HAS_JAX = True
 except ImportError:
     HAS_JAX = False
 
+# write_src codes in sync_step_tables
+_WRITE_NONE, _WRITE_TYPE = -2, -1
+
 
 def classify_rule(rule):
     """Classify a rule as 'simple' (fixed addresses, no complex state matching)
@@ -81,3 +101,719 @@ if HAS_JAX:
         """
         match = cell_types == subject_type
         return jnp.where(match, new_type, cell_types)
+
+
+def _plan_tables(plans, n_types):
+    """Stack rule plans into (offsets[R, 4, L, 2], match[R, L, n_types], write_src[R, L],
+    write_type[R, L]), or return None if a plan writes a non-empty state."""
+    if any(write[0] != 'group' and write[-1] for plan in plans for write in plan['writes']):
+        return None
+    n_rules, n_terms = len(plans), max(plan['offsets'].shape[1] for plan in plans)
+    offsets = np.zeros((n_rules, 4, n_terms, 2), dtype=np.int32)
+    match = np.ones((n_rules, n_terms, n_types), dtype=bool)
+    write_src = np.full((n_rules, n_terms), _WRITE_NONE, dtype=np.int32)
+    write_type = np.zeros((n_rules, n_terms), dtype=np.int32)
+    for r, plan in enumerate(plans):
+        n_lhs = plan['offsets'].shape[1]
+        offsets[r, :, :n_lhs] = plan['offsets']
+        match[r, :n_lhs] = plan['matchEmpty']
+        for pos, write in enumerate(plan['writes']):
+            if write[0] == 'type':
+                write_src[r, pos], write_type[r, pos] = _WRITE_TYPE, write[1]
+            else:
+                write_src[r, pos] = write[1]
+    return offsets, match, write_src, write_type
+
+
+def sync_step_tables(grammar, sync_categories):
+    """Describe the sync rules of sync_categories as dense arrays for compile_sync_step,
+    or return None if any of them cannot run on cell types alone.
+
+    Every rule needs a syncPlan (see engine.sync_plan) that writes only empty
+    states, so a board whose states are all empty keeps them empty. Rules are
+    padded to the longest LHS with terms that match anything at the subject cell.
+    Returns (subject_types[R], offsets[R, 4, L, 2], match[R, L, n_types],
+    write_src[R, L], write_type[R, L]), where write_src is the LHS position copied
+    by each RHS cell, _WRITE_TYPE for a constant type or _WRITE_NONE for no write.
+    """
+    plans, subject_types = [], []
+    for n_sync in sync_categories:
+        for n_type in grammar['typesBySyncCategory'][n_sync]:
+            for rule in grammar['syncTransform'][n_sync][n_type]:
+                if rule.get('syncPlan') is None:
+                    return None
+                plans.append(rule['syncPlan'])
+                subject_types.append(n_type)
+    tables = _plan_tables(plans, len(grammar['types'])) if plans else None
+    if tables is None:
+        return None
+    return (np.array(subject_types, dtype=np.int32), *tables)
+
+
+def _async_rules(grammar):
+    """The async rules with a nonzero rate, as (rules, rule_ids[n_types, K], rates[n_types, K])
+    (see async_rule_tables), or None if there are none."""
+    n_types = len(grammar['types'])
+    rules, by_type = [], []
+    for n_type in range(n_types):
+        row = []
+        for rule in grammar['transform'][n_type]:
+            if rule['rate_Hz']:
+                row.append((len(rules), rule['rate_Hz'] * (rule['acceptProb_leftShift30'] + 1) / (1 << 30)))
+                rules.append(rule)
+        by_type.append(row)
+    if not rules:
+        return None
+    width = max(len(row) for row in by_type)
+    rule_ids = np.zeros((n_types, width), dtype=np.int32)
+    rates = np.zeros((n_types, width), dtype=np.float32)
+    for n_type, row in enumerate(by_type):
+        for k, (rule_id, rate) in enumerate(row):
+            rule_ids[n_type, k], rates[n_type, k] = rule_id, rate
+    return rules, rule_ids, rates
+
+
+def async_rule_tables(grammar):
+    """Describe the async rules of a grammar for BatchSimulator's tau-leaping, or return
+    None if any rule with a nonzero rate cannot run on cell types alone.
+
+    Returns (rule_ids[n_types, K], rates[n_types, K], offsets, match, write_src,
+    write_type): row t of rule_ids / rates lists the async rules of type t, as
+    indices into the rule tables (see sync_step_tables), with their effective rates
+    in events per second per cell (rate_Hz times the acceptance probability), padded
+    with rate 0.
+    """
+    n_types = len(grammar['types'])
+    async_rules = _async_rules(grammar)
+    if async_rules is None:
+        return None
+    rules, rule_ids, rates = async_rules
+    plans = [sync_plan(rule, n_types) for rule in rules]
+    if None in plans:
+        return None
+    tables = _plan_tables(plans, n_types)
+    if tables is None:
+        return None
+    return (rule_ids, rates, *tables)
+
+
+def _type_rule_set(offsets, match, write_src, write_type):
+    """(offsets, match_fn, write_fn) for _apply_items over cells (types,), from rule tables."""
+    term_ids = jnp.arange(offsets.shape[2])
+
+    def match_fn(old, item_rule, dirs):
+        types, = old
+        return match[item_rule[:, None], term_ids, types].all(axis=1), False
+
+    def write_fn(old, item_rule, dirs):
+        types, = old
+        src = write_src[item_rule]
+        new = jnp.where(src >= 0, jnp.take_along_axis(types, jnp.maximum(src, 0), axis=1), write_type[item_rule])
+        return (new,), src != _WRITE_NONE, False
+
+    return offsets, match_fn, write_fn
+
+
+class _Unsupported(Exception):
+    """A rule uses something the state-aware kernels cannot evaluate."""
+
+
+# Char codes in the state kernels: ord(c), _NONE for a char past the end of a state
+# (None in Matcher), _ERROR for an expression Matcher could not evaluate.
+_NONE, _ERROR = -1, -2
+
+
+class _Items:
+    """The footprint cells of a batch of items, seen by compiled state expressions."""
+
+    def __init__(self, old, dirs):
+        self.types, self.codes, self.lens = old
+        self.dirs = dirs
+        self.tails = None
+
+    def char(self, g, i):
+        if i >= self.codes.shape[2]:
+            return jnp.full(self.lens.shape[:1], _NONE)
+        return jnp.where(i < self.lens[:, g], self.codes[:, g, i], _NONE)
+
+
+def _char_index(code):
+    """(valid, index into the lookups.char_perm_array tables) for char codes."""
+    valid = (code >= lookups.FIRST_CHAR) & (code < lookups.FIRST_CHAR + lookups.N_CHARS)
+    return valid, jnp.clip(code - lookups.FIRST_CHAR, 0, lookups.N_CHARS - 1)
+
+
+def _literal_code(c):
+    if not isinstance(c, str) or len(c) != 1 or ord(c) > 0xFF:
+        raise _Unsupported(c)
+    return ord(c)
+
+
+def _state_char_expr(t, locations, n_groups):
+    """Compile a state-char expression to fn(items) -> int32 char codes, like
+    engine._compile_state_expr, for a term that can see the first n_groups LHS cells.
+    locations[g][d] is the char of the address of LHS term g in direction index d."""
+    value = _compile_state_expr(t)[1]
+    if value is not _NOT_CONST:
+        code = _literal_code(value)
+        return lambda items: jnp.int32(code)
+    op = t.get('op')
+    if op in ('clock', 'anti', '*'):
+        table = jnp.asarray(lookups.char_perm_array['rotate'][op] if op != '*' else
+                            lookups.char_perm_array['matMul'][t['left']['matrix']], dtype=jnp.int32)
+        arg = _state_char_expr(t['arg'] if op != '*' else t['right'], locations, n_groups)
+
+        def unary(items):
+            valid, index = _char_index(arg(items))
+            return jnp.where(valid, table[index] + lookups.FIRST_CHAR, _ERROR)
+        return unary
+    if op in ('add', 'sub', '+', '-'):
+        table = jnp.asarray(lookups.char_perm_array[{'add': 'intAdd', 'sub': 'intSub', '+': 'vecAdd',
+                                                     '-': 'vecSub'}[op]], dtype=jnp.int32)
+        left = _state_char_expr(t['left'], locations, n_groups)
+        right = _state_char_expr(t['right'], locations, n_groups)
+
+        def binary(items):
+            left_valid, left_index = _char_index(left(items))
+            right_valid, right_index = _char_index(right(items))
+            return jnp.where(left_valid & right_valid, table[right_index, left_index] + lookups.FIRST_CHAR, _ERROR)
+        return binary
+    if op == 'location':
+        g = t['group'] - 1
+        if g >= n_groups:
+            raise _Unsupported(t)
+        codes = jnp.asarray([ord(c) for c in locations[g]], dtype=jnp.int32)
+        return lambda items: codes[items.dirs]
+    if op == 'reldir':
+        table = lookups.char_perm_lookup['matMul'][t['dir']]
+        codes = jnp.asarray([ord(table[lookups.char_lookup['absDir'][d]]) for d in lookups.dirs], dtype=jnp.int32)
+        return lambda items: codes[items.dirs]
+    if op == 'state':
+        g, i = t['group'] - 1, t['char'] - 1
+        if g >= n_groups:
+            raise _Unsupported(t)
+        return lambda items: items.char(g, i)
+    raise _Unsupported(t)
+
+
+def _state_char_test(s, locations, n_groups):
+    """Compile an LHS state char to fn(items, code) -> (match, error), or None for the
+    match-the-rest wildcard, like engine._compile_state_char_test."""
+    if isinstance(s, str) or s.get('op') == 'char':
+        code = _literal_code(s if isinstance(s, str) else s['char'])
+        return lambda items, c: (c == code, False)
+    op = s.get('op')
+    if op == 'wild':
+        return lambda items, c: (c != _NONE, False)
+    if op == 'any':
+        return None
+    if op in ('class', 'negated'):
+        chars = jnp.asarray([_literal_code(ch) for ch in _char_class_set(s['chars'])] or [0x100],
+                            dtype=jnp.int32)
+        if op == 'class':
+            return lambda items, c: ((c[:, None] == chars).any(axis=1), False)
+        return lambda items, c: ((c != _NONE) & (c[:, None] != chars).all(axis=1), False)
+    expr = _state_char_expr(s, locations, n_groups)
+
+    def expr_test(items, c):
+        value = expr(items)
+        return value == c, value == _ERROR
+    return expr_test
+
+
+def _lhs_term_test(t, pos, locations):
+    """Compile the LHS term at pos to fn(items) -> (match, error), like engine._compile_lhs_term.
+    error marks items where Matcher would raise before deciding."""
+    op = t.get('op')
+    if op == 'any':
+        return lambda items: (True, False)
+    if op == 'negterm':
+        inner = _lhs_term_test(t['term'], pos, locations)
+
+        def negterm(items):
+            ok, error = inner(items)
+            return ~jnp.asarray(ok), error
+        return negterm
+    if op == 'alt':
+        alts = [_lhs_term_test(a, pos, locations) for a in t['alt']]
+
+        def alt(items):
+            ok, error = False, False
+            for a in alts:
+                a_ok, a_error = a(items)
+                error = error | (~jnp.asarray(ok) & a_error)
+                ok = ok | a_ok
+            return ok, error
+        return alt
+    if op is not None:
+        raise _Unsupported(t)
+    term_type = t['type']
+    state_list = t.get('state')
+    if state_list is None:
+        return lambda items: ((items.types[:, pos] == term_type) & (items.lens[:, pos] == 0), False)
+    tests = [_state_char_test(s, locations, pos) for s in state_list]
+
+    def typed(items):
+        alive = items.types[:, pos] == term_type
+        error = False
+        for n, test in enumerate(tests):
+            if test is None:
+                return alive, error
+            ok, char_error = test(items, items.char(pos, n))
+            error = error | (alive & char_error)
+            alive = alive & ok
+        return alive & (items.lens[:, pos] == len(tests)), error
+    return typed
+
+
+def _rhs_term_write(t, locations, n_lhs, width, max_state_len):
+    """Compile an RHS term to fn(items) -> (type, codes[M, width], len, bad), like
+    engine._compile_rhs_term. bad marks a state Matcher could not build, or one longer
+    than width but not cut to max_state_len by Board.set_cell."""
+    op = t.get('op')
+    if op == 'group':
+        src = t['group'] - 1
+        return lambda items: (items.types[:, src], items.codes[:, src], items.lens[:, src], False)
+    state_list = list(t.get('state', []))
+    tail = None
+    if state_list and isinstance(state_list[-1], dict) and state_list[-1].get('op') == 'tail':
+        tail = state_list.pop()['group'] - 1
+    chars = [_state_char_expr(s, locations, n_lhs) for s in state_list]
+    if len(chars) > width or (tail is not None and tail >= n_lhs):
+        raise _Unsupported(t)
+    n_chars = len(chars)
+    columns = jnp.arange(width)
+    if op == 'prefix':
+        src = t['group'] - 1
+        new_type = lambda items: items.types[:, src]  # noqa: E731
+    elif op is None:
+        term_type = t['type']
+        new_type = lambda items: jnp.full(items.dirs.shape, term_type)  # noqa: E731
+    else:
+        raise _Unsupported(t)
+
+    def write(items):
+        n_items = items.dirs.shape[0]
+        codes = jnp.zeros((n_items, width), dtype=jnp.int32)
+        bad = jnp.zeros(n_items, dtype=bool)
+        for i, char in enumerate(chars):
+            code = jnp.broadcast_to(char(items), (n_items,))
+            codes = codes.at[:, i].set(code)
+            bad = bad | (code < 0)
+        length = jnp.full(n_items, n_chars)
+        if tail is not None:
+            start = items.tails[:, tail]
+            src_len = items.lens[:, tail]
+            src_col = start[:, None] + columns - n_chars
+            in_tail = (columns >= n_chars) & (src_col < src_len[:, None])
+            tail_codes = jnp.take_along_axis(items.codes[:, tail], jnp.clip(src_col, 0, width - 1), axis=1)
+            codes = jnp.where(in_tail, tail_codes, codes)
+            length = length + jnp.maximum(src_len - start, 0)
+        if width < max_state_len:
+            bad = bad | (length > width)
+        return new_type(items), codes, jnp.minimum(length, width), bad
+    return write
+
+
+def _state_rule(rule, width, max_state_len):
+    lhs, rhs = rule['lhs'], rule['rhs']
+    offsets, n_static = _static_offsets(lhs)
+    if n_static < len(lhs) or len(rhs) > len(lhs):
+        raise _Unsupported(rule)
+    if rule.get('score') and any(_lhs_pos_for_rhs_term(term) == 1 for term in rhs):
+        raise _Unsupported(rule)  # scoring adds metadata to the subject cell
+    locations = [[lookups.vec2char(offsets[d][g]) for d in lookups.dirs] for g in range(len(lhs))]
+    tests = [_lhs_term_test(term, pos, locations) for pos, term in enumerate(lhs)]
+    tail_starts = []
+    for term in lhs:
+        state_list = term.get('state', [])
+        is_tail = state_list and isinstance(state_list[-1], dict) and state_list[-1].get('op') == 'any'
+        tail_starts.append(len(state_list) - 1 if is_tail else None)
+    writes = [_rhs_term_write(term, locations, len(lhs), width, max_state_len) for term in rhs]
+    return np.array([offsets[d] for d in lookups.dirs], dtype=np.int32), tests, tail_starts, writes
+
+
+def state_rule_set(rules, width, max_state_len=64):
+    """Compile rules for the state-aware kernels, which see cells as (types, codes, lens)
+    with states as int32 char codes[.., width] and lengths; or return None if any rule
+    cannot be compiled.
+
+    Every LHS address must be fixed, and state expressions are evaluated with the
+    lookups.char_perm_array tables. Rules that add metadata (score on the subject
+    cell) are not supported. A matched item flags the tick as failed if Matcher would
+    have raised, or if it writes a state longer than width (states longer than
+    max_state_len are cut, as in Board.set_cell). Returns (offsets, match_fn,
+    write_fn) for _apply_items.
+    """
+    try:
+        compiled = [_state_rule(rule, width, max_state_len) for rule in rules]
+    except _Unsupported:
+        return None
+    n_rules, n_terms = len(compiled), max(len(tests) for _, tests, _, _ in compiled)
+    offsets = np.zeros((n_rules, 4, n_terms, 2), dtype=np.int32)
+    for r, (rule_offsets, _, _, _) in enumerate(compiled):
+        offsets[r, :, :rule_offsets.shape[1]] = rule_offsets
+
+    def match_fn(old, item_rule, dirs):
+        items = _Items(old, dirs)
+        matched = jnp.zeros(item_rule.shape, dtype=bool)
+        error = jnp.zeros(item_rule.shape, dtype=bool)
+        for r, (_, tests, _, _) in enumerate(compiled):
+            alive, rule_error = jnp.ones(item_rule.shape, dtype=bool), False
+            for test in tests:
+                ok, term_error = test(items)
+                rule_error = rule_error | (alive & term_error)
+                alive = alive & ok
+            matched = jnp.where(item_rule == r, alive, matched)
+            error = jnp.where(item_rule == r, rule_error, error)
+        return matched, error
+
+    def write_fn(old, item_rule, dirs):
+        items = _Items(old, dirs)
+        types, codes, lens = (jnp.zeros_like(a) for a in old)
+        mask = jnp.zeros(types.shape, dtype=bool)
+        bad = jnp.zeros(item_rule.shape, dtype=bool)
+        for r, (_, _, tail_starts, writes) in enumerate(compiled):
+            items.tails = jnp.stack([items.lens[:, pos] if start is None else jnp.full(item_rule.shape, start)
+                                     for pos, start in enumerate(tail_starts)], axis=1)
+            selected = item_rule == r
+            for pos, write in enumerate(writes):
+                new_type, new_codes, new_len, write_bad = write(items)
+                types = types.at[:, pos].set(jnp.where(selected, new_type, types[:, pos]))
+                codes = codes.at[:, pos].set(jnp.where(selected[:, None], new_codes, codes[:, pos]))
+                lens = lens.at[:, pos].set(jnp.where(selected, new_len, lens[:, pos]))
+                mask = mask.at[:, pos].set(mask[:, pos] | selected)
+                bad = bad | (selected & write_bad)
+        return (types, codes, lens), mask, bad
+
+    return jnp.asarray(offsets), match_fn, write_fn
+
+
+def _apply_items(cells, rule_set, item_cell, item_rule, key, pending, size):
+    """Apply items (rule item_rule[i] at cell item_cell[i]) in a random order with random
+    directions, with the result of applying them one at a time; only pending items are
+    applied. A rule whose LHS no longer matches when its turn comes does nothing.
+
+    cells is a tuple of flat per-cell arrays, (types,) or (types, codes, lens), and
+    rule_set is (offsets, match_fn, write_fn) from _type_rule_set or state_rule_set.
+    Returns (cells, failed), failed if a rule set flagged an applied item.
+
+    Works in the same rounds as Board._apply_sync_items_vectorized: an item is applied
+    once it comes first, among pending items, on every cell it reads."""
+    offsets, match_fn, write_fn = rule_set
+    n_items, n_terms, n_cells = item_cell.shape[0], offsets.shape[2], size * size
+    item_ids = jnp.arange(n_items)
+    no_rank = jnp.uint32(0xFFFFFFFF)
+
+    order_key, dir_key = jax.random.split(key)
+    # Items are applied in order of (random 32-bit key, item index). Sorting a
+    # permutation is far slower than two scatter-mins per round on XLA CPU.
+    rank = jax.random.bits(order_key, (n_items,), dtype=jnp.uint32)
+    dirs = jax.random.randint(dir_key, (n_items,), 0, 4)
+    off = offsets[item_rule, dirs]
+    xs = (item_cell % size)[:, None] + off[..., 0]
+    ys = (item_cell // size)[:, None] + off[..., 1]
+    footprint = (ys % size) * size + xs % size
+    flat_footprint = footprint.reshape(-1)
+
+    def round_(carry):
+        cells, pending, failed = carry
+        item_rank = jnp.where(pending, rank, no_rank)
+        min_rank = jnp.full(n_cells, no_rank).at[flat_footprint].min(jnp.repeat(item_rank, n_terms))
+        first = pending[:, None] & (min_rank[footprint] == item_rank[:, None])
+        first_id = jnp.full(n_cells, n_items).at[flat_footprint].min(
+            jnp.where(first, item_ids[:, None], n_items).reshape(-1))
+        ready = (first & (first_id[footprint] == item_ids[:, None])).all(axis=1)
+        old = tuple(a[footprint] for a in cells)
+        matched, error = match_fn(old, item_rule, dirs)
+        matched = ready & matched
+        new, write_mask, bad = write_fn(old, item_rule, dirs)
+        failed = failed | (ready & error).any() | (matched & bad).any()
+        targets = jnp.where(matched[:, None] & write_mask, footprint, n_cells).reshape(-1)
+        cells = tuple(a.at[targets].set(b.reshape(-1, *a.shape[1:]), mode='drop') for a, b in zip(cells, new))
+        return cells, pending & ~ready, failed
+
+    cells, _, failed = lax.while_loop(lambda carry: carry[1].any(), round_, (cells, pending, jnp.bool_(False)))
+    return cells, failed
+
+
+def _sync_rules(grammar, sync_categories):
+    rules, subject_types = [], []
+    for n_sync in sync_categories:
+        for n_type in grammar['typesBySyncCategory'][n_sync]:
+            for rule in grammar['syncTransform'][n_sync][n_type]:
+                rules.append(rule)
+                subject_types.append(n_type)
+    return rules, np.array(subject_types, dtype=np.int32)
+
+
+def _sync_tick(grammar, sync_categories, size, width=None, max_state_len=64):
+    """Unjitted tick(cells, key) -> (cells, failed) over flat cells (see _apply_items),
+    on cell types alone or, with width, on (types, codes, lens); or None."""
+    if width is None:
+        tables = sync_step_tables(grammar, sync_categories)
+        if tables is None:
+            return None
+        subject_types, *rule_tables = (jnp.asarray(t) for t in tables)
+        rule_set = _type_rule_set(*rule_tables)
+    else:
+        rules, subject_types = _sync_rules(grammar, sync_categories)
+        rule_set = state_rule_set(rules, width, max_state_len) if rules else None
+        if rule_set is None:
+            return None
+        subject_types = jnp.asarray(subject_types)
+    n_rules, n_cells = subject_types.shape[0], size * size
+    # item i is rule i // n_cells applied at cell i % n_cells
+    item_rule = jnp.repeat(jnp.arange(n_rules), n_cells)
+    item_cell = jnp.tile(jnp.arange(n_cells), n_rules)
+
+    def tick(cells, key):
+        pending = cells[0][item_cell] == subject_types[item_rule]
+        return _apply_items(cells, rule_set, item_cell, item_rule, key, pending, size)
+
+    return tick
+
+
+def compile_sync_step(grammar, sync_categories, size):
+    """Compile one tick of the sync rules of sync_categories on a size x size board into
+    a jitted step(cell_types, key) -> cell_types, or return None (see sync_step_tables).
+
+    Like Board._apply_sync_rules, every (cell, rule) pair whose cell has the rule's
+    subject type at the start of the tick is applied once, in a uniformly random
+    order and with a uniformly random direction, with the result of applying them
+    one at a time. The order and directions come from key rather than the board's
+    RNG, so results match Board in distribution (up to ties between 32-bit random
+    sort keys, broken by item index) but not draw for draw. Cell states and
+    metadata are not represented: the caller must only use the step on boards
+    where every state is empty and no cell has metadata.
+    """
+    if not HAS_JAX:
+        raise ImportError("JAX not installed. Install with: pip install jax jaxlib")
+    tick = _sync_tick(grammar, sync_categories, size)
+    if tick is None:
+        return None
+
+    @jax.jit
+    def step(cell_types, key):
+        (types,), _ = tick((cell_types.reshape(-1).astype(jnp.int32),), key)
+        return types.reshape(cell_types.shape).astype(cell_types.dtype)
+
+    return step
+
+
+def compile_state_sync_step(grammar, sync_categories, size, width, max_state_len=64):
+    """Compile one tick of the sync rules of sync_categories into a jitted
+    step(cell_types, cell_states, cell_state_lens, key) -> (cell_types, cell_states,
+    cell_state_lens, failed) that also reads and writes cell states, or return None if
+    any rule cannot be compiled (see state_rule_set).
+
+    cell_states holds the char codes of each state in a (size, size, width) array
+    and cell_state_lens their lengths, as in jax_board.JAXBoardState. Ticks are
+    applied as in compile_sync_step. If failed is set, the tick could not be
+    represented (see state_rule_set) and its result must be discarded. Metadata is
+    not represented.
+    """
+    if not HAS_JAX:
+        raise ImportError("JAX not installed. Install with: pip install jax jaxlib")
+    tick = _sync_tick(grammar, sync_categories, size, width, max_state_len)
+    if tick is None:
+        return None
+
+    @jax.jit
+    def step(cell_types, cell_states, cell_state_lens, key):
+        cells = (cell_types.reshape(-1).astype(jnp.int32),
+                 cell_states.reshape(-1, width).astype(jnp.int32),
+                 cell_state_lens.reshape(-1).astype(jnp.int32))
+        (types, codes, lens), failed = tick(cells, key)
+        return (types.reshape(cell_types.shape).astype(cell_types.dtype),
+                codes.reshape(cell_states.shape).astype(cell_states.dtype),
+                lens.reshape(cell_state_lens.shape).astype(cell_state_lens.dtype),
+                failed)
+
+    return step
+
+
+def compile_sync_run(grammar, category_sets, size):
+    """Compile a jitted run(cell_types, seeds, branch_ids, n_ticks) -> cell_types that applies
+    n_ticks sync ticks in one call, or return None if any set cannot be compiled.
+
+    Tick i applies the sync categories category_sets[branch_ids[i]], as compile_sync_step
+    would with key jax.random.PRNGKey(seeds[i]). seeds and branch_ids may be longer
+    than n_ticks, e.g. padded to limit recompilation for new lengths.
+    """
+    if not HAS_JAX:
+        raise ImportError("JAX not installed. Install with: pip install jax jaxlib")
+    ticks = [_sync_tick(grammar, sync_categories, size) for sync_categories in category_sets]
+    if not ticks or None in ticks:
+        return None
+    branches = [lambda types, key, tick=tick: tick((types,), key)[0][0] for tick in ticks]
+
+    @jax.jit
+    def run(cell_types, seeds, branch_ids, n_ticks):
+        def body(i, types):
+            return lax.switch(branch_ids[i], branches, types, jax.random.PRNGKey(seeds[i]))
+        types = lax.fori_loop(0, n_ticks, body, cell_types.reshape(-1).astype(jnp.int32))
+        return types.reshape(cell_types.shape).astype(cell_types.dtype)
+
+    return run
+
+
+class BatchSimulator:
+    """Advance a batch of boards, given as (B, size, size) cell type grids, in lockstep.
+
+    Each board evolves independently under its own PRNG key, via jax.vmap. Sync
+    ticks are simulated as in compile_sync_step, so they match Board in
+    distribution. Async rules have no exact parallel form. With tau set, they are
+    approximated by tau-leaping, which is NOT exact. Time advances in leaps of at most
+    tau seconds. In each leap, every cell fires at most one of its type's async rules,
+    with probability 1 - exp(-rate * leap) and a rule chosen in proportion to its
+    rate. The firings then apply in a random order, each re-checked against the board
+    as it stands when its turn comes. The error shrinks with tau * rate: firings are
+    decided on the types at the start of the leap, and a cell cannot fire twice in one
+    leap. Metadata is not represented.
+
+    By default states are not represented either, and every rule must run on cell
+    types alone (see engine.sync_plan); use evolve. With state_width set, rules are
+    compiled with state_rule_set and boards carry states of up to state_width chars;
+    use evolve_states.
+
+    Args:
+        grammar: A compiled grammar (Board.grammar).
+        size: Board size.
+        tau: Maximum leap in seconds. Required, as an explicit opt-in to the
+            approximation, if the grammar has async rules.
+        state_width: Maximum state length, or None to simulate cell types only.
+    """
+
+    def __init__(self, grammar, size, tau=None, state_width=None):
+        if not HAS_JAX:
+            raise ImportError("JAX not installed. Install with: pip install jax jaxlib")
+        self.grammar = grammar
+        self.size = size
+        self.tau = tau
+        self.state_width = state_width
+        self._runs = {}
+        self._leap = None
+        if any(grammar['rateByType']):
+            if tau is None or tau <= 0:
+                raise ValueError("Async rules can only be simulated approximately; "
+                                 "pass tau (seconds) to use tau-leaping")
+            if state_width is None:
+                tables = async_rule_tables(grammar)
+                if tables is None:
+                    raise ValueError("Every async rule must have fixed addresses and match and write "
+                                     "cell types only (see engine.sync_plan)")
+                rule_ids, rates, *rule_tables = (jnp.asarray(t) for t in tables)
+                rule_set = _type_rule_set(*rule_tables)
+            else:
+                rules, rule_ids, rates = _async_rules(grammar)
+                rule_set = state_rule_set(rules, state_width)
+                if rule_set is None:
+                    raise ValueError("Every async rule must have fixed addresses (see state_rule_set)")
+            self._leap = self._make_leap(jnp.asarray(rule_ids), jnp.asarray(rates), rule_set)
+
+    def _make_leap(self, rule_ids, rates, rule_set):
+        size, n_cells = self.size, self.size * self.size
+        cells = jnp.arange(n_cells)
+        width = rates.shape[1]
+
+        def leap(board, key, seconds):
+            types = board[0]
+            fire_key, rule_key, apply_key = jax.random.split(key, 3)
+            cell_rates = rates[types]
+            total = cell_rates.sum(axis=1)
+            fires = jax.random.uniform(fire_key, (n_cells,)) < -jnp.expm1(-total * seconds)
+            pick = jax.random.uniform(rule_key, (n_cells,)) * total
+            k = jnp.minimum((jnp.cumsum(cell_rates, axis=1) <= pick[:, None]).sum(axis=1), width - 1)
+            return _apply_items(board, rule_set, cells, rule_ids[types, k], apply_key, fires, size)
+
+        return leap
+
+    def _schedule(self, start_time, end_time):
+        """Host-side plan: a list of (leap seconds, sync categories or None) steps."""
+        grammar, steps, time = self.grammar, [], start_time
+        while time < end_time:
+            next_sync_times = [p + time - (time % p) for p in grammar['syncPeriods']]
+            next_time = min([end_time] + next_sync_times)
+            categories = tuple(n for n in grammar['syncCategories'] if next_sync_times[n] == next_time)
+            seconds = (next_time - time) / (1 << 32)
+            n_leaps = max(1, math.ceil(seconds / self.tau)) if self._leap is not None else 1
+            leap = seconds / n_leaps if self._leap is not None else 0.0
+            steps.extend([(leap, None)] * (n_leaps - 1))
+            steps.append((leap, categories or None))
+            time = next_time
+        return steps
+
+    def _run(self, category_sets):
+        if category_sets in self._runs:
+            return self._runs[category_sets]
+        ticks = [_sync_tick(self.grammar, categories, self.size, self.state_width) for categories in category_sets]
+        if None in ticks:
+            if self.state_width is None:
+                raise ValueError("Every sync rule must have a syncPlan that writes empty states only")
+            raise ValueError("Every sync rule must have fixed addresses (see state_rule_set)")
+        branches = [lambda board, key: (board, False)] + ticks
+        leap = self._leap
+
+        def run_one(board, key, leaps, branch_ids, n_steps):
+            def body(i, carry):
+                board, key, failed = carry
+                key, leap_key, tick_key = jax.random.split(key, 3)
+                if leap is not None:
+                    board, leap_failed = lax.cond(leaps[i] > 0, lambda b: leap(b, leap_key, leaps[i]),
+                                                  lambda b: (b, jnp.bool_(False)), board)
+                    failed = failed | leap_failed
+                board, tick_failed = lax.switch(branch_ids[i], branches, board, tick_key)
+                return board, key, failed | tick_failed
+            return lax.fori_loop(0, n_steps, body, (board, key, jnp.bool_(False)))
+
+        run = self._runs[category_sets] = jax.jit(jax.vmap(run_one, in_axes=(0, 0, None, None, None)))
+        return run
+
+    def _evolve(self, board, keys, start_time, end_time):
+        steps = self._schedule(start_time, end_time)
+        if not steps:
+            return board, keys, jnp.zeros(keys.shape[0], dtype=bool)
+        category_sets = tuple(sorted({categories for _, categories in steps if categories}))
+        n = len(steps)
+        padded = 1 << (n - 1).bit_length()
+        leaps = np.zeros(padded, dtype=np.float32)
+        branch_ids = np.zeros(padded, dtype=np.int32)
+        for i, (leap, categories) in enumerate(steps):
+            leaps[i] = leap
+            branch_ids[i] = 0 if categories is None else category_sets.index(categories) + 1
+        return self._run(category_sets)(board, keys, leaps, branch_ids, n)
+
+    def evolve(self, cell_types, keys, start_time, end_time):
+        """Advance every board from start_time to end_time (Board time units, 2^32 per second).
+
+        cell_types is (B, size, size) and keys is a (B, 2) batch of PRNG keys, e.g. from
+        jax.random.split(key, B). Returns (cell_types, keys) to continue from."""
+        if self.state_width is not None:
+            raise ValueError("This simulator represents states; use evolve_states")
+        cell_types = jnp.asarray(cell_types)
+        batch = cell_types.shape[0]
+        (types,), keys, _ = self._evolve((cell_types.reshape(batch, -1).astype(jnp.int32),),
+                                         keys, start_time, end_time)
+        return types.reshape(cell_types.shape).astype(cell_types.dtype), keys
+
+    def evolve_states(self, cell_types, cell_states, cell_state_lens, keys, start_time, end_time):
+        """Like evolve, for a simulator with state_width set. cell_states is
+        (B, size, size, state_width) char codes and cell_state_lens (B, size, size)
+        state lengths, as in jax_board.JAXBoardState.
+
+        Returns (cell_types, cell_states, cell_state_lens, keys, failed), where
+        failed[b] marks a board that met a state the kernels cannot represent (see
+        state_rule_set); its result is not meaningful."""
+        if self.state_width is None:
+            raise ValueError("This simulator represents cell types only; use evolve")
+        cell_types, cell_states, cell_state_lens = (jnp.asarray(a) for a in (cell_types, cell_states, cell_state_lens))
+        batch = cell_types.shape[0]
+        board = (cell_types.reshape(batch, -1).astype(jnp.int32),
+                 cell_states.reshape(batch, -1, self.state_width).astype(jnp.int32),
+                 cell_state_lens.reshape(batch, -1).astype(jnp.int32))
+        (types, codes, lens), keys, failed = self._evolve(board, keys, start_time, end_time)
+        return (types.reshape(cell_types.shape).astype(cell_types.dtype),
+                codes.reshape(cell_states.shape).astype(cell_states.dtype),
+                lens.reshape(cell_state_lens.shape).astype(cell_state_lens.dtype),
+                keys, failed)
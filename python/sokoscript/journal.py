@@ -0,0 +1,263 @@
+"""Append-only change journal for a Board, for replay and undo.
+
+Board.start_journal() attaches a BoardJournal that records every change to
+the board as an event: an applied rule (subject cell, direction and rule),
+a vectorized sync tick, a direct edit (set_cell outside rule application),
+or a stop, which records that time and RNG moved on without changing any
+cell (at the end of each evolve_to_time call and each sync tick). Each event
+holds the cell deltas it caused and is stamped with the board's time, last
+event time and RNG position once it is done, so the board can be rewound
+exactly (undo) or rebuilt from the snapshot taken when the journal started
+(replay) at any time where evolve_to_time stopped. Sync events also list the
+rules they applied, as (rule, subject cell) fires.
+
+Events and deltas are kept in flat arrays, and cells are interned in a
+table of distinct (type, state, meta) values, so a long trajectory costs
+a few dozen bytes per event rather than a snapshot per step.
+"""
+
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from . import lookups
+
+# rule ids of events that are not a single rule application
+SYNC_BATCH = -1
+EDIT = -2
+STOP = -3  # time and RNG moved on without any change to the cells
+_KINDS = {SYNC_BATCH: 'sync', EDIT: 'edit', STOP: 'stop'}
+
+
+class BoardJournal:
+    """Change journal of one Board (see module docstring).
+
+    Read access: len(journal) events, journal.event(i) for a readable event,
+    journal.replay() to rebuild the board at a time, and Board.undo_to_time
+    to rewind the board itself. The journal must only be written by its board.
+    """
+
+    def __init__(self, board):
+        self.base = board.clone()
+        self.rules = []  # rule id -> compiled rule dict
+        self._rule_ids = {}
+        self._cells = []  # cell id -> cell dict
+        self._cell_ids = {}
+        self._rng_blocks = []  # RNG state blocks referenced by the events
+        # per event
+        self._rule = array('i')
+        self._subject = array('i')  # cell index of the subject, or -1
+        self._dir = array('b')  # index into lookups.dirs, or -1
+        self._time = array('Q')
+        self._last_event_time = array('Q')
+        self._rng_block = array('I')
+        self._rng_mti = array('I')
+        self._delta_start = array('I')
+        # per delta
+        self._delta_index = array('I')
+        self._delta_old = array('I')
+        self._delta_new = array('I')
+        # per rule applied by a sync event
+        self._fire_event = array('I')
+        self._fire_rule = array('i')
+        self._fire_subject = array('I')
+        self._open = False  # the last event has not been stamped yet
+
+    def __len__(self):
+        return len(self._rule)
+
+    # --- recording (called by Board) ---
+
+    def begin_rule(self, board, x, y, direction, rule):
+        self._begin(board, self._rule_id(rule), board.xy2index(x, y), lookups.dirs.index(direction))
+
+    def begin_sync_batch(self, board):
+        self._begin(board, SYNC_BATCH, -1, -1)
+
+    def record_sync_fires(self, board, rule, subjects):
+        """Record that a vectorized sync tick applied rule at the given subject cell indices.
+        Starts a new sync event if a rule applied on the scalar path interrupted the tick."""
+        if not self._open or self._rule[-1] != SYNC_BATCH:
+            self._begin(board, SYNC_BATCH, -1, -1)
+        subjects = np.asarray(subjects, dtype=np.uint32).tolist()
+        self._fire_event.extend([len(self) - 1] * len(subjects))
+        self._fire_rule.extend([self._rule_id(rule)] * len(subjects))
+        self._fire_subject.extend(subjects)
+
+    def mark_stop(self, board):
+        """Stamp the board's time and RNG position, which failed rule attempts and sync
+        ticks that changed nothing move on, unless the last event already holds them."""
+        self.end_event(board)
+        if self._rule and self._time[-1] == board.time and self._last_event_time[-1] == board.last_event_time \
+                and self._rng_blocks[self._rng_block[-1]] is board.rng.mt and self._rng_mti[-1] == board.rng.mti:
+            return
+        self._begin(board, STOP, -1, -1)
+        self._stamp(board)
+        self._open = False
+
+    def end_event(self, board):
+        """Stamp the open event, if any, with the board's time and RNG position, or drop it
+        if it changed nothing. Edits are stamped as they happen."""
+        if not self._open:
+            return
+        self._open = False
+        if self._delta_start[-1] == len(self._delta_index):
+            self._truncate_fires(len(self) - 1)
+            for events in (self._rule, self._subject, self._dir, self._time, self._last_event_time,
+                           self._rng_block, self._rng_mti, self._delta_start):
+                events.pop()
+        elif self._rule[-1] != EDIT:
+            self._stamp(board)
+
+    def record(self, board, index, old_cell, new_cell):
+        if not self._open:
+            self._begin(board, EDIT, -1, -1)
+        self._delta_index.append(index)
+        self._delta_old.append(self._cell_id(old_cell))
+        self._delta_new.append(self._cell_id(new_cell))
+        if self._rule[-1] == EDIT:
+            self._stamp(board)
+
+    def record_bulk(self, board, indices, old_types, old_state_ids, new_types, new_state_ids):
+        """record() for array-storage cells without metadata, given as arrays of types and
+        state ids into board.cell.states."""
+        if not self._open:
+            self._begin(board, EDIT, -1, -1)
+        n = len(indices)
+        states = board.cell.states
+        cell_id = self._cell_id
+        self._delta_index.extend(np.asarray(indices, dtype=np.uint32).tolist())
+        for types, state_ids, deltas in ((old_types, old_state_ids, self._delta_old),
+                                         (new_types, new_state_ids, self._delta_new)):
+            types = np.broadcast_to(types, n).tolist()
+            state_ids = np.broadcast_to(state_ids, n).tolist()
+            deltas.extend([cell_id({'type': t, 'state': states[s]}) for t, s in zip(types, state_ids)])
+        if self._rule[-1] == EDIT:
+            self._stamp(board)
+
+    def _begin(self, board, rule_id, subject, dir_index):
+        self.end_event(board)
+        self._rule.append(rule_id)
+        self._subject.append(subject)
+        self._dir.append(dir_index)
+        self._delta_start.append(len(self._delta_index))
+        for stamp in (self._time, self._last_event_time, self._rng_block, self._rng_mti):
+            stamp.append(0)
+        self._open = True
+
+    def _stamp(self, board):
+        mt = board.rng.mt
+        if not self._rng_blocks or self._rng_blocks[-1] is not mt:
+            self._rng_blocks.append(mt)
+        self._time[-1] = board.time
+        self._last_event_time[-1] = board.last_event_time
+        self._rng_block[-1] = len(self._rng_blocks) - 1
+        self._rng_mti[-1] = board.rng.mti
+
+    def _rule_id(self, rule):
+        rule_id = self._rule_ids.get(id(rule))
+        if rule_id is None:
+            rule_id = self._rule_ids[id(rule)] = len(self.rules)
+            self.rules.append(rule)
+        return rule_id
+
+    def _truncate_fires(self, n_events):
+        """Drop the sync fires of every event from n_events on."""
+        start = bisect_left(self._fire_event, n_events)
+        for fires in (self._fire_event, self._fire_rule, self._fire_subject):
+            del fires[start:]
+
+    def _cell_id(self, cell):
+        meta = cell.get('meta')
+        key = (cell['type'], cell['state'], json.dumps(meta, sort_keys=True) if meta else None)
+        cell_id = self._cell_ids.get(key)
+        if cell_id is None:
+            cell_id = self._cell_ids[key] = len(self._cells)
+            self._cells.append(cell)
+        return cell_id
+
+    # --- reading ---
+
+    def _deltas(self, i):
+        end = self._delta_start[i + 1] if i + 1 < len(self._rule) else len(self._delta_index)
+        return range(self._delta_start[i], end)
+
+    def _fires(self, i):
+        """(rule, subject cell index) of every rule applied by event i."""
+        if self._rule[i] >= 0:
+            return [(self.rules[self._rule[i]], self._subject[i])]
+        fires = range(bisect_left(self._fire_event, i), bisect_right(self._fire_event, i))
+        return [(self.rules[self._fire_rule[f]], self._fire_subject[f]) for f in fires]
+
+    def event(self, i):
+        """Event i as a dict: 'time', 'kind' ('rule', 'sync', 'edit' or 'stop'), 'rule', 'x', 'y' and
+        'dir' (None unless kind is 'rule'), 'cells', a list of (index, old cell, new cell), and
+        'fires', a list of (rule, subject cell index) for every rule applied: the rule of a
+        'rule' event, or the rules a vectorized sync tick applied, grouped by rule."""
+        rule_id, subject = self._rule[i], self._subject[i]
+        cells = self._cells
+        return {
+            'time': self._time[i],
+            'kind': 'rule' if rule_id >= 0 else _KINDS[rule_id],
+            'rule': self.rules[rule_id] if rule_id >= 0 else None,
+            'x': subject % self.base.size if subject >= 0 else None,
+            'y': subject // self.base.size if subject >= 0 else None,
+            'dir': lookups.dirs[self._dir[i]] if self._dir[i] >= 0 else None,
+            'cells': [(self._delta_index[d], cells[self._delta_old[d]], cells[self._delta_new[d]])
+                      for d in self._deltas(i)],
+            'fires': self._fires(i),
+        }
+
+    def events_until(self, t):
+        """Number of events stamped at or before time t."""
+        return bisect_right(self._time, t)
+
+    def _restore_stamp(self, board, n_events, t=None):
+        """Set board time and RNG to where they stood after the first n_events events (or
+        when the journal started), and the time to t if given."""
+        if n_events:
+            i = n_events - 1
+            board.time = self._time[i]
+            board.last_event_time = self._last_event_time[i]
+            board.rng.restore_state((self._rng_blocks[self._rng_block[i]], self._rng_mti[i]))
+        else:
+            board.time, board.last_event_time = self.base.time, self.base.last_event_time
+            board.rng = self.base.rng.copy()
+        if t is not None:
+            board.time = t
+
+    def replay(self, until=None):
+        """A new board at time until (default: the last event), rebuilt from the snapshot taken
+        when the journal started by applying the recorded cell changes forward."""
+        n_events = len(self) if until is None else self.events_until(until)
+        board = self.base.clone()
+        cells = self._cells
+        for d in range(self._delta_start[n_events] if n_events < len(self) else len(self._delta_index)):
+            board.set_cell_by_index(self._delta_index[d], cells[self._delta_new[d]])
+        self._restore_stamp(board, n_events, until)
+        return board
+
+    def undo(self, board, t):
+        """Rewind board, the journal's own board, to time t by reverting every event stamped
+        after t, and drop those events from the journal."""
+        if t < self.base.time:
+            raise ValueError(f"Cannot undo to {t}, before the journal started at {self.base.time}")
+        self.end_event(board)
+        n_events = self.events_until(t)
+        delta_end = self._delta_start[n_events] if n_events < len(self) else len(self._delta_index)
+        cells = self._cells
+        board.journal = None
+        try:
+            for d in range(len(self._delta_index) - 1, delta_end - 1, -1):
+                board.set_cell_by_index(self._delta_index[d], cells[self._delta_old[d]])
+        finally:
+            board.journal = self
+        for events in (self._rule, self._subject, self._dir, self._time, self._last_event_time,
+                       self._rng_block, self._rng_mti, self._delta_start):
+            del events[n_events:]
+        for deltas in (self._delta_index, self._delta_old, self._delta_new):
+            del deltas[delta_end:]
+        self._truncate_fires(n_events)
+        self._restore_stamp(board, n_events, t)
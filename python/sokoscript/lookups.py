@@ -1,10 +1,16 @@
 """Precomputed lookup tables for vector algebra, character encoding, and permutations.
 
 Port of src/lookups.js. All operations are O(1) via table lookup.
+
+The char_perm_array / char_vec_array / vec_char_array tables hold the same
+data as dense NumPy arrays over char indices (ord(c) - FIRST_CHAR), for
+vectorized and compiled engines.
 """
 
 import math
 
+import numpy as np
+
 # Direction vectors
 dir_vec = {'N': (0, -1), 'E': (1, 0), 'S': (0, 1), 'W': (-1, 0)}
 dirs = ['N', 'E', 'S', 'W']
@@ -183,3 +189,43 @@ char_rot_lookup = {
     vec2char((-1, 0)): 270,
     vec2char((-1, -1)): 315,
 }
+
+
+# Dense versions of the tables above, over char indices i = ord(c) - FIRST_CHAR.
+def _char_index(c):
+    return ord(c) - FIRST_CHAR
+
+def _dense_perm(table):
+    return np.array([_char_index(table[c]) for c in all_chars], dtype=np.uint8)
+
+def _dense_perm_rows(tables):
+    return np.stack([_dense_perm(tables[c]) for c in all_chars])
+
+# char_perm_array[op][i] (one-argument ops) or [op][right][left], as in char_perm_lookup
+char_perm_array = {
+    'matMul': {k: _dense_perm(table) for k, table in char_perm_lookup['matMul'].items()},
+    'vecAdd': _dense_perm_rows(char_perm_lookup['vecAdd']),
+    'vecSub': _dense_perm_rows(char_perm_lookup['vecSub']),
+    'intAdd': _dense_perm_rows(char_perm_lookup['intAdd']),
+    'intSub': _dense_perm_rows(char_perm_lookup['intSub']),
+    'rotate': {k: _dense_perm(table) for k, table in char_perm_lookup['rotate'].items()},
+}
+
+# char_vec_array[i] = (x, y) for the 81 vector chars; NON_VEC (-128) for other chars
+NON_VEC = -128
+char_vec_array = np.array([v if v[0] == v[0] else (NON_VEC, NON_VEC) for v in map(char2vec, all_chars)],
+                          dtype=np.int8)
+
+# vec_char_array[(y + 4) * 9 + (x + 4)] = char index of vec2char((x, y))
+vec_char_array = np.array([_char_index(vec2char((x, y))) for y in range(-4, 5) for x in range(-4, 5)],
+                          dtype=np.uint8)
+
+# Scalar-path tables keyed by vector tuples, so address arithmetic needs no
+# vec2char / char_vec_lookup round trip:
+# vec_char_lookup[(x, y)] = vec2char((x, y)) for the 81 vectors of the vector-char range,
+# vec_add_lookup[c][(x, y)] = char_vec_lookup[char_perm_lookup['vecAdd'][c][vec2char((x, y))]].
+vec_char_lookup = {(x, y): all_chars[vec_char_array[(y + 4) * 9 + (x + 4)]]
+                   for y in range(-4, 5) for x in range(-4, 5)}
+vec_add_lookup = {c: {v: char_vec_lookup[all_chars[char_perm_array['vecAdd'][i, vec_char_array[k]]]]
+                      for k, v in enumerate(vec_char_lookup)}
+                  for i, c in enumerate(all_chars)}
@@ -1,8 +1,58 @@
 """Recursive descent parser for SokoScript grammar.
 
 Port of src/grammar.pegjs. Produces identical AST structure to the JS parser.
+
+Lexing is context-dependent (the same characters are type names, state
+characters or attribute values depending on where they appear), so the
+parser scans tokens in place with the precompiled regexes below, anchored at
+the current position. Rules that use only the common constructs (type
+names, plain state characters, direction addresses, $N groups, id tags and
+unbraced attributes) are first matched whole by _SIMPLE_RULE and built from
+its tokens in one pass; anything else falls back to the full parser.
 """
 
+import re
+
+_WHITESPACE_CHARS = frozenset(' \t\n\r')
+_WHITESPACE = re.compile(r'[ \t\n\r]+')
+_PREFIX_TAIL = re.compile(r'[a-z0-9_]*')
+_WORD = re.compile(r'[A-Za-z0-9_]*')
+_NON_ZERO_INTEGER = re.compile(r'[1-9]\d*')
+_INTEGER_PART = re.compile(r'\d{1,3}')
+_FRACTIONAL_PART = re.compile(r'\d{1,6}')
+_ATTRIBUTE = re.compile(r'(rate|sync|command|key|score|sound|caption)=')
+
+# Simple rules. Every token ends with a lookahead that stops the regex from splitting
+# what the full parser would scan greedily, so the two consume exactly the same text.
+_WS = r'[ \t\n\r]'
+_NAME = r'[a-z][a-z0-9_]*(?![a-z0-9_])'
+_EMPTY = r'_(?![a-z0-9_])'
+_GROUP = r'[1-9]\d*(?!\d)'
+_ID_TAG = rf'(?:~(?:0|{_GROUP}))?(?![~\d])'
+_LHS_STATE = r'/[0-9A-Za-z_?]+(?![0-9A-Za-z_?\[@$(\\])'
+_RHS_STATE = r'/[0-9A-Za-z_]+(?![0-9A-Za-z_@$(\\])'
+_ADDR = r'>[nsewNSEWfblrFBLR]>'
+_LHS_TERM = rf'(?:\*|{_EMPTY}|{_NAME}(?:{_LHS_STATE})?)'
+_RHS_TERM = rf'(?:{_EMPTY}|\${_GROUP}(?:{_RHS_STATE})?{_ID_TAG}|{_NAME}(?:{_RHS_STATE})?{_ID_TAG})'
+_FIXED_POINT = r'(?:\d{1,3}\.\d{1,6}|\d{1,3}(?!\.\d)|\.\d{1,6})'
+_ATTR_TOKEN = re.compile(
+    rf'(?P<number>rate|sync)=(?P<fixed>{_FIXED_POINT})'
+    r'|key=(?:(?P<char>[A-Za-z0-9_])|\{(?P<braced>[^}\\])\})'
+    r'|(?P<string>command|sound|caption)=(?P<word>[A-Za-z0-9_]+)(?![A-Za-z0-9_])'
+    rf'|score=(?P<score>[+-]?(?:0|{_GROUP}))(?!\d)')
+_SIMPLE_RULE = re.compile(
+    rf'(?P<lhs>{_NAME}(?:{_LHS_STATE})?(?:{_WS}*{_ADDR}{_WS}*{_LHS_TERM}|{_WS}+{_LHS_TERM})*)'
+    rf'{_WS}*:{_WS}*'
+    rf'(?P<rhs>{_RHS_TERM}(?:{_WS}*{_RHS_TERM})*)'
+    rf'(?:{_WS}*,{_WS}*(?P<attrs>(?:(?:{_ATTR_TOKEN.pattern}){_WS}*)*))?'
+    rf'(?={_WS}*(?:\.|\Z))')
+_LHS_TOKEN = re.compile(
+    r'>(?P<addr>[nsewNSEWfblrFBLR])>|(?P<any>\*)|(?P<empty>_)'
+    r'|(?P<name>[a-z][a-z0-9_]*)(?:/(?P<state>[0-9A-Za-z_?]+))?')
+_RHS_TOKEN = re.compile(
+    r'(?P<empty>_(?![a-z0-9_]))|(?:\$(?P<group>\d+)|(?P<name>[a-z][a-z0-9_]*))'
+    r'(?:/(?P<state>[0-9A-Za-z_]+))?(?:~(?P<id>\d+))?')
+
 
 class SyntaxError(Exception):
     def __init__(self, message, line=None, column=None, offset=None):
@@ -32,7 +82,7 @@ class Parser:
         self.pos += n
 
     def match_str(self, s):
-        if self.text[self.pos:self.pos + len(s)] == s:
+        if self.text.startswith(s, self.pos):
             self.pos += len(s)
             return True
         return False
@@ -52,14 +102,14 @@ class Parser:
         return None
 
     def skip_whitespace(self):
-        while self.pos < self.len and self.text[self.pos] in ' \t\n\r':
-            self.pos += 1
+        if self.text[self.pos:self.pos + 1] in _WHITESPACE_CHARS:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
 
     def require_whitespace(self):
-        start = self.pos
-        while self.pos < self.len and self.text[self.pos] in ' \t\n\r':
-            self.pos += 1
-        return self.pos > start
+        if self.text[self.pos:self.pos + 1] in _WHITESPACE_CHARS:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            return True
+        return False
 
     def get_location(self):
         line = self.text[:self.pos].count('\n') + 1
@@ -217,14 +267,12 @@ class Parser:
                 break
 
             # Try comment
-            saved = self.pos
             c = self.try_comment()
             if c is not None:
                 rules.append(c)
                 continue
 
             # Try rule
-            self.pos = saved
             r = self.try_rule()
             if r is None:
                 break
@@ -241,12 +289,16 @@ class Parser:
     def try_comment(self):
         if self.match_str('//'):
             start = self.pos
-            while self.pos < self.len and self.text[self.pos] != '\n':
-                self.pos += 1
+            end = self.text.find('\n', start)
+            self.pos = self.len if end < 0 else end
             return {'type': 'comment', 'comment': self.text[start:self.pos]}
         return None
 
     def try_rule(self):
+        rule = self._try_simple_rule()
+        if rule is not None:
+            return rule
+
         saved = self.pos
         # Try inheritance
         child = self.try_prefix()
@@ -291,6 +343,73 @@ class Parser:
 
         return {'type': 'transform', 'lhs': lhs, 'rhs': rhs}
 
+    def _try_simple_rule(self):
+        """Fast path of try_rule for rules matched by _SIMPLE_RULE. Returns None, without
+        moving, if the rule is not simple or is invalid, leaving the error to try_rule."""
+        m = _SIMPLE_RULE.match(self.text, self.pos)
+        if m is None:
+            return None
+
+        lhs = []
+        addr = None
+        for d, any_, empty, name, state in _LHS_TOKEN.findall(m.group('lhs')):
+            if d:
+                addr = {'op': 'absdir' if d in 'nsewNSEW' else 'reldir', 'dir': d.upper()}
+                continue
+            if any_:
+                term = {'op': 'any'}
+            elif empty:
+                term = {'type': '_'}
+            elif state:
+                term = {'type': name,
+                        'state': [{'op': 'wild'} if c == '?' else {'op': 'char', 'char': c} for c in state]}
+            else:
+                term = {'type': name}
+            if addr is not None:
+                term['addr'] = addr
+                addr = None
+            lhs.append(term)
+
+        rhs = []
+        for empty, group, name, state, id_tag in _RHS_TOKEN.findall(m.group('rhs')):
+            if empty:
+                rhs.append({'type': '_'})
+                continue
+            if group:
+                term = {'op': 'prefix' if state else 'group', 'group': int(group)}
+            else:
+                term = {'type': name}
+            if state:
+                term['state'] = [{'op': 'char', 'char': c} for c in state]
+            if id_tag:
+                term['id'] = int(id_tag)
+            rhs.append(term)
+        # Simple terms hold no positional expressions, so of the LHS and RHS checks only
+        # these can fail
+        if len(rhs) > len(lhs) or not self._validate_ids(rhs, len(lhs)):
+            return None
+
+        attrs = []
+        if m.group('attrs'):
+            for number, fixed, char, braced, string, word, score in _ATTR_TOKEN.findall(m.group('attrs')):
+                if number:
+                    i, _, f = fixed.partition('.')
+                    attrs.append({number: 1000000 * int(i or 0) + int(f.ljust(6, '0'))})
+                elif string:
+                    attrs.append({string: word})
+                elif score:
+                    attrs.append({'score': int(score)})
+                else:
+                    attrs.append({'key': char or braced})
+            if self._count_duplicate_attributes(attrs) or not self._validate_attributes(attrs):
+                return None
+
+        self.pos = m.end()
+        merged = {}
+        for a in attrs:
+            merged.update(a)
+        return {'type': 'transform', 'lhs': lhs, 'rhs': rhs, **merged}
+
     def parse_inherit_rhs(self):
         first = self.try_prefix()
         if first is None:
@@ -355,6 +474,8 @@ class Parser:
         return {'type': prefix}
 
     def try_wild_lhs_term(self):
+        if self.text[self.pos:self.pos + 1].islower():
+            return self.try_primary_lhs_term()
         if self.match_str('*'):
             return {'op': 'any'}
         return self.try_lhs_term()
@@ -408,9 +529,7 @@ class Parser:
         if not c.islower():
             return None
         start = self.pos
-        self.pos += 1
-        while self.pos < self.len and self.text[self.pos] in 'abcdefghijklmnopqrstuvwxyz0123456789_':
-            self.pos += 1
+        self.pos = _PREFIX_TAIL.match(self.text, start + 1).end()
         return self.text[start:self.pos]
 
     def parse_lhs_state_char_seq(self):
@@ -817,16 +936,17 @@ class Parser:
 
     def try_rhs_term(self):
         saved = self.pos
+        c = self.text[saved:saved + 1]
 
         # $_
-        if self.match_str('_'):
+        if c == '_' and self.match_str('_'):
             if self.pos < self.len and self.text[self.pos] in 'abcdefghijklmnopqrstuvwxyz0123456789_':
                 self.pos = saved
             else:
                 return {'type': '_'}
 
         # $group/state or $group with optional id
-        if self.match_str('$'):
+        if c == '$' and self.match_str('$'):
             group = self.try_non_zero_integer()
             if group is not None:
                 if self.match_str('/'):
@@ -861,6 +981,8 @@ class Parser:
         return chars
 
     def try_optional_id_tag(self):
+        if self.text[self.pos:self.pos + 1] != '~':
+            return {}
         if self.match_str('~0'):
             return {'id': 0}
         if self.match_str('~'):
@@ -881,12 +1003,10 @@ class Parser:
         return attrs
 
     def try_attribute(self):
-        for parser in (self._try_rate, self._try_sync, self._try_command,
-                        self._try_key, self._try_score, self._try_sound, self._try_caption):
-            result = parser()
-            if result is not None:
-                return result
-        return None
+        m = _ATTRIBUTE.match(self.text, self.pos)
+        if m is None:
+            return None
+        return getattr(self, '_try_' + m.group(1))()
 
     def _try_rate(self):
         saved = self.pos
@@ -1020,8 +1140,7 @@ class Parser:
 
     def _parse_attr_string(self):
         start = self.pos
-        while self.pos < self.len and self.text[self.pos] in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_':
-            self.pos += 1
+        self.pos = _WORD.match(self.text, start).end()
         return self.text[start:self.pos]
 
     def _try_attr_char(self):
@@ -1032,13 +1151,11 @@ class Parser:
         return None
 
     def try_non_zero_integer(self):
-        if self.pos >= self.len or self.text[self.pos] not in '123456789':
+        m = _NON_ZERO_INTEGER.match(self.text, self.pos)
+        if m is None:
             return None
-        start = self.pos
-        self.pos += 1
-        while self.pos < self.len and self.text[self.pos].isdigit():
-            self.pos += 1
-        return int(self.text[start:self.pos])
+        self.pos = m.end()
+        return int(m.group())
 
     def try_signed_integer(self):
         saved = self.pos
@@ -1098,26 +1215,19 @@ class Parser:
         return None
 
     def _try_integer_part(self):
-        start = self.pos
-        count = 0
-        while self.pos < self.len and self.text[self.pos].isdigit() and count < 3:
-            self.pos += 1
-            count += 1
-        if count == 0:
+        m = _INTEGER_PART.match(self.text, self.pos)
+        if m is None:
             return None
-        return self.text[start:self.pos]
+        self.pos = m.end()
+        return m.group()
 
     def _try_fractional_part(self):
-        start = self.pos
-        count = 0
-        while self.pos < self.len and self.text[self.pos].isdigit() and count < 6:
-            self.pos += 1
-            count += 1
-        if count == 0:
+        m = _FRACTIONAL_PART.match(self.text, self.pos)
+        if m is None:
             return None
-        s = self.text[start:self.pos]
+        self.pos = m.end()
         # Pad to 6 digits
-        return s + '0' * (6 - len(s))
+        return m.group().ljust(6, '0')
 
 
 def parse(text):
@@ -4,7 +4,8 @@ Also includes fast log2 approximation from src/log2.js.
 """
 
 import base64
-import struct
+
+import numpy as np
 
 N = 624
 M = 397
@@ -12,72 +13,128 @@ UPPER_MASK = 0x80000000
 LOWER_MASK = 0x7FFFFFFF
 MATRIX_A = 0x9908B0DF
 
+_MAG01 = np.array([0, MATRIX_A], dtype=np.uint32)
+
+
+def _twist(mt):
+    """Regenerate a 624-word block, returning a new array.
+
+    Same recurrence as the JS loops, evaluated in slices whose inputs are
+    already final: mt[kk + M] is still the old word for kk < N - M, and for
+    kk >= N - M it is a word produced by an earlier slice."""
+    new = np.empty(N, dtype=np.uint32)
+    y = (mt[:N - M] & UPPER_MASK) | (mt[1:N - M + 1] & LOWER_MASK)
+    new[:N - M] = mt[M:] ^ (y >> 1) ^ _MAG01[y & 1]
+    for lo in range(N - M, N - 1, N - M):
+        hi = min(lo + N - M, N - 1)
+        y = (mt[lo:hi] & UPPER_MASK) | (mt[lo + 1:hi + 1] & LOWER_MASK)
+        new[lo:hi] = new[lo + M - N:hi + M - N] ^ (y >> 1) ^ _MAG01[y & 1]
+    y = (mt[N - 1] & UPPER_MASK) | (new[0] & LOWER_MASK)
+    new[N - 1] = new[M - 1] ^ (y >> 1) ^ _MAG01[y & 1]
+    return new
+
+
+def _temper(mt):
+    y = mt ^ (mt >> 11)
+    y ^= (y << 7) & 0x9D2C5680
+    y ^= (y << 15) & 0xEFC60000
+    y ^= y >> 18
+    return y
+
 
 class MersenneTwister:
+    """Mersenne Twister with NumPy block regeneration.
+
+    Each block of 624 outputs is generated and tempered in one go and served
+    from a buffer. Blocks are never modified in place, so a checkpoint is just
+    a reference to the current block and position."""
+
+    _checkpoint = None
+
     def __init__(self, seed=5489):
-        self.mt = [0] * N
         self.mti = N + 1
         self.seed(seed)
 
     def seed(self, seed):
-        self.mt[0] = seed & 0xFFFFFFFF
+        mt = [0] * N
+        mt[0] = seed & 0xFFFFFFFF
         for i in range(1, N):
-            s = self.mt[i - 1] ^ (self.mt[i - 1] >> 30)
-            self.mt[i] = (
+            s = mt[i - 1] ^ (mt[i - 1] >> 30)
+            mt[i] = (
                 ((((s & 0xFFFF0000) >> 16) * 1812433253) << 16)
                 + (s & 0x0000FFFF) * 1812433253
                 + i
             ) & 0xFFFFFFFF
+        self._set_block(np.array(mt, dtype=np.uint32))
         self.mti = N
 
-    def int(self):
-        mag01 = [0, MATRIX_A]
+    def _set_block(self, mt):
+        self.mt = mt
+        self._tempered = _temper(mt)
+        self._out = self._tempered.tolist()
 
-        if self.mti >= N:
-            if self.mti == N + 1:
-                self.seed(5489)
-
-            for kk in range(N - M):
-                y = (self.mt[kk] & UPPER_MASK) | (self.mt[kk + 1] & LOWER_MASK)
-                self.mt[kk] = self.mt[kk + M] ^ (y >> 1) ^ mag01[y & 1]
-
-            for kk in range(N - M, N - 1):
-                y = (self.mt[kk] & UPPER_MASK) | (self.mt[kk + 1] & LOWER_MASK)
-                self.mt[kk] = self.mt[kk + (M - N)] ^ (y >> 1) ^ mag01[y & 1]
+    def _regenerate(self):
+        if self.mti == N + 1:
+            self.seed(5489)
+        self._set_block(_twist(self.mt))
+        self.mti = 0
 
-            y = (self.mt[N - 1] & UPPER_MASK) | (self.mt[0] & LOWER_MASK)
-            self.mt[N - 1] = self.mt[M - 1] ^ (y >> 1) ^ mag01[y & 1]
-            self.mti = 0
-
-        y = self.mt[self.mti]
+    def int(self):
+        if self.mti >= N:
+            self._regenerate()
+        y = self._out[self.mti]
         self.mti += 1
-
-        y ^= y >> 11
-        y ^= (y << 7) & 0x9D2C5680
-        y ^= (y << 15) & 0xEFC60000
-        y ^= y >> 18
-
-        return y & 0xFFFFFFFF
+        return y
+
+    def ints(self, n):
+        """Return the next n outputs as a uint32 array (same values as n calls to int())."""
+        result = np.empty(n, dtype=np.uint32)
+        filled = 0
+        while filled < n:
+            if self.mti >= N:
+                self._regenerate()
+            take = min(n - filled, N - self.mti)
+            result[filled:filled + take] = self._tempered[self.mti:self.mti + take]
+            self.mti += take
+            filled += take
+        return result
+
+    def checkpoint(self):
+        """Mark the current stream position for rollback(). O(1)."""
+        self._checkpoint = (self.mti, self.mt, self._tempered, self._out)
+
+    def rollback(self):
+        """Return to the state at the last checkpoint()."""
+        self.mti, self.mt, self._tempered, self._out = self._checkpoint
+
+    def copy(self):
+        """Independent generator at the same stream position. O(1): blocks are shared."""
+        other = MersenneTwister.__new__(MersenneTwister)
+        other.mti, other.mt, other._tempered, other._out = self.mti, self.mt, self._tempered, self._out
+        return other
 
     def save_state(self):
-        return list(self.mt), self.mti
+        return self.mt.tolist(), self.mti
 
     def restore_state(self, state):
-        self.mt, self.mti = list(state[0]), state[1]
+        self._set_block(np.array(state[0], dtype=np.uint32))
+        self.mti = state[1]
 
     def to_string(self):
-        data = [self.mti] + self.mt
-        buf = struct.pack(f'>{len(data)}i', *[x if x < 0x80000000 else x - 0x100000000 for x in data])
-        return base64.b64encode(buf).decode('ascii')
+        data = np.concatenate([np.array([self.mti], dtype=np.uint32), self.mt])
+        return base64.b64encode(data.astype('>u4').tobytes()).decode('ascii')
 
     @classmethod
     def from_string(cls, s):
-        buf = base64.b64decode(s)
-        count = len(buf) // 4
-        values = struct.unpack(f'>{count}i', buf)
+        values = np.frombuffer(base64.b64decode(s), dtype='>u4').astype(np.uint32)
+        return cls.from_state(values[1:], int(values[0]))
+
+    @classmethod
+    def from_state(cls, mt, mti):
+        """Generator with state block mt (624 uint32s) at position mti, as in save_state()."""
         rng = cls.__new__(cls)
-        rng.mti = values[0] & 0xFFFFFFFF
-        rng.mt = [v & 0xFFFFFFFF for v in values[1:]]
+        rng._set_block(np.array(mt, dtype=np.uint32))
+        rng.mti = mti
         return rng
 
 
@@ -0,0 +1,255 @@
+"""Trajectory datasets: board frames, actions, rewards and rule fires on disk.
+
+A dataset is a directory of compressed .npz shards plus a meta.json that
+names the grammar, its types and its rules. Each row is one frame of an
+episode: the (size, size) grid of cell types, the action taken from it
+(-1 on the last frame of an episode), the reward that action earned, and
+the rules that fired during the step, as (rule id, cell index) pairs.
+
+TrajectoryWriter streams rows to shards of a fixed size, so datasets can be
+larger than memory; TrajectoryReader loads one shard at a time and yields
+batches of rows, whole episodes, or (frame, action, reward, next frame)
+transitions. record_episodes fills a dataset from a SokoScriptEnv.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .serialize import serialize_rule_with_types
+
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+
+def grammar_rules(grammar):
+    """All rules of a compiled grammar in a fixed order, whose positions are the rule ids
+    of a trajectory dataset: async rules by type, then sync rules by category and type,
+    then command and key rules by type."""
+    rules = []
+    for type_rules in grammar['transform']:
+        rules.extend(type_rules)
+    for transform in grammar['syncTransform']:
+        for type_rules in transform:
+            rules.extend(type_rules)
+    for bindings in (grammar['command'], grammar['key']):
+        for type_bindings in bindings:
+            for name in sorted(type_bindings):
+                rules.extend(type_bindings[name])
+    return rules
+
+
+def _shard_name(n):
+    return f'shard-{n:05d}.npz'
+
+
+class TrajectoryWriter:
+    """Append frames to a dataset directory, writing a shard every shard_size rows.
+
+    Use as a context manager, or call close() to write the last shard and meta.json.
+    """
+
+    def __init__(self, path, grammar, size, shard_size=4096, compress=True):
+        self.path = path
+        self.grammar = grammar
+        self.size = size
+        self.shard_size = shard_size
+        self.compress = compress
+        self.rules = grammar_rules(grammar)
+        self._rule_ids = {id(rule): n for n, rule in enumerate(self.rules)}
+        self._type_dtype = np.uint8 if len(grammar['types']) <= 256 else np.uint16
+        self._shards = []
+        self._episode = 0
+        self._clear()
+        os.makedirs(path, exist_ok=True)
+
+    def _clear(self):
+        self._types, self._actions, self._rewards, self._episodes = [], [], [], []
+        self._fire_counts, self._fire_rules, self._fire_cells = [], [], []
+
+    def rule_id(self, rule):
+        return self._rule_ids[id(rule)]
+
+    def add(self, types, action=-1, reward=0.0, fires=()):
+        """Append a frame. fires is a sequence of (rule, cell index) pairs, with rule a
+        compiled rule of the grammar or its rule id."""
+        # a copy: board.type_array() is a view of the live board
+        self._types.append(np.array(types, dtype=self._type_dtype, copy=True).reshape(self.size, self.size))
+        self._actions.append(action)
+        self._rewards.append(reward)
+        self._episodes.append(self._episode)
+        self._fire_counts.append(len(fires))
+        for rule, index in fires:
+            self._fire_rules.append(rule if isinstance(rule, int) else self.rule_id(rule))
+            self._fire_cells.append(index)
+        if len(self._types) >= self.shard_size:
+            self.flush()
+
+    def end_episode(self, types):
+        """Append the final frame of the current episode and start a new one."""
+        self.add(types)
+        self._episode += 1
+
+    def flush(self):
+        """Write the buffered rows as a shard."""
+        if not self._types:
+            return
+        name = _shard_name(len(self._shards))
+        arrays = {
+            'types': np.stack(self._types),
+            'action': np.array(self._actions, dtype=np.int32),
+            'reward': np.array(self._rewards, dtype=np.float32),
+            'episode': np.array(self._episodes, dtype=np.int64),
+            'fire_start': np.concatenate([[0], np.cumsum(self._fire_counts)]).astype(np.int64),
+            'fire_rule': np.array(self._fire_rules, dtype=np.int32),
+            'fire_cell': np.array(self._fire_cells, dtype=np.int32),
+        }
+        save = np.savez_compressed if self.compress else np.savez
+        save(os.path.join(self.path, name), **arrays)
+        self._shards.append({'file': name, 'rows': len(self._types)})
+        self._clear()
+
+    def close(self):
+        self.flush()
+        types = self.grammar['types']
+        meta = {
+            'version': FORMAT_VERSION,
+            'size': self.size,
+            'types': list(types),
+            'rules': [serialize_rule_with_types(rule, types) for rule in self.rules],
+            'shards': self._shards,
+        }
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """Lazy reader of a dataset written by TrajectoryWriter."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported trajectory format version {self.meta.get('version')}")
+        self.size = self.meta['size']
+        self.types = self.meta['types']
+        self.rules = self.meta['rules']
+
+    def __len__(self):
+        return sum(shard['rows'] for shard in self.meta['shards'])
+
+    def shards(self):
+        """Yield each shard as a dict of arrays (see TrajectoryWriter.flush)."""
+        for shard in self.meta['shards']:
+            with np.load(os.path.join(self.path, shard['file'])) as data:
+                yield {name: data[name] for name in data.files}
+
+    def _rows(self):
+        """Shards as batch dicts (see batches)."""
+        for shard in self.shards():
+            start = shard.pop('fire_start')
+            fire_pairs = np.stack([shard.pop('fire_rule'), shard.pop('fire_cell')], axis=1)
+            shard['fires'] = [fire_pairs[start[i]:start[i + 1]] for i in range(len(shard['action']))]
+            yield shard
+
+    def batches(self, batch_size):
+        """Yield dicts of 'types', 'action', 'reward' and 'episode' arrays of batch_size rows
+        (fewer for the last), plus 'fires', a list with an (n, 2) array of (rule id, cell index)
+        pairs per row."""
+        pending, n_pending = [], 0
+        for rows in self._rows():
+            pending.append(rows)
+            n_pending += len(rows['action'])
+            while n_pending >= batch_size:
+                batch, pending = _take(pending, batch_size)
+                n_pending -= batch_size
+                yield batch
+        if n_pending:
+            yield _concat(pending)
+
+    def episodes(self):
+        """Yield one batch dict (see batches) per episode."""
+        current = None
+        for rows in self._rows():
+            for episode in np.unique(rows['episode']).tolist():
+                part = _select(rows, np.flatnonzero(rows['episode'] == episode))
+                if current is not None and current['episode'][0] == episode:
+                    current = _concat([current, part])
+                else:
+                    if current is not None:
+                        yield current
+                    current = part
+        if current is not None:
+            yield current
+
+    def transitions(self):
+        """Yield (types, action, reward, next_types) for every step of every episode."""
+        for episode in self.episodes():
+            types = episode['types']
+            for i in range(len(types) - 1):
+                yield types[i], int(episode['action'][i]), float(episode['reward'][i]), types[i + 1]
+
+
+def _select(batch, rows):
+    return {name: [value[i] for i in rows] if name == 'fires' else value[rows]
+            for name, value in batch.items()}
+
+
+def _concat(parts):
+    return {name: [fires for p in parts for fires in p[name]] if name == 'fires'
+            else np.concatenate([p[name] for p in parts])
+            for name in parts[0]}
+
+
+def _take(parts, n):
+    """Split the first n rows off a list of batch dicts: (batch of n rows, remaining parts)."""
+    taken, rest, need = [], [], n
+    for part in parts:
+        rows = len(part['action'])
+        if need >= rows:
+            taken.append(part)
+            need -= rows
+        elif need > 0:
+            taken.append(_select(part, np.arange(need)))
+            rest.append(_select(part, np.arange(need, rows)))
+            need = 0
+        else:
+            rest.append(part)
+    return _concat(taken), rest
+
+
+def record_episodes(env, path, n_episodes, policy=None, seed=0, shard_size=4096):
+    """Run n_episodes of a SokoScriptEnv (seeded seed, seed + 1, ...) and write them to a
+    dataset at path. policy maps an observation to an action; the default samples the
+    action space. Rule fires, async and sync, are read from a journal on the env's board."""
+    writer = TrajectoryWriter(path, env._setup_board.grammar, env.board_size, shard_size=shard_size)
+    rule_ids = {}
+    with writer:
+        for episode in range(n_episodes):
+            obs, _ = env.reset(seed=seed + episode)
+            board = env.board
+            if board.grammar is not writer.grammar:
+                # an equal grammar compiled again; rule ids follow grammar_rules order
+                rule_ids = {id(rule): n for n, rule in enumerate(grammar_rules(board.grammar))}
+            journal = board.start_journal()
+            done = False
+            while not done:
+                types = board.type_array()
+                action = policy(obs) if policy else env.action_space.sample()
+                n_events = len(journal)
+                obs, reward, terminated, truncated, _ = env.step(action)
+                fires = [(rule_ids.get(id(rule), rule), index)
+                         for i in range(n_events, len(journal)) for rule, index in journal.event(i)['fires']]
+                writer.add(types, action, reward, fires)
+                done = terminated or truncated
+            board.stop_journal()
+            writer.end_episode(board.type_array())
+    return TrajectoryReader(path)
@@ -0,0 +1,311 @@
+"""Vectorized environment: a batch of SokoScript boards stepped in one call.
+
+SokoScriptVecEnv owns n SokoScriptEnv instances built from the same grammar
+source, so they share one compiled grammar (see grammar_cache). Each env
+maintains its observation directly in its row of a single preallocated
+(n_envs, *obs_shape) buffer, and finished episodes are reset automatically.
+
+SharedMemoryVecEnv spreads the same batch over forked worker processes. Each
+worker owns a contiguous slice of envs, stepped by a SokoScriptVecEnv whose
+buffers are rows of one multiprocessing.shared_memory block, so observations,
+rewards and dones are never pickled; the parent and the workers hand the block
+back and forth with a pair of barrier waits per call.
+
+rl.vec_env adapts both to the stable-baselines3 VecEnv interface.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .env import SokoScriptEnv
+
+
+class SokoScriptVecEnv:
+    """Batch of SokoScript environments with a shared observation buffer and auto-reset.
+
+    Args:
+        n_envs: Number of environments.
+        seed: If given, env i is seeded with seed + i.
+        copy_obs: If False, reset() and step() return the shared observation buffer
+            itself, which is overwritten in place by the next call.
+        **env_kwargs: Passed to SokoScriptEnv (grammar, board_size, board_init_fn, ...).
+    """
+
+    def __init__(self, n_envs, seed=None, copy_obs=True, **env_kwargs):
+        envs = [SokoScriptEnv(**env_kwargs, seed=None if seed is None else seed + i)
+                for i in range(n_envs)]
+        self._init_envs(envs, copy_obs)
+
+    @classmethod
+    def from_envs(cls, envs, copy_obs=True):
+        """Batch existing, unwrapped SokoScriptEnv instances that use the same grammar."""
+        vec_env = cls.__new__(cls)
+        vec_env._init_envs(list(envs), copy_obs)
+        return vec_env
+
+    def _init_envs(self, envs, copy_obs, buffers=None):
+        if not envs:
+            raise ValueError("SokoScriptVecEnv needs at least one env")
+        first = envs[0]
+        for env in envs:
+            if not isinstance(env, SokoScriptEnv):
+                raise TypeError(f"Expected SokoScriptEnv, got {type(env).__name__}")
+            if (env.grammar != first.grammar or env.observation_space != first.observation_space or
+                    env.action_space != first.action_space):
+                raise ValueError("All envs must share a grammar, observation space and action space")
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.observation_space = first.observation_space
+        self.action_space = first.action_space
+        self.copy_obs = copy_obs
+        if buffers is None:
+            buffers = _allocate_buffers(self.num_envs, self.observation_space)
+        self._obs, self._rewards, self._terminated, self._truncated = buffers
+        for env, obs in zip(envs, self._obs):
+            env.copy_obs = False
+            env._use_obs_buffer(obs)
+
+    def _observations(self):
+        return self._obs.copy() if self.copy_obs else self._obs
+
+    def reset(self, seed=None):
+        """Reset every env. seed is None, an int (env i gets seed + i) or a list of per-env seeds.
+
+        Returns (observations, infos)."""
+        if seed is None or isinstance(seed, (list, tuple)):
+            seeds = seed or [None] * self.num_envs
+        else:
+            seeds = [seed + i for i in range(self.num_envs)]
+        infos = [env.reset(seed=env_seed)[1] for env, env_seed in zip(self.envs, seeds)]
+        return self._observations(), infos
+
+    def step(self, actions):
+        """Step every env with its action, resetting envs whose episode ended.
+
+        Returns (observations, rewards, terminated, truncated, infos). For an env that
+        was reset, its info holds the last observation of the finished episode under
+        'terminal_observation', and observations holds the first one of the next."""
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, np.asarray(actions).tolist())):
+            _, reward, terminated, truncated, info = env.step(action)
+            self._rewards[i] = reward
+            self._terminated[i] = terminated
+            self._truncated[i] = truncated
+            if terminated or truncated:
+                info['terminal_observation'] = self._obs[i].copy()
+                env.reset()
+            infos.append(info)
+        return self._observations(), self._rewards.copy(), self._terminated.copy(), self._truncated.copy(), infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _buffer_specs(n_envs, observation_space):
+    return [((n_envs, *observation_space.shape), observation_space.dtype),
+            ((n_envs,), np.float32), ((n_envs,), np.bool_), ((n_envs,), np.bool_)]
+
+
+def _allocate_buffers(n_envs, observation_space):
+    return [np.zeros(shape, dtype=dtype) for shape, dtype in _buffer_specs(n_envs, observation_space)]
+
+
+def _carve(buf, specs):
+    """Lay out arrays of the given (shape, dtype) specs back to back in buf, 64-byte aligned."""
+    arrays, offset = [], 0
+    for shape, dtype in specs:
+        dtype = np.dtype(dtype)
+        offset = -(-offset // 64) * 64
+        count = int(np.prod(shape))
+        if buf is not None:
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset))
+        offset += count * dtype.itemsize
+    return arrays, max(offset, 1)
+
+
+_CMD_STEP, _CMD_RESET, _CMD_CLOSE = 0, 1, 2
+
+
+def _worker(env_fns, lo, hi, shm, specs, barrier):
+    arrays, _ = _carve(shm.buf, specs)
+    obs, rewards, terminated, truncated, terminal_obs, scores, steps, actions, seeds, has_seed, command = arrays
+    try:
+        vec_env = SokoScriptVecEnv.__new__(SokoScriptVecEnv)
+        vec_env._init_envs([fn() for fn in env_fns], False,
+                           [obs[lo:hi], rewards[lo:hi], terminated[lo:hi], truncated[lo:hi]])
+        barrier.wait()
+        while True:
+            barrier.wait()
+            cmd = int(command[0])
+            if cmd == _CMD_CLOSE:
+                vec_env.close()
+                return
+            if cmd == _CMD_RESET:
+                vec_env.reset(seed=[int(seeds[i]) if has_seed[i] else None for i in range(lo, hi)])
+                scores[lo:hi] = 0.0
+                steps[lo:hi] = 0
+            else:
+                _, _, _, _, infos = vec_env.step(actions[lo:hi])
+                for i, info in enumerate(infos, lo):
+                    scores[i] = info['score']
+                    steps[i] = info['step']
+                    if 'terminal_observation' in info:
+                        terminal_obs[i] = info['terminal_observation']
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        return  # another worker failed, or the parent gave up
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+class SharedMemoryVecEnv:
+    """SokoScriptVecEnv stepped by a pool of forked worker processes over shared memory.
+
+    Env i is built in its worker by calling env_fns[i](); each must return an
+    unwrapped SokoScriptEnv, and all must share a grammar, observation space and
+    action space. env_fns[0] is also called once in the parent to read the spaces.
+    Because results travel through shared memory rather than pipes, infos only carry
+    'score', 'step' and, for envs that were reset, 'terminal_observation'.
+
+    Args:
+        env_fns: One zero-argument env factory per env.
+        n_workers: Number of worker processes (default: one per CPU, at most one per env).
+        copy_obs: If False, reset() and step() return the shared observation buffer
+            itself, which is overwritten in place by the next call.
+        timeout: Seconds to wait for the workers on each call before giving up with a
+            RuntimeError (default: no limit). A worker that dies fails the call at once.
+    """
+
+    def __init__(self, env_fns, n_workers=None, copy_obs=True, timeout=None):
+        env_fns = list(env_fns)
+        if not env_fns:
+            raise ValueError("SharedMemoryVecEnv needs at least one env")
+        self.num_envs = n = len(env_fns)
+        self.n_workers = max(1, min(n_workers or os.cpu_count() or 1, n))
+        self.copy_obs = copy_obs
+        self.timeout = timeout
+        self.closed = False
+        self._closing = False
+
+        self.template_env = env_fns[0]()
+        if not isinstance(self.template_env, SokoScriptEnv):
+            raise TypeError(f"Expected SokoScriptEnv, got {type(self.template_env).__name__}")
+        self.observation_space = self.template_env.observation_space
+        self.action_space = self.template_env.action_space
+
+        specs = _buffer_specs(n, self.observation_space) + [
+            ((n, *self.observation_space.shape), self.observation_space.dtype),  # terminal observations
+            ((n,), np.float64), ((n,), np.int64),  # scores, steps
+            ((n,), np.int64), ((n,), np.int64), ((n,), np.bool_), ((1,), np.int64)]  # actions, seeds, command
+        _, size = _carve(None, specs)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        arrays, _ = _carve(self._shm.buf, specs)
+        (self._obs, self._rewards, self._terminated, self._truncated, self._terminal_obs,
+         self._scores, self._steps, self._actions, self._seeds, self._has_seed, self._command) = arrays
+
+        ctx = multiprocessing.get_context('fork')
+        self._barrier = ctx.Barrier(self.n_workers + 1)
+        bounds = np.linspace(0, n, self.n_workers + 1).astype(int)
+        self._processes = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            process = ctx.Process(target=_worker, args=(env_fns[lo:hi], lo, hi, self._shm, specs, self._barrier), daemon=True)
+            process.start()
+            self._processes.append(process)
+        threading.Thread(target=self._watch_workers, daemon=True).start()
+        self._wait()
+
+    def _watch_workers(self):
+        """Break the barrier as soon as a worker exits before close(), so the parent
+        never waits on a worker that was killed."""
+        multiprocessing.connection.wait([process.sentinel for process in self._processes])
+        if not self._closing:
+            self._barrier.abort()
+
+    def _wait(self):
+        try:
+            self._barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self._closing = True
+            self._shutdown()
+            reason = '' if self.timeout is None else f" or did not respond within {self.timeout} s"
+            raise RuntimeError(f"A SharedMemoryVecEnv worker failed{reason}") from None
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("SharedMemoryVecEnv is closed")
+
+    def _run(self, command):
+        self._command[0] = command
+        self._wait()
+        self._wait()
+
+    def _observations(self):
+        return self._obs.copy() if self.copy_obs else self._obs
+
+    def reset(self, seed=None):
+        """Reset every env. seed is None, an int (env i gets seed + i) or a list of per-env seeds.
+
+        Returns (observations, infos)."""
+        self._check_open()
+        if seed is None or isinstance(seed, (list, tuple)):
+            seeds = seed or [None] * self.num_envs
+        else:
+            seeds = [seed + i for i in range(self.num_envs)]
+        for i, env_seed in enumerate(seeds):
+            self._has_seed[i] = env_seed is not None
+            self._seeds[i] = 0 if env_seed is None else env_seed
+        self._run(_CMD_RESET)
+        return self._observations(), [{} for _ in range(self.num_envs)]
+
+    def step(self, actions):
+        """Step every env; see SokoScriptVecEnv.step.
+
+        Returns (observations, rewards, terminated, truncated, infos)."""
+        self._check_open()
+        self._actions[:] = actions
+        self._run(_CMD_STEP)
+        infos = []
+        for i in range(self.num_envs):
+            info = {'score': float(self._scores[i]), 'step': int(self._steps[i])}
+            if self._terminated[i] or self._truncated[i]:
+                info['terminal_observation'] = self._terminal_obs[i].copy()
+            infos.append(info)
+        return self._observations(), self._rewards.copy(), self._terminated.copy(), self._truncated.copy(), infos
+
+    def get_attr(self, attr_name, indices=None):
+        """Read an attribute of the parent's template env, on behalf of every env in indices.
+
+        Only meaningful for attributes that are the same for all envs (spaces, render_mode, ...)."""
+        indices = range(self.num_envs) if indices is None else indices
+        return [getattr(self.template_env, attr_name) for _ in indices]
+
+    def close(self):
+        if self.closed:
+            return
+        self._closing = True
+        self._command[0] = _CMD_CLOSE
+        try:
+            self._barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            pass
+        self._shutdown()
+
+    def _shutdown(self):
+        self.closed = True
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.template_env.close()
+        self._obs = self._obs.copy()
+        del self._rewards, self._terminated, self._truncated, self._terminal_obs
+        del self._scores, self._steps, self._actions, self._seeds, self._has_seed, self._command
+        self._shm.close()
+        self._shm.unlink()
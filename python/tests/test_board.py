@@ -1,6 +1,6 @@
 """Tests for Board class. Port of test/board.test.js."""
 
-from sokoscript.board import Board
+from sokoscript.board import Board, RangeCounter, RateTree
 
 
 def test_board_creation_defaults():
@@ -77,6 +77,24 @@ def test_type_counts():
     assert counts['_'] == 14
 
 
+def test_maintained_type_counts():
+    for storage in ('list', 'array'):
+        board = Board({'size': 8, 'seed': 1, 'grammar': 'bee _ : _ $1. dragon _ : _ $1.', 'storage': storage})
+        board.set_cell_type_by_name(0, 0, 'bee')
+        board.set_cell_type_by_name(1, 1, 'dragon', '', {'id': 'd1'})
+        board.set_cell_type_by_name(2, 2, 'dragon')
+        board.set_cell_type_by_name(3, 3, 'wyvern')
+        board.set_cell_type_by_name(4, 4, 'wyvern')
+        board.set_cell_type_by_name(4, 4, 'bee')
+        assert board.type_counts() == board.type_counts_including_unknowns()
+        assert board.type_counts()['dragon'] == 2 and board.type_counts()['wyvern'] == 1
+        # Unknown types keep their name in metadata as they move
+        board = Board({**board.to_json(), 'grammar': 'bee _ : _ $1. ? _ : _ $1.', 'storage': storage})
+        board.evolve_to_time(4 << 32, True)
+        assert board.type_counts() == board.type_counts_including_unknowns()
+        assert board.type_counts()['dragon'] == 2
+
+
 def test_json_roundtrip():
     board = Board({'size': 4, 'grammar': 'bee _ : _ bee.'})
     board.set_cell_type_by_name(2, 2, 'bee')
@@ -179,3 +197,207 @@ def test_range_counter():
     board.set_cell_type_by_name(0, 0, '_')
     assert board.by_type[a_idx].total() == 1
     assert board.by_type[0].total() == 14
+
+
+def test_range_counter_bulk_operations():
+    import random
+    rng = random.Random(5)
+    mask = [rng.random() < 0.3 for _ in range(64)]
+    counter = RangeCounter.from_mask(mask)
+    expected = [i for i, m in enumerate(mask) if m]
+    assert counter.elements() == expected
+    assert [counter.kth_element(k) for k in range(counter.total())] == expected
+
+    for batch in ([5], list(range(0, 64, 2))):
+        absent = [i for i in batch if i not in expected]
+        counter.add_many(absent)
+        expected = sorted(expected + absent)
+        assert counter.elements() == expected
+        assert [counter.kth_element(k) for k in range(counter.total())] == expected
+        present = [i for i in batch if i in expected]
+        counter.remove_many(present)
+        expected = [i for i in expected if i not in present]
+        assert [counter.kth_element(k) for k in range(counter.total())] == expected
+    copy = counter.copy()
+    copy.add_many([i for i in range(64) if i not in expected])
+    assert copy.total() == 64 and counter.elements() == expected
+
+
+def test_array_storage_matches_list_storage():
+    from tests.conftest import load_grammar
+    grammar = load_grammar('forest_fire.txt')
+    boards = [Board({'size': 8, 'seed': 42, 'grammar': grammar, 'storage': s}) for s in ('list', 'array')]
+    for board in boards:
+        for x in range(8):
+            board.set_cell_type_by_name(x, 4, 'tree')
+        board.set_cell_type_by_name(0, 4, 'fire')
+        board.set_cell_type_by_name(2, 2, 'fireman', '', {'id': 'p1'})
+        board.set_cell_type_by_name(5, 5, 'dragon', 'x')
+        board.evolve_to_time(5 << 32, True)
+    assert boards[0].to_string() == boards[1].to_string()
+    assert boards[0].type_counts_including_unknowns() == boards[1].type_counts_including_unknowns()
+    assert list(boards[0].type_array()) == list(boards[1].type_array())
+
+
+def test_array_storage_cell_view():
+    board = Board({'size': 4, 'grammar': 'bee/? : bee.', 'storage': 'array'})
+    board.set_cell_type_by_name(1, 1, 'bee', 'x', {'id': 'b1'})
+    assert board.get_cell(1, 1) == {'type': board.grammar['typeIndex']['bee'], 'state': 'x', 'meta': {'id': 'b1'}}
+    assert board.get_cell(0, 0) == {'type': 0, 'state': ''}
+    assert board.type_array()[board.xy2index(1, 1)] == board.grammar['typeIndex']['bee']
+    board.set_cell_type_by_name(1, 1, '_')
+    assert board.get_cell(1, 1) == {'type': 0, 'state': ''}
+    assert 'b1' not in board.by_id
+    board2 = Board({**board.to_json(), 'storage': 'array'})
+    assert board2.to_string() == board.to_string()
+
+
+def test_rate_tree_find():
+    weights = [0, 3, 0, 0, 5, 1, 0]
+    tree = RateTree(len(weights))
+    for i, w in enumerate(weights):
+        tree.add(i, w)
+    assert tree.total == 9
+    for r in range(tree.total):
+        i, rest = 0, r
+        while rest >= weights[i]:
+            rest -= weights[i]
+            i += 1
+        assert tree.find(r) == (i, rest)
+
+
+def test_type_rates_track_cell_updates():
+    board = Board({'size': 8, 'seed': 42, 'grammar': 'a b : a a, rate=10. a _ : _ a, rate=2. b _ : _ b, rate=2.'})
+    for x, y, t in [(2, 2, 'a'), (3, 3, 'b'), (5, 5, 'b'), (6, 1, 'b')]:
+        board.set_cell_type_by_name(x, y, t)
+    board.evolve_to_time(1 << 32, True)
+    rates = board.total_type_rates()
+    assert board.type_rates.total == sum(rates)
+    for t, rate in enumerate(rates):
+        if rate:
+            assert board.type_rates.find(sum(rates[:t])) == (t, 0)
+
+
+def test_clone_and_restore():
+    from tests.conftest import load_grammar
+    grammar = load_grammar('forest_fire.txt')
+    for storage in ('list', 'array'):
+        board = Board({'size': 8, 'seed': 42, 'grammar': grammar, 'storage': storage})
+        for x in range(8):
+            board.set_cell_type_by_name(x, 4, 'tree')
+        board.set_cell_type_by_name(0, 4, 'fire')
+        board.set_cell_type_by_name(2, 2, 'fireman', 'x', {'id': 'p1'})
+        snapshot = board.clone()
+        initial = board.to_string()
+
+        board.evolve_to_time(5 << 32, True)
+        evolved = board.to_string()
+        assert snapshot.to_string() == initial
+
+        board.restore(snapshot)
+        assert board.to_string() == initial
+        board.evolve_to_time(5 << 32, True)
+        assert board.to_string() == evolved
+        assert snapshot.to_string() == initial
+
+        branch = snapshot.clone()
+        branch.set_cell_type_by_name(2, 2, '_')
+        assert 'p1' in snapshot.by_id and 'p1' not in branch.by_id
+        assert snapshot.type_counts_including_unknowns()['fireman'] == 1
+        assert branch.type_rates.total == sum(branch.total_type_rates())
+
+
+def test_update_grammar_keeps_cells_and_reuses_rules():
+    from tests.conftest import load_grammar
+    grammar = load_grammar('forest_fire.txt')
+    edited = grammar.replace('tree fire : fire fire, rate=3.', 'tree fire : fire fire, rate=5.') + '\nwater ash : water grass.'
+    for storage in ('list', 'array'):
+        board = Board({'size': 8, 'seed': 42, 'grammar': grammar, 'storage': storage})
+        for x in range(8):
+            board.set_cell_type_by_name(x, 4, 'tree')
+        board.set_cell_type_by_name(0, 4, 'fire')
+        board.set_cell_type_by_name(2, 2, 'fireman', 'x', {'id': 'p1'})
+        board.evolve_to_time(2 << 32, True)
+        data = board.to_json()
+        old_grammar, cells = board.grammar, board.cell
+
+        board.update_grammar(edited)
+        assert board.cell is cells and board.grammar_source == edited
+        tree = board.grammar['typeIndex']['tree']
+        old_rule, new_rule = old_grammar['transform'][tree][1], board.grammar['transform'][tree][1]
+        assert (old_rule['rate'], new_rule['rate']) == (3000000, 5000000)
+        assert new_rule['compiledUpdate'] is old_rule['compiledUpdate']
+        reference = Board({**data, 'grammar': edited, 'storage': storage})
+        assert board.grammar['rateByType'] == reference.grammar['rateByType']
+        assert board.type_rates.total == sum(board.total_type_rates())
+        for b in (board, reference):
+            b.evolve_to_time(6 << 32, True)
+        assert board.to_string() == reference.to_string()
+
+        # a new type reloads the board, mapping cells to the new types by name
+        board.update_grammar(edited + '\nash : smoke.')
+        assert board.cell is not cells and board.get_cell(2, 2)['meta']['id'] == 'p1'
+        assert board.type_rates.total == sum(board.total_type_rates())
+
+
+def test_vectorized_sync_matches_scalar():
+    import random
+    grammars = [
+        'x _ : _ $1, sync=1.\ny x : x y, sync=2.\ny _ : _ y/a, sync=1.',
+        'x _ >N> _ : _ x _, sync=1.\nx ^y : $2 $1, sync=1.\ny x/* : _ y, sync=3.',
+    ]
+    for grammar in grammars:
+        assert all(rule['syncPlan'] for trans in Board({'grammar': grammar}).grammar['syncTransform']
+                   for rules in trans for rule in rules)
+        results = []
+        for vectorized in (False, True):
+            rng = random.Random(1)
+            board = Board({'size': 16, 'seed': 3, 'grammar': grammar, 'storage': 'array'})
+            board.vectorized_sync = vectorized
+            for index in range(256):
+                if rng.random() < 0.5:
+                    meta = {'id': f'c{index}'} if rng.random() < 0.05 else None
+                    board.set_cell_type_by_name(index % 16, index // 16, rng.choice('xy'), rng.choice(['', '', 'a']), meta)
+            board.evolve_to_time(6 << 32, True)
+            assert board.type_rates.total == sum(board.total_type_rates())
+            for t, counter in enumerate(board.by_type):
+                assert counter.elements() == [i for i, cell in enumerate(board.cell) if cell['type'] == t]
+            results.append(board.to_string())
+        assert results[0] == results[1]
+
+
+def test_binary_snapshot_round_trip(tmp_path):
+    import io
+    import pytest
+    from tests.conftest import load_grammar
+    grammar = load_grammar('forest_fire.txt')
+    for storage in ('list', 'array'):
+        board = Board({'size': 8, 'seed': 42, 'grammar': grammar, 'storage': storage})
+        board.owner_val = 'alice'
+        for x in range(8):
+            board.set_cell_type_by_name(x, 4, 'tree')
+        board.set_cell_type_by_name(0, 4, 'fire', 'é')
+        board.set_cell_type_by_name(2, 2, 'fireman', 'x', {'id': 'p1'})
+        board.set_cell_type_by_name(5, 5, 'ghost', 'y')
+        board.evolve_to_time(2 << 32, True)
+        path = tmp_path / f'{storage}.bin'
+        board.save_binary(path)
+        for loaded in (Board.load_binary(path, storage), Board.load_binary(io.BytesIO(board.to_binary()), storage)):
+            assert loaded.storage == storage
+            assert loaded.to_string() == board.to_string()
+            assert loaded.to_binary() == board.to_binary()
+            assert [c.level_count for c in loaded.by_type] == [c.level_count for c in board.by_type]
+            assert loaded.type_rates.tree == board.type_rates.tree
+            assert loaded.by_id == board.by_id and loaded.unknown_counts == {'ghost': 1}
+            loaded.evolve_to_time(4 << 32, True)
+        board.evolve_to_time(4 << 32, True)
+        assert loaded.to_string() == board.to_string()
+
+    data = bytearray(board.to_binary())
+    data[8] = 99
+    with pytest.raises(ValueError, match='version 99'):
+        Board.load_binary(io.BytesIO(bytes(data)))
+    with pytest.raises(ValueError, match='Not a binary'):
+        Board.load_binary(io.BytesIO(board.to_string().encode()))
+    with pytest.raises(ValueError, match='Truncated'):
+        Board.load_binary(io.BytesIO(board.to_binary()[:200]))
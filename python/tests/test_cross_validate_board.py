@@ -52,9 +52,9 @@ process.stdout.write(JSON.stringify(cells));
     return json.loads(result.stdout)
 
 
-def _run_py_evolution(grammar, size, seed, setup_cells, evolve_seconds):
+def _run_py_evolution(grammar, size, seed, setup_cells, evolve_seconds, storage='list'):
     """Run Python board evolution and return cell dump."""
-    board = Board({'size': size, 'seed': seed, 'grammar': grammar})
+    board = Board({'size': size, 'seed': seed, 'grammar': grammar, 'storage': storage})
     for x, y, t, s, m in setup_cells:
         board.set_cell_type_by_name(x, y, t, s or '', m)
     board.evolve_to_time(evolve_seconds << 32, True)
@@ -75,9 +75,9 @@ def _run_py_evolution(grammar, size, seed, setup_cells, evolve_seconds):
 @pytest.mark.skipif(not _js_available(), reason="Node.js not available")
 class TestBoardCrossValidation:
 
-    def _compare(self, grammar, size, seed, setup_cells, evolve_seconds):
+    def _compare(self, grammar, size, seed, setup_cells, evolve_seconds, storage='list'):
         js_cells = _run_js_evolution(grammar, size, seed, setup_cells, evolve_seconds)
-        py_cells = _run_py_evolution(grammar, size, seed, setup_cells, evolve_seconds)
+        py_cells = _run_py_evolution(grammar, size, seed, setup_cells, evolve_seconds, storage)
 
         # Sort for stable comparison
         js_sorted = sorted(js_cells, key=lambda c: (c['y'], c['x']))
@@ -151,6 +151,19 @@ class TestBoardCrossValidation:
             evolve_seconds=2,
         )
 
+    def test_vectorized_sync_diffusion(self):
+        """Sync rules through the vectorized engine (array storage)."""
+        setup = [(x, y, 'x', 'a' if (x + y) % 5 == 0 else '', None)
+                 for x in range(8) for y in range(8) if (x * 3 + y * 5) % 7 < 3]
+        setup += [(1, 1, 'y', '', None), (6, 6, 'y', '', None)]
+        self._compare(
+            grammar='x _ : _ $1, sync=1.\ny x : x y, sync=2.\nx/a ^y : $2 $1, sync=2.',
+            size=8, seed=42,
+            setup_cells=setup,
+            evolve_seconds=3,
+            storage='array',
+        )
+
     def test_state_preservation(self):
         """Rules that preserve state."""
         self._compare(
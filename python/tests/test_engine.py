@@ -1,6 +1,7 @@
 """Tests for engine module."""
 
 from sokoscript.board import Board
+from sokoscript.engine import transform_rule_update
 
 
 def test_basic_pattern_match():
@@ -55,3 +56,96 @@ def test_negation_matching():
     counts = board.type_counts_including_unknowns()
     # a should have spread (replacing empties)
     assert counts['a'] >= 1
+
+
+def test_compiled_rules_match_interpreter():
+    import random
+    from sokoscript import lookups
+    from sokoscript.engine import match_lhs, _strip_duplicate_metadata
+    from tests.conftest import load_grammar
+
+    def interpret(board, x, y, direction, rule):
+        matcher = match_lhs(board, x, y, direction, rule)
+        if matcher.failed:
+            return None
+        update = [matcher.new_cell_update(term, pos, rule.get('score')) for pos, term in enumerate(rule['rhs'])]
+        for i in range(len(update) - 1):
+            for j in range(i + 1, len(update)):
+                _strip_duplicate_metadata(matcher, update[i][2], update[j][2], rule['rhs'][i], rule['rhs'][j])
+        return update
+
+    rng = random.Random(1)
+    chars = '01234' + ''.join(lookups.vec2char((x, y)) for x in range(-1, 2) for y in range(-1, 2))
+    # state-dependent addresses, and locations read back as state chars
+    dynamic = 'a/? >1> _ : _ $1/@2.\na/? >1#1> b/? >2#1> _ : $1/@clock($1#1)@3 _ $2.'
+    for source in (load_grammar('sandpile.txt'), load_grammar('forest_fire.txt'), dynamic):
+        board = Board({'size': 4, 'grammar': source})
+        rules = [rule for rules in board.grammar['transform'] for rule in rules]
+        n_types = len(board.grammar['types']) - 1
+        matched = 0
+        for _ in range(50):
+            for index in range(16):
+                state = ''.join(rng.choice(chars) for _ in range(rng.choice([0, 1, 2])))
+                meta = {'id': f'c{index}', 'score': 1} if rng.random() < 0.1 else None
+                board.set_cell_by_index(index, {'type': rng.randrange(n_types), 'state': state,
+                                                **({'meta': meta} if meta else {})})
+            for rule in rules:
+                x, y, direction = rng.randrange(4), rng.randrange(4), rng.choice(lookups.dirs)
+                expected = interpret(board, x, y, direction, rule)
+                assert rule['compiledUpdate'](board, x, y, direction) == expected
+                matched += expected is not None
+        assert matched > 0
+
+
+def test_neighbor_filter():
+    board = Board({'size': 4, 'grammar': 'a b : b a.\na ^b : a a.\na * : _ a.\na ^b/x : _ _.'})
+    types = board.grammar['types']
+    a, b = types.index('a'), types.index('b')
+    swap, negated, wildcard, state_dependent = board.grammar['transform'][a]
+    offsets, accepted = swap['neighborFilter']
+    assert offsets['E'] == (1, 0) and offsets['N'] == (0, -1)
+    assert accepted == {b}
+    assert negated['neighborFilter'] is None
+    assert wildcard['neighborFilter'] is None
+    assert state_dependent['neighborFilter'] is None
+    board.set_cell_type_by_name(1, 1, 'a')
+    board.set_cell_type_by_name(2, 1, 'b')
+    assert transform_rule_update(board, 1, 1, 'W', swap) is None
+    assert transform_rule_update(board, 1, 1, 'E', swap) is not None
+    board.set_cell_type_by_name(2, 1, 'b', 'x')
+    assert transform_rule_update(board, 1, 1, 'E', negated) is not None
+
+    board = Board({'size': 4, 'grammar': 'a b : b a.\na ^b/* : a a.'})
+    b = board.grammar['types'].index('b')
+    negated = board.grammar['transform'][board.grammar['types'].index('a')][1]
+    assert negated['neighborFilter'][1] == set(range(len(board.grammar['types']))) - {b}
+
+
+def test_compile_rule_rejects_only_unsupported_rules(monkeypatch):
+    import pytest
+    from sokoscript import engine
+    rule = {'lhs': [{'type': 1}], 'rhs': [{'type': 0, 'state': [{'op': 'unknown'}]}]}
+    assert engine.compile_rule(rule) is None
+    rule = {'lhs': [{'type': 1}], 'rhs': [{'type': 0}]}
+    assert engine.compile_rule(rule) is not None
+
+    def broken(t):
+        raise KeyError('type')
+    monkeypatch.setattr(engine, '_compile_lhs_term', broken)
+    with pytest.raises(KeyError):
+        engine.compile_rule(rule)
+
+
+def test_sync_plan_rejects_only_unsupported_rules(monkeypatch):
+    import pytest
+    from sokoscript import engine
+    rule = {'lhs': [{'type': 1}], 'rhs': [{'type': 0, 'state': [{'op': 'unknown'}]}]}
+    assert engine.sync_plan(rule, 3) is None
+    rule = {'lhs': [{'type': 1}], 'rhs': [{'type': 0}]}
+    assert engine.sync_plan(rule, 3) is not None
+
+    def broken(term, n_types):
+        raise IndexError(n_types)
+    monkeypatch.setattr(engine, '_term_match_tables', broken)
+    with pytest.raises(IndexError):
+        engine.sync_plan(rule, 3)
@@ -15,7 +15,7 @@ from tests.conftest import load_grammar
 @pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
 class TestSokoScriptEnv:
 
-    def _make_forest_fire_env(self, seed=42):
+    def _make_forest_fire_env(self, seed=42, **kwargs):
         from sokoscript.env import SokoScriptEnv
         grammar = load_grammar('forest_fire.txt')
 
@@ -36,6 +36,7 @@ class TestSokoScriptEnv:
             score_reward_scale=1.0,
             time_penalty=0.01,
             seed=seed,
+            **kwargs,
         )
 
     def test_env_creation(self):
@@ -113,3 +114,43 @@ class TestSokoScriptEnv:
         from gymnasium.utils.env_checker import check_env
         # check_env will raise on failures
         check_env(env.unwrapped, skip_render_check=True)
+
+    def test_cached_initial_board_matches_fresh_reset(self):
+        fresh = self._make_forest_fire_env()
+        cached = self._make_forest_fire_env(cache_initial_board=True)
+        for seed in (1, 2, 1):
+            obs_a, _ = fresh.reset(seed=seed)
+            obs_b, _ = cached.reset(seed=seed)
+            np.testing.assert_array_equal(obs_a, obs_b)
+            for step in range(20):
+                obs_a, reward_a, term_a, _, _ = fresh.step(step % fresh.action_space.n)
+                obs_b, reward_b, term_b, _, _ = cached.step(step % cached.action_space.n)
+                np.testing.assert_array_equal(obs_a, obs_b)
+                assert (reward_a, term_a) == (reward_b, term_b)
+            assert fresh.board.to_string() == cached.board.to_string()
+
+    def test_incremental_observation_matches_full_render(self):
+        from sokoscript.env import _board_to_observation
+        for copy_obs in (True, False):
+            env = self._make_forest_fire_env(copy_obs=copy_obs)
+            obs, _ = env.reset(seed=3)
+            np.testing.assert_array_equal(obs, _board_to_observation(env.board, env.num_types))
+            for step in range(20):
+                next_obs, _, terminated, _, _ = env.step(step % env.action_space.n)
+                assert (next_obs is obs) == (not copy_obs)
+                np.testing.assert_array_equal(next_obs, _board_to_observation(env.board, env.num_types))
+                if terminated:
+                    break
+
+    def test_types_observation_mode(self):
+        onehot = self._make_forest_fire_env()
+        types = self._make_forest_fire_env(observation_mode='types')
+        assert types.observation_space.shape == (16, 16)
+        assert types.observation_space.dtype == np.uint8
+        obs_a, _ = onehot.reset(seed=5)
+        obs_b, _ = types.reset(seed=5)
+        for step in range(10):
+            assert types.observation_space.contains(obs_b)
+            np.testing.assert_array_equal(obs_a.argmax(axis=-1), obs_b)
+            obs_a, _, _, _, _ = onehot.step(step % onehot.action_space.n)
+            obs_b, _, _, _, _ = types.step(step % types.action_space.n)
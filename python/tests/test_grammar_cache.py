@@ -0,0 +1,84 @@
+"""Tests for grammar_cache module."""
+
+import os
+
+import numpy as np
+
+from sokoscript import grammar_cache
+from sokoscript.board import Board
+from tests.conftest import load_grammar
+
+
+def test_boards_share_compiled_grammar():
+    source = load_grammar('forest_fire.txt')
+    a = Board({'size': 4, 'grammar': source})
+    b = Board({'size': 8, 'grammar': source})
+    assert a.grammar is b.grammar
+    assert Board({'size': 4, 'grammar': source + '\n'}).grammar is not a.grammar
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(grammar_cache, 'MAX_ENTRIES', 2)
+    grammar_cache.clear()
+    first = grammar_cache.get_compiled_grammar('a _ : _ a.')
+    grammar_cache.get_compiled_grammar('b _ : _ b.')
+    assert grammar_cache.get_compiled_grammar('a _ : _ a.') is first
+    grammar_cache.get_compiled_grammar('c _ : _ c.')
+    assert grammar_cache.get_compiled_grammar('a _ : _ a.') is first
+    assert len(grammar_cache._cache) == 2
+
+
+def test_disk_cache_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(grammar_cache, '_cache_dir', None)
+    grammar_cache.set_cache_dir(str(tmp_path))
+    source = load_grammar('sandpile.txt')
+    grammar_cache.clear()
+    compiled = grammar_cache.get_compiled_grammar(source)
+    assert len(os.listdir(tmp_path)) == 1
+
+    grammar_cache.clear()
+    loaded = grammar_cache.get_compiled_grammar(source)
+    assert loaded is not compiled
+    assert loaded['types'] == compiled['types']
+    assert all(rule['compiledUpdate'] is not None for rules in loaded['transform'] for rule in rules)
+
+    boards = []
+    for grammar in (compiled, loaded):
+        grammar_cache._cache.clear()
+        grammar_cache._cache[grammar_cache.grammar_hash(source)] = grammar
+        board = Board({'size': 16, 'seed': 7, 'grammar': source})
+        board.set_cell_type_by_name(8, 8, board.grammar['types'][1])
+        board.evolve_to_time(1 << 34, True)
+        boards.append(board.to_string())
+    assert boards[0] == boards[1]
+
+
+def test_disk_cache_ignores_stale_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(grammar_cache, '_cache_dir', str(tmp_path))
+    source = 'a _ : _ a.'
+    key = grammar_cache.grammar_hash(source)
+    # a pickle of a class that no longer exists
+    with open(grammar_cache._path(key), 'wb') as f:
+        f.write(b'csokoscript.grammar_cache\n_Removed\n.')
+    grammar_cache.clear()
+    grammar = grammar_cache.get_compiled_grammar(source)
+    assert grammar['types'] == ['_', 'a', '?']
+
+
+def test_disk_cache_round_trip_with_sync_plans(tmp_path, monkeypatch):
+    monkeypatch.setattr(grammar_cache, '_cache_dir', str(tmp_path))
+    source = load_grammar('sync_diffuse.txt')
+    grammar_cache.clear()
+    compiled = grammar_cache.get_compiled_grammar(source)
+    grammar_cache.clear()
+    loaded = grammar_cache.get_compiled_grammar(source)
+    assert loaded is not compiled
+    plans = [(a['syncPlan'], b['syncPlan']) for a, b in zip(grammar_cache._all_rules(compiled),
+                                                          grammar_cache._all_rules(loaded)) if 'syncPlan' in a]
+    assert plans and any(plan is not None for plan, _ in plans)
+    for plan, loaded_plan in plans:
+        assert (plan is None) == (loaded_plan is None)
+        if plan is not None:
+            for name in ('offsets', 'matchEmpty', 'matchNonEmpty'):
+                np.testing.assert_array_equal(plan[name], loaded_plan[name])
+            assert plan['writes'] == loaded_plan['writes']
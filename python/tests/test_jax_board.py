@@ -0,0 +1,96 @@
+"""Tests for the JAX board mirror."""
+
+import io
+
+import pytest
+import numpy as np
+
+from sokoscript.jax_board import HAS_JAX
+
+pytestmark = pytest.mark.skipif(not HAS_JAX, reason="jax not installed")
+
+GRAMMAR = 'x _ : _ $1, sync=1.\ny x : x y/b.\ny _ : _ y/a.\nx/* y : $2 $1.'
+
+
+def _populate(board):
+    rng = np.random.default_rng(2)
+    for index in range(board.size * board.size):
+        if rng.random() < 0.5:
+            board.set_cell_type_by_name(index % board.size, index // board.size,
+                                        rng.choice(['x', 'y']), rng.choice(['', 'a', 'long' * 20]))
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_jax_mirror_matches_board(storage):
+    from sokoscript.jax_board import JAXBoard, JAXBoardState
+    board = JAXBoard({'size': 16, 'seed': 1, 'grammar': GRAMMAR, 'storage': storage})
+    _populate(board)
+    for t in (1, 3):
+        board.evolve_to_time(t << 32, True)
+        assert not board._jax_pending
+        state = board.get_jax_state()
+        expected = JAXBoardState.from_board(board)
+        np.testing.assert_array_equal(state.cell_types, expected.cell_types)
+        np.testing.assert_array_equal(state.cell_states, expected.cell_states)
+        np.testing.assert_array_equal(state.cell_state_lens, expected.cell_state_lens)
+        cells = state.to_board_cells(board.grammar['types'])
+        assert cells == [{'type': cell['type'], 'state': cell['state']} for cell in board.cell]
+
+    board.set_cell_type_by_name(0, 0, 'y', 'q')
+    assert board.get_jax_state().get_state(0, 0) == 'q'
+    assert board.get_observation().shape == (16, 16, len(board.grammar['types']))
+
+    loaded = JAXBoard.load_binary(io.BytesIO(board.to_binary()), storage)
+    np.testing.assert_array_equal(loaded.get_jax_state().cell_states, board.get_jax_state().cell_states)
+
+
+def test_jax_sync_mode():
+    from sokoscript.board import Board
+    from sokoscript.jax_board import JAXBoard
+    grammar = 'x _ : _ $1, sync=1.\ny x : x y, sync=2.'
+    results = []
+    for one_tick_at_a_time in (False, True):
+        board = JAXBoard({'size': 16, 'seed': 4, 'grammar': grammar, 'storage': 'array'})
+        board.jax_sync = True
+        rng = np.random.default_rng(5)
+        for index in range(256):
+            if rng.random() < 0.4:
+                board.set_cell_type_by_name(index % 16, index // 16, rng.choice(['x', 'y']))
+        counts = board.type_counts()
+        for t in (range(1, 7) if one_tick_at_a_time else [6]):
+            board.evolve_to_time(t << 31)
+        assert board.type_counts() == counts
+        assert board.time == 6 << 31
+        for t, counter in enumerate(board.by_type):
+            assert counter.elements() == np.flatnonzero(board.type_array() == t).tolist()
+        np.testing.assert_array_equal(np.asarray(board.get_jax_state().cell_types).ravel(), board.type_array())
+        results.append(board.to_string())
+    assert results[0] == results[1]
+
+    # a state that cannot be encoded sends sync ticks down the Board path
+    boards = [JAXBoard({'size': 16, 'seed': 4, 'grammar': grammar, 'storage': 'array'}),
+              Board({'size': 16, 'seed': 4, 'grammar': grammar, 'storage': 'array'})]
+    boards[0].jax_sync = True
+    for board in boards:
+        board.set_cell_type_by_name(3, 3, 'x', '\u00e9')
+        board.set_cell_type_by_name(5, 3, 'y')
+        board.evolve_to_time(3 << 32)
+    assert boards[0].to_string() == boards[1].to_string()
+
+
+def test_jax_sync_mode_with_states():
+    from sokoscript.jax_board import JAXBoard
+    board = JAXBoard({'size': 16, 'grammar': 'x/? : x/@add($1#1,@int(1)), sync=1.\ny/* : y/$1#*a, sync=1.',
+                      'storage': 'array'})
+    board.jax_sync = True
+    for index in range(0, 256, 3):
+        board.set_cell_type_by_name(index % 16, index // 16, 'x', '0')
+    board.set_cell_type_by_name(1, 0, 'y')
+    board.evolve_to_time(12 << 32)
+    assert board.get_cell(0, 0) == {'type': board.grammar['typeIndex']['x'], 'state': '<'}
+    assert board.get_cell(1, 0)['state'] == 'a' * 12  # outgrows the first 8-char step
+    assert board.type_counts() == {'_': 256 - 86 - 1, 'x': 86, 'y': 1, '?': 0}
+    for t, counter in enumerate(board.by_type):
+        assert counter.elements() == np.flatnonzero(board.type_array() == t).tolist()
+    assert board.get_jax_state().to_board_cells(board.grammar['types']) == \
+        [{'type': cell['type'], 'state': cell['state']} for cell in board.cell]
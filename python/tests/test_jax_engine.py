@@ -0,0 +1,213 @@
+"""Tests for the jitted JAX sync step."""
+
+from collections import Counter
+
+import pytest
+import numpy as np
+
+from sokoscript.board import Board
+from sokoscript.jax_engine import HAS_JAX
+
+pytestmark = pytest.mark.skipif(not HAS_JAX, reason="jax not installed")
+
+
+def test_sync_step_tables():
+    from sokoscript.jax_engine import sync_step_tables
+    grammar = Board({'grammar': 'x _ : _ $1, sync=1.\ny x : x y/a, sync=2.'}).grammar
+    subject_types, offsets, match, write_src, write_type = sync_step_tables(grammar, [0])
+    assert offsets.shape == (1, 4, 2, 2)
+    assert write_src.tolist() == [[-1, 0]]
+    assert write_type[0, 0] == grammar['typeIndex']['_']
+    assert sync_step_tables(grammar, [1]) is None  # writes a state
+
+
+def test_sync_step_matches_board_in_distribution():
+    import jax
+    from sokoscript.jax_engine import compile_sync_step
+    grammar = 'x _ : _ $1, sync=1.\nx x : y $1, sync=1.'
+    initial = Board({'size': 2, 'grammar': grammar, 'storage': 'array'})
+    for x, y in [(0, 0), (1, 0), (0, 1)]:
+        initial.set_cell_type_by_name(x, y, 'x')
+    trials = 1500
+    board_outcomes = Counter()
+    for seed in range(trials):
+        board = initial.clone()
+        board.rng = type(board.rng)(seed)
+        board.evolve_to_time(1 << 32, True)
+        board_outcomes[tuple(board.type_array().tolist())] += 1
+
+    step = compile_sync_step(initial.grammar, [0], 2)
+    types = initial.type_array().reshape(2, 2).astype(np.uint8)
+    jax_outcomes = Counter(tuple(np.asarray(step(types, jax.random.PRNGKey(seed))).reshape(-1).tolist())
+                           for seed in range(trials))
+    assert set(jax_outcomes) <= set(board_outcomes)
+    for outcome, count in board_outcomes.items():
+        assert abs(count - jax_outcomes[outcome]) < 0.05 * trials
+
+
+def test_sync_run_matches_steps():
+    import jax
+    from sokoscript.jax_engine import compile_sync_run, compile_sync_step
+    grammar = Board({'grammar': 'x _ : _ $1, sync=1.\ny x : x y, sync=2.'}).grammar
+    rng = np.random.default_rng(0)
+    types = rng.choice(3, size=(8, 8), p=[0.5, 0.3, 0.2]).astype(np.uint8)
+    category_sets = [(0,), (0, 1)]
+    seeds = np.array([7, 8, 9, 0], dtype=np.uint32)
+    branch_ids = np.array([0, 1, 0, 0], dtype=np.int32)
+    run = compile_sync_run(grammar, category_sets, 8)
+    steps = [compile_sync_step(grammar, cats, 8) for cats in category_sets]
+    expected = types
+    for seed, branch in zip(seeds[:3].tolist(), branch_ids[:3].tolist()):
+        expected = steps[branch](expected, jax.random.PRNGKey(np.uint32(seed)))
+    np.testing.assert_array_equal(run(types, seeds, branch_ids, 3), expected)
+    assert np.bincount(np.asarray(expected).ravel(), minlength=3).tolist() == \
+        np.bincount(types.ravel(), minlength=3).tolist()
+
+
+def test_batch_simulator():
+    import jax
+    from sokoscript.jax_engine import BatchSimulator
+    grammar = Board({'grammar': 'x _ : _ $1, sync=1.\ny x : x y, sync=2.'}).grammar
+    rng = np.random.default_rng(1)
+    types = rng.choice(3, size=(4, 8, 8), p=[0.5, 0.3, 0.2]).astype(np.uint8)
+    keys = jax.random.split(jax.random.PRNGKey(0), 4)
+    sim = BatchSimulator(grammar, 8)
+    out, new_keys = sim.evolve(types, keys, 0, 3 << 32)
+    assert out.shape == types.shape and out.dtype == types.dtype
+    np.testing.assert_array_equal(sim.evolve(types, keys, 0, 3 << 32)[0], out)
+    for before, after in zip(types, np.asarray(out)):
+        assert np.bincount(after.ravel(), minlength=3).tolist() == np.bincount(before.ravel(), minlength=3).tolist()
+    assert len({np.asarray(board).tobytes() for board in out}) == 4
+    assert not np.array_equal(new_keys, keys)
+
+
+def test_batch_simulator_tau_leaping():
+    import jax
+    from sokoscript.jax_engine import BatchSimulator
+    grammar = Board({'grammar': 'a : b.\nb _ : _ $1.'}).grammar
+    with pytest.raises(ValueError):
+        BatchSimulator(grammar, 8)
+    sim = BatchSimulator(grammar, 8, tau=0.05)
+    a, b = grammar['typeIndex']['a'], grammar['typeIndex']['b']
+    types = np.zeros((32, 8, 8), dtype=np.uint8)
+    types[:, :4] = a
+    out, _ = sim.evolve(types, jax.random.split(jax.random.PRNGKey(3), 32), 0, 1 << 32)
+    out = np.asarray(out)
+    assert ((out == a) | (out == b)).sum() == 32 * 32
+    assert abs((out == a).sum() / (32 * 32) - np.exp(-1)) < 0.05
+
+
+STATE_GRAMMAR = r'''
+a/? b/[0123] : $1/@add($1#1,$2#1) $2/@sub($2#1,@int(1)).
+a/* b : b/$1#* a/@F.
+a/0 b/* : b/y$2#* a/$2#*.
+a/[@vec(0,1)@vec(1,0)] _ : _ a/@clock($1#1)@anti($1#1)@L.
+b/(@R) a/? : b/@F@B a/$1#1$2#1.
+a/[^12] b/(@add($1#1,@int(1))) : a/1 b/2.
+a/?? ^b : a/($1#2+@vec(1,1)) $2.
+b/* (a|_) : $2 $1.
+a/* _ b : $3/$1#* _ b/@vec(1,0)x.
+'''
+
+
+def test_state_rule_set_matches_engine():
+    import jax.numpy as jnp
+    from sokoscript import lookups
+    from sokoscript.engine import transform_rule_update
+    from sokoscript.jax_board import _encode_states
+    from sokoscript.jax_engine import state_rule_set
+    size, width = 16, 4
+    board = Board({'size': size, 'grammar': STATE_GRAMMAR, 'storage': 'array'})
+    rng = np.random.default_rng(0)
+    chars = list('01234xy@AB') + [lookups.vec2char((1, 0)), lookups.vec2char((0, 1))]
+    for index in range(size * size):
+        state = ''.join(rng.choice(chars, size=rng.integers(0, 4)))
+        board.set_cell_by_index(index, {'type': int(rng.integers(len(board.grammar['types']))), 'state': state})
+    types = board.type_array().astype(np.int32)
+    codes, lens = _encode_states([cell['state'] for cell in board.cell])
+    codes, lens = codes[:, :width].astype(np.int32), lens.astype(np.int32)
+    cells = np.arange(size * size)
+    n_matched = 0
+    for rule in board.grammar['transform'][board.grammar['typeIndex']['a']] + \
+            board.grammar['transform'][board.grammar['typeIndex']['b']]:
+        offsets, match_fn, write_fn = state_rule_set([rule], width)
+        for d, direction in enumerate(lookups.dirs):
+            off = np.asarray(offsets)[0, d]
+            footprint = ((cells // size)[:, None] + off[:, 1]) % size * size + ((cells % size)[:, None] + off[:, 0]) % size
+            old = (jnp.asarray(types[footprint]), jnp.asarray(codes[footprint]), jnp.asarray(lens[footprint]))
+            item_rule, dirs = jnp.zeros(len(cells), dtype=jnp.int32), jnp.full(len(cells), d)
+            matched, error = (np.asarray(a) for a in match_fn(old, item_rule, dirs))
+            new_cells, mask, bad = write_fn(old, item_rule, dirs)
+            (new_types, new_codes, new_lens), mask, bad = map(np.asarray, new_cells), np.asarray(mask), np.asarray(bad)
+            assert not error.any()
+            for index in cells.tolist():
+                updates = transform_rule_update(board, index % size, index // size, direction, rule)
+                assert matched[index] == bool(updates)
+                if not updates:
+                    continue
+                n_matched += 1
+                expected = [(cell['type'], cell['state']) for _, _, cell in updates]
+                if bad[index]:
+                    assert any(len(state) > width for _, state in expected)
+                    continue
+                assert mask[index, :len(updates)].all()
+                assert expected == [(new_types[index, pos], ''.join(map(chr, new_codes[index, pos, :new_lens[index, pos]])))
+                                    for pos in range(len(updates))]
+    assert n_matched > 50
+
+
+def test_state_char_expr_rejects_missing_groups():
+    from sokoscript.jax_engine import _state_char_expr, _Unsupported
+    locations = [['A', 'B', 'C', 'D']]
+    for op in ('location', 'state'):
+        with pytest.raises(_Unsupported):
+            _state_char_expr({'op': op, 'group': 2, 'char': 1}, locations, 1)
+
+
+def test_state_sync_step():
+    import jax
+    from sokoscript.jax_board import _encode_states
+    from sokoscript.jax_engine import compile_state_sync_step
+    grammar = Board({'grammar': 'x/? : x/@add($1#1,@int(1)), sync=1.\ny/* : y/ab$1#*, sync=1.'}).grammar
+    x, y = grammar['typeIndex']['x'], grammar['typeIndex']['y']
+    step = compile_state_sync_step(grammar, [0], 4, 8)
+    types = np.zeros((4, 4), dtype=np.uint8)
+    types[0] = x
+    types[1, :2] = y
+    codes, lens = _encode_states(['0', '3', '', '~'] + ['', 'abc'] + [''] * 10)
+    codes = codes[:, :8].reshape(4, 4, 8)
+    new_types, new_codes, new_lens, failed = step(types, codes, lens.reshape(4, 4), jax.random.PRNGKey(0))
+    assert not failed
+    np.testing.assert_array_equal(new_types, types)
+    states = [''.join(map(chr, c[:n])) for c, n in zip(np.asarray(new_codes).reshape(16, 8), np.asarray(new_lens).ravel())]
+    assert states[:6] == ['1', '4', '', '!', 'ab', 'ababc']
+    # ababc does not fit in 4 chars
+    _, _, _, failed = compile_state_sync_step(grammar, [0], 4, 4)(types, codes[..., :4], lens.reshape(4, 4),
+                                                                  jax.random.PRNGKey(0))
+    assert failed
+    assert compile_state_sync_step(Board({'grammar': 'x/? >1> y : y x, sync=1.'}).grammar, [0], 4, 8) is None
+
+
+def test_batch_simulator_states():
+    import jax
+    from sokoscript.jax_engine import BatchSimulator
+    from tests.conftest import load_grammar
+    grammar = Board({'grammar': load_grammar('sandpile.txt')}).grammar
+    with pytest.raises(ValueError):
+        BatchSimulator(grammar, 8, tau=0.05)  # sandpile rules write states
+    sim = BatchSimulator(grammar, 8, tau=0.05, state_width=8)
+    types = np.full((4, 8, 8), grammar['typeIndex']['sandpile'], dtype=np.uint8)
+    states = np.zeros((4, 8, 8, 8), dtype=np.uint8)
+    states[..., 0] = ord('0')
+    lens = np.ones((4, 8, 8), dtype=np.uint8)
+    keys = jax.random.split(jax.random.PRNGKey(0), 4)
+    types, states, lens, _, failed = sim.evolve_states(types, states, lens, keys, 0, 20 << 32)
+    assert not np.asarray(failed).any()
+    cells = {(int(t), bytes(s[:n]).decode()) for t, s, n in zip(np.asarray(types).ravel(), np.asarray(states).reshape(-1, 8),
+                                                               np.asarray(lens).ravel())}
+    sandpile, avalanche = grammar['typeIndex']['sandpile'], grammar['typeIndex']['avalanche']
+    assert {state for t, state in cells if t == sandpile} <= set('01234')
+    assert all(len(state) == 2 for t, state in cells if t == avalanche)
+    assert {state for t, state in cells if t == sandpile} - {'0'}
+    with pytest.raises(ValueError):
+        sim.evolve(types, keys, 0, 1 << 32)
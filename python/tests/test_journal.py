@@ -0,0 +1,69 @@
+import pytest
+
+from sokoscript.board import Board
+from tests.conftest import load_grammar
+
+
+def _journal_round_trip(board, times, hard_stop=True):
+    journal = board.start_journal()
+    snapshots = []
+    for t in times:
+        board.evolve_to_time(t, hard_stop)
+        snapshots.append(board.to_string())
+    final = board.to_string()
+    assert len(journal) > 0
+
+    for t, snapshot in zip(times, snapshots):
+        assert journal.replay(t).to_string() == snapshot
+    assert journal.replay().to_string() == journal.replay(times[-1]).to_string()
+
+    for t, snapshot in reversed(list(zip(times, snapshots))):
+        board.undo_to_time(t)
+        assert board.to_string() == snapshot
+    # the restored RNG reproduces the same future
+    for t in times[1:]:
+        board.evolve_to_time(t, hard_stop)
+    assert board.to_string() == final
+    return journal
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_journal_replay_and_undo(storage):
+    board = Board({'size': 8, 'seed': 42, 'grammar': load_grammar('forest_fire.txt'), 'storage': storage})
+    for x in range(8):
+        for y in range(8):
+            board.set_cell_type_by_name(x, y, 'tree' if y % 2 else 'fire')
+    board.set_cell_type_by_name(2, 2, 'fireman', 'x', {'id': 'p1'})
+    journal = _journal_round_trip(board, [k << 32 for k in range(1, 9)])
+    event = next(journal.event(i) for i in range(len(journal)) if journal.event(i)['kind'] != 'stop')
+    assert event['kind'] == 'rule' and event['rule'] in journal.rules
+    assert event['cells'] and event['dir'] is not None
+
+    board = Board({'size': 8, 'seed': 7, 'grammar': load_grammar('sync_diffuse.txt'), 'storage': storage})
+    for x in range(4):
+        board.set_cell_type_by_name(x, x, 'x')
+    journal = _journal_round_trip(board, [k << 32 for k in range(1, 6)])
+    assert {journal.event(i)['kind'] for i in range(len(journal))} == {'stop', 'sync' if storage == 'array' else 'rule'}
+    sync_rules = [rule for rules in board.grammar['syncTransform'][0] for rule in rules]
+    fires = [fire for i in range(len(journal)) for fire in journal.event(i)['fires']]
+    assert fires and all(rule in sync_rules and 0 <= index < 64 for rule, index in fires)
+
+    board.set_cell_type_by_name(7, 7, 'x')
+    assert journal.event(len(journal) - 1)['kind'] == 'edit'
+    board.undo_to_time(1 << 32)
+    assert board.get_cell(7, 7)['type'] == 0
+    with pytest.raises(ValueError):
+        board.undo_to_time(-1)
+
+
+@pytest.mark.parametrize('storage', ['list', 'array'])
+def test_journal_soft_stops(storage):
+    # soft stops roll back the RNG draws of the rejected attempt, and most steps change no cell
+    board = Board({'size': 8, 'seed': 3, 'grammar': 'a b : b a.', 'storage': storage})
+    for index in range(64):
+        board.set_cell_type_by_name(index % 8, index // 8, 'ab_'[index * 7 % 3])
+    _journal_round_trip(board, [k << 28 for k in range(1, 40)], hard_stop=False)
+
+    board = Board({'size': 8, 'seed': 3, 'grammar': load_grammar('sync_diffuse.txt'), 'storage': storage})
+    board.set_cell_type_by_name(1, 1, 'x')
+    _journal_round_trip(board, [k << 30 for k in range(1, 20)], hard_stop=False)
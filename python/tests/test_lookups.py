@@ -122,3 +122,28 @@ def test_clock_anti_inverse():
             cw = char_perm_lookup['rotate']['clock'][c]
             back = char_perm_lookup['rotate']['anti'][cw]
             assert back == c
+
+
+def test_dense_tables_match_dicts():
+    from sokoscript.lookups import char_perm_array, char_vec_array, vec_char_array, all_chars, FIRST_CHAR
+    for op in ('vecAdd', 'vecSub', 'intAdd', 'intSub'):
+        for i, right in enumerate(all_chars):
+            for j, left in enumerate(all_chars):
+                assert chr(char_perm_array[op][i, j] + FIRST_CHAR) == char_perm_lookup[op][right][left]
+    for group in ('matMul', 'rotate'):
+        for name, table in char_perm_lookup[group].items():
+            assert [chr(k + FIRST_CHAR) for k in char_perm_array[group][name]] == [table[c] for c in all_chars]
+    for i, c in enumerate(all_chars):
+        v = char_vec_lookup[c]
+        assert tuple(char_vec_array[i]) == (v if v[0] == v[0] else (-128, -128))
+    assert [chr(k + FIRST_CHAR) for k in vec_char_array] == [vec2char((x, y)) for y in range(-4, 5) for x in range(-4, 5)]
+    assert vec_char_array.shape == (81,) and char_perm_array['vecAdd'].shape == (94, 94)
+
+
+def test_vec_tables():
+    from sokoscript.lookups import vec_add_lookup, vec_char_lookup, all_chars
+    assert len(vec_char_lookup) == 81
+    for v, c in vec_char_lookup.items():
+        assert c == vec2char(v)
+        for offset in all_chars:
+            assert vec_add_lookup[offset][v] is char_vec_lookup[char_perm_lookup['vecAdd'][offset][c]]
@@ -224,3 +224,24 @@ def test_error_cases():
     _test_parse('a : b, command={x} command={y}', error=re.compile(r'Duplicate attribute'))
     _test_parse('a = a.', error=re.compile(r'inherits from itself'), suppress_location=True)
     _test_parse('a = b. b = a.', error=re.compile(r'inherits from itself'), suppress_location=True)
+
+
+def test_simple_rule_fast_path_matches_full_parser(monkeypatch):
+    import os
+    from sokoscript.parser import Parser, SyntaxError
+    from tests.conftest import GRAMMARS_DIR, load_grammar
+
+    def parse_all(text):
+        try:
+            return Parser(text).parse()
+        except SyntaxError as e:
+            return (e.msg, e.line, e.column)
+
+    grammars = [load_grammar(f) for f in sorted(os.listdir(GRAMMARS_DIR)) if f.endswith('.txt')] + [
+        'a b >N> c/?x : $3/y~1 _ b~0, rate=1. key={w} score=-2.',
+        'a : b, rate=1234.', 'a : b, rate=.5', 'a/xy : b, rate=1 sync=1.', 'a _ : $2 $1 b.',
+        'a : b, command=go sound=x1 caption=Hi.', 'a : b/c[d].', 'a :b~01.', 'a\nb : b a\nc : d.',
+    ]
+    fast = [parse_all(g) for g in grammars]
+    monkeypatch.setattr(Parser, '_try_simple_rule', lambda self: None)
+    assert fast == [parse_all(g) for g in grammars]
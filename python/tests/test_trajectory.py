@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from sokoscript.trajectory import TrajectoryReader, TrajectoryWriter, grammar_rules, record_episodes
+from tests.conftest import load_grammar
+
+try:
+    import gymnasium  # noqa: F401
+    HAS_GYM = True
+except ImportError:
+    HAS_GYM = False
+
+
+def test_writer_reader_round_trip(tmp_path):
+    from sokoscript.board import Board
+    board = Board({'size': 4, 'grammar': load_grammar('forest_fire.txt')})
+    rules = grammar_rules(board.grammar)
+    rng = np.random.default_rng(0)
+    frames = []
+    with TrajectoryWriter(tmp_path, board.grammar, 4, shard_size=7) as writer:
+        for episode in range(3):
+            for step in range(5 + episode):
+                types = rng.integers(0, 8, (4, 4))
+                fires = [(rules[step % len(rules)], step)] * (step % 3)
+                writer.add(types, step % 4, float(step), fires)
+                frames.append((episode, types, step % 4, float(step), step % 3))
+            types = rng.integers(0, 8, (4, 4))
+            writer.end_episode(types)
+            frames.append((episode, types, -1, 0.0, 0))
+
+    reader = TrajectoryReader(tmp_path)
+    assert len(reader) == len(frames) == 21
+    assert len(reader.meta['shards']) == 3 and len(reader.rules) == len(rules)
+    batches = list(reader.batches(10))
+    assert [len(b['action']) for b in batches] == [10, 10, 1]
+    rows = {name: np.concatenate([b[name] for b in batches]) for name in ('types', 'action', 'reward', 'episode')}
+    fires = [f for b in batches for f in b['fires']]
+    for n, (episode, types, action, reward, n_fires) in enumerate(frames):
+        assert rows['episode'][n] == episode and np.array_equal(rows['types'][n], types)
+        assert rows['action'][n] == action and rows['reward'][n] == reward
+        assert fires[n].shape == (n_fires, 2)
+    assert [len(e['action']) for e in reader.episodes()] == [6, 7, 8]
+    assert len(list(reader.transitions())) == 5 + 6 + 7
+
+
+def test_writer_copies_frames(tmp_path):
+    from sokoscript.board import Board
+    grammar = Board({'size': 4, 'grammar': load_grammar('forest_fire.txt')}).grammar
+    frame = np.zeros((4, 4), dtype=np.uint8)  # e.g. a view of a live board
+    with TrajectoryWriter(tmp_path, grammar, 4) as writer:
+        writer.add(frame)
+        frame[0, 0] = 3
+        writer.end_episode(frame)
+    types = next(TrajectoryReader(tmp_path).batches(2))['types']
+    assert types[0, 0, 0] == 0 and types[1, 0, 0] == 3
+
+
+@pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
+def test_record_episodes(tmp_path):
+    from sokoscript.env import SokoScriptEnv
+
+    def init_fn(board):
+        board.set_cell_type_by_name(4, 4, 'fireman', '', {'id': 'p1'})
+        for x in range(8):
+            board.set_cell_type_by_name(x, 2, 'tree')
+        board.set_cell_type_by_name(3, 2, 'fire')
+
+    env = SokoScriptEnv(load_grammar('forest_fire.txt'), board_size=8, max_steps=20,
+                        board_init_fn=init_fn, dt=1.0)
+    reader = record_episodes(env, tmp_path, 2, seed=3, shard_size=16)
+    assert len(reader) == 2 * 21
+    n_fires = 0
+    for episode in reader.episodes():
+        assert episode['action'][-1] == -1 and (episode['action'][:-1] >= 0).all()
+        for fires in episode['fires']:
+            for rule_id, cell in fires:
+                assert 0 <= rule_id < len(reader.rules) and 0 <= cell < 64
+            n_fires += len(fires)
+    assert n_fires > 0
@@ -0,0 +1,127 @@
+"""Tests for the vectorized environment."""
+
+import pytest
+import numpy as np
+
+try:
+    import gymnasium
+    HAS_GYM = True
+except ImportError:
+    HAS_GYM = False
+
+from tests.conftest import load_grammar
+
+
+def _init_fn(board):
+    board.set_cell_type_by_name(4, 4, 'fireman', '', {'id': 'p1'})
+    for x in range(8):
+        board.set_cell_type_by_name(x, 2, 'tree')
+    board.set_cell_type_by_name(3, 2, 'fire')
+
+
+def _env_kwargs(**kwargs):
+    return {'grammar': load_grammar('forest_fire.txt'), 'board_size': 8, 'board_init_fn': _init_fn,
+            'max_steps': 7, 'time_penalty': 0.01, **kwargs}
+
+
+@pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
+@pytest.mark.parametrize('observation_mode', ['onehot', 'types'])
+def test_vec_env_matches_independent_envs(observation_mode):
+    from sokoscript.env import SokoScriptEnv
+    from sokoscript.vec_env import SokoScriptVecEnv
+    n = 3
+    vec_env = SokoScriptVecEnv(n, seed=10, **_env_kwargs(observation_mode=observation_mode))
+    envs = [SokoScriptEnv(seed=10 + i, **_env_kwargs(observation_mode=observation_mode)) for i in range(n)]
+
+    obs, _ = vec_env.reset()
+    assert obs.shape == (n, *vec_env.observation_space.shape)
+    expected = [env.reset()[0] for env in envs]
+    np.testing.assert_array_equal(obs, np.stack(expected))
+    assert vec_env.envs[0].board.grammar is vec_env.envs[1].board.grammar
+
+    resets = 0
+    for step in range(20):
+        actions = np.array([(step + i) % vec_env.action_space.n for i in range(n)])
+        obs, rewards, terminated, truncated, infos = vec_env.step(actions)
+        for i, env in enumerate(envs):
+            env_obs, reward, term, trunc, _ = env.step(int(actions[i]))
+            assert rewards[i] == np.float32(reward)
+            assert (terminated[i], truncated[i]) == (term, trunc)
+            if term or trunc:
+                np.testing.assert_array_equal(infos[i]['terminal_observation'], env_obs)
+                env_obs, _ = env.reset()
+                resets += 1
+            np.testing.assert_array_equal(obs[i], env_obs)
+    assert resets >= n
+
+
+@pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
+def test_vec_env_shared_buffer():
+    from sokoscript.env import SokoScriptEnv
+    from sokoscript.vec_env import SokoScriptVecEnv
+    vec_env = SokoScriptVecEnv.from_envs([SokoScriptEnv(seed=i, **_env_kwargs()) for i in range(2)],
+                                         copy_obs=False)
+    obs, _ = vec_env.reset()
+    next_obs, *_ = vec_env.step([0, 1])
+    assert next_obs is obs
+    with pytest.raises(ValueError):
+        SokoScriptVecEnv.from_envs([SokoScriptEnv(**_env_kwargs()), SokoScriptEnv(**_env_kwargs(board_size=16))])
+
+
+def _failing_env():
+    raise RuntimeError("bad env")
+
+
+@pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
+@pytest.mark.filterwarnings("ignore:os.fork:RuntimeWarning")  # other tests may have imported jax
+def test_shared_memory_vec_env_matches_in_process():
+    import functools
+    from sokoscript.env import SokoScriptEnv
+    from sokoscript.vec_env import SharedMemoryVecEnv, SokoScriptVecEnv
+    n = 3
+    env_fns = [functools.partial(SokoScriptEnv, seed=10 + i, **_env_kwargs()) for i in range(n)]
+    vec_env = SharedMemoryVecEnv(env_fns, n_workers=2)
+    expected = SokoScriptVecEnv(n, seed=10, **_env_kwargs())
+    try:
+        obs, _ = vec_env.reset()
+        np.testing.assert_array_equal(obs, expected.reset()[0])
+        for step in range(20):
+            actions = np.array([(step + i) % vec_env.action_space.n for i in range(n)])
+            obs, rewards, terminated, truncated, infos = vec_env.step(actions)
+            exp_obs, exp_rewards, exp_terminated, exp_truncated, exp_infos = expected.step(actions)
+            np.testing.assert_array_equal(obs, exp_obs)
+            np.testing.assert_array_equal(rewards, exp_rewards)
+            np.testing.assert_array_equal(terminated, exp_terminated)
+            np.testing.assert_array_equal(truncated, exp_truncated)
+            for info, exp_info in zip(infos, exp_infos):
+                assert info['score'] == exp_info['score']
+                if 'terminal_observation' in exp_info:
+                    np.testing.assert_array_equal(info['terminal_observation'], exp_info['terminal_observation'])
+                else:
+                    assert 'terminal_observation' not in info
+        assert vec_env.get_attr('max_steps') == [7] * n
+    finally:
+        vec_env.close()
+    with pytest.raises(RuntimeError):
+        vec_env.step(np.zeros(n, dtype=int))
+    with pytest.raises(RuntimeError):
+        SharedMemoryVecEnv([functools.partial(SokoScriptEnv, **_env_kwargs()), _failing_env], n_workers=2)
+
+
+
+@pytest.mark.skipif(not HAS_GYM, reason="gymnasium not installed")
+@pytest.mark.filterwarnings("ignore:os.fork:RuntimeWarning")
+def test_shared_memory_vec_env_fails_on_killed_worker():
+    import functools
+    import os
+    import signal
+    from sokoscript.env import SokoScriptEnv
+    from sokoscript.vec_env import SharedMemoryVecEnv
+    env_fns = [functools.partial(SokoScriptEnv, seed=i, **_env_kwargs()) for i in range(2)]
+    vec_env = SharedMemoryVecEnv(env_fns, n_workers=2, timeout=60)
+    vec_env.reset()
+    os.kill(vec_env._processes[1].pid, signal.SIGKILL)
+    vec_env._processes[1].join()
+    with pytest.raises(RuntimeError, match="worker failed"):
+        vec_env.step(np.zeros(2, dtype=int))
+    assert vec_env.closed